@@ -0,0 +1,119 @@
+"""
+Author: Trần Tuấn Anh
+Created at: 2026-10-19
+Updated at: 2026-10-19
+Description: Dynamic micro-batcher for query embeddings in the UrbanReflex
+             RAG system. Groups queries from concurrent chat requests into
+             a single embedding call.
+"""
+
+import asyncio
+import time
+from concurrent.futures import Executor
+from typing import Callable, List, Optional, Tuple
+from app.config.config import QUERY_EMBED_MAX_BATCH, QUERY_EMBED_MAX_WAIT_MS
+
+
+class QueryEmbeddingBatcher:
+    """
+    Collects queries arriving within max_wait_ms, up to max_batch_size, and
+    embeds them in one blocking call.
+
+    Batches run one at a time; queries arriving while a batch is embedding
+    form the next batch, so batches grow with load while an idle request
+    waits at most max_wait_ms before embedding starts.
+    """
+
+    def __init__(self, embed_fn: Callable[[List[str]], List[List[float]]], executor: Optional[Executor] = None,
+                 max_batch_size: int = QUERY_EMBED_MAX_BATCH, max_wait_ms: float = QUERY_EMBED_MAX_WAIT_MS):
+        """
+        Initialize batcher.
+
+        Args:
+            embed_fn: Blocking function embedding a list of texts
+            executor: Executor for embed_fn (defaults to the loop's)
+            max_batch_size: Maximum queries per embedding call
+            max_wait_ms: Longest time the first query waits for company
+        """
+        self.embed_fn = embed_fn
+        self.executor = executor
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+        self.batches = 0
+        self.queries = 0
+
+    async def embed(self, text: str) -> List[float]:
+        """
+        Embed one query as part of the next batch.
+
+        Args:
+            text: Query text
+
+        Returns:
+            Embedding vector
+        """
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+
+    async def _collect(self) -> List[Tuple[str, asyncio.Future]]:
+        """Wait for a first query, then gather more until full or timed out."""
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            # Take whatever is already queued without waiting
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            remaining = deadline - time.monotonic()
+            if len(batch) >= self.max_batch_size or remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+
+        return [(text, future) for text, future in batch if not future.cancelled()]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            if not batch:
+                continue
+
+            # Identical queries in a batch are embedded once
+            texts = list(dict.fromkeys(text for text, _ in batch))
+            try:
+                vectors = await loop.run_in_executor(self.executor, self.embed_fn, texts)
+                by_text = dict(zip(texts, vectors))
+                if len(by_text) != len(texts):
+                    raise RuntimeError(f"Expected {len(texts)} embeddings, got {len(vectors)}")
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.queries += len(batch)
+            for text, future in batch:
+                if not future.done():
+                    future.set_result(by_text[text])
+
+    async def close(self):
+        """Stop the batching task."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
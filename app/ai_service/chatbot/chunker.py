@@ -0,0 +1,152 @@
+"""
+Author: Trần Tuấn Anh
+Created at: 2026-10-19
+Updated at: 2026-10-19
+Description: Sentence-aware text chunker for the UrbanReflex RAG system.
+             Splits page content on heading and sentence boundaries into
+             overlapping chunks of a target token size, lazily.
+"""
+
+import re
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Any
+from app.ai_service.chatbot.tokenizer import count_tokens
+from app.ai_service.chatbot.manifest import make_chunk_id
+from app.config.config import CHUNK_TARGET_TOKENS, CHUNK_OVERLAP_TOKENS
+
+# Sentence ends: terminal punctuation followed by whitespace
+_SENTENCE_END = re.compile(r'(?<=[.!?…:;])\s+')
+
+
+def _split_units(text: str) -> Iterator[Tuple[str, bool]]:
+    """
+    Split content into sentences.
+
+    Args:
+        text: Content with '\\n' between blocks and '\\n\\n' before headings
+
+    Yields:
+        Tuples of (sentence, starts_section)
+    """
+    for section in text.split('\n\n'):
+        starts_section = True
+        for line in section.split('\n'):
+            for sentence in _SENTENCE_END.split(line):
+                sentence = sentence.strip()
+                if sentence:
+                    yield sentence, starts_section
+                    starts_section = False
+
+
+def _split_long(sentence: str, max_tokens: int, counter: Callable[[str], int]) -> Iterator[str]:
+    """Split a sentence longer than max_tokens on word boundaries."""
+    words = sentence.split()
+    piece: List[str] = []
+    piece_tokens = 0
+    for word in words:
+        word_tokens = counter(word)
+        if piece and piece_tokens + word_tokens > max_tokens:
+            yield ' '.join(piece)
+            piece, piece_tokens = [], 0
+        piece.append(word)
+        piece_tokens += word_tokens
+    if piece:
+        yield ' '.join(piece)
+
+
+def iter_chunks(text: str, target_tokens: int = CHUNK_TARGET_TOKENS,
+                overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+                counter: Optional[Callable[[str], int]] = None) -> Iterator[str]:
+    """
+    Lazily split text into chunks of about target_tokens.
+
+    Chunks end on sentence boundaries and start a fresh chunk at headings.
+    Consecutive chunks within a section share up to overlap_tokens of
+    trailing sentences.
+
+    Args:
+        text: Content to split
+        target_tokens: Target chunk size in tokens
+        overlap_tokens: Tokens repeated from the previous chunk
+        counter: Token counting function (defaults to count_tokens)
+
+    Yields:
+        Chunk text
+    """
+    counter = counter or count_tokens
+    buffer: List[Tuple[str, int]] = []
+    buffer_tokens = 0
+    fresh = 0  # Sentences in the buffer not already emitted
+
+    def overlap_tail() -> List[Tuple[str, int]]:
+        tail: List[Tuple[str, int]] = []
+        total = 0
+        for sentence, tokens in reversed(buffer):
+            if total + tokens > overlap_tokens:
+                break
+            tail.insert(0, (sentence, tokens))
+            total += tokens
+        return tail
+
+    for sentence, starts_section in _split_units(text):
+        tokens = counter(sentence)
+        pieces = [(sentence, tokens)] if tokens <= target_tokens else [
+            (piece, counter(piece)) for piece in _split_long(sentence, target_tokens, counter)
+        ]
+
+        for index, (piece, piece_tokens) in enumerate(pieces):
+            section_break = starts_section and index == 0 and buffer_tokens >= target_tokens // 4
+            if fresh and (section_break or buffer_tokens + piece_tokens > target_tokens):
+                yield ' '.join(s for s, _ in buffer)
+                buffer = [] if section_break else overlap_tail()
+                buffer_tokens = sum(t for _, t in buffer)
+                fresh = 0
+                # Drop overlap that would push the next chunk over target
+                while buffer and buffer_tokens + piece_tokens > target_tokens:
+                    buffer_tokens -= buffer.pop(0)[1]
+
+            buffer.append((piece, piece_tokens))
+            buffer_tokens += piece_tokens
+            fresh += 1
+
+    if fresh:
+        yield ' '.join(s for s, _ in buffer)
+
+
+def chunk_page(page_data: Dict, target_tokens: int = CHUNK_TARGET_TOKENS,
+               overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> List[Dict[str, Any]]:
+    """
+    Split a crawled page into documents with content-addressed IDs.
+
+    Args:
+        page_data: Crawled page data from crawler
+        target_tokens: Target chunk size in tokens
+        overlap_tokens: Tokens repeated between consecutive chunks
+
+    Returns:
+        List of documents ready for embedding
+    """
+    url = page_data.get('url', '')
+
+    # Create metadata with URL, title, and description
+    metadata = {
+        'url': url,
+        'title': page_data.get('title', ''),
+        'description': page_data.get('description', ''),
+        'crawled_at': page_data.get('crawled_at', time.time()),
+        'source': 'web_crawl'
+    }
+
+    chunks = list(iter_chunks(page_data['content'], target_tokens, overlap_tokens))
+    documents = []
+    for i, chunk in enumerate(chunks):
+        chunk_metadata = metadata.copy()
+        chunk_metadata['chunk_index'] = i
+        chunk_metadata['total_chunks'] = len(chunks)
+
+        documents.append({
+            'id': make_chunk_id(url, chunk),
+            'content': chunk,
+            'metadata': chunk_metadata
+        })
+    return documents
@@ -0,0 +1,195 @@
+"""
+Author: Trần Tuấn Anh
+Created at: 2026-10-19
+Updated at: 2026-10-19
+Description: Token-budgeted context packing for UrbanReflex RAG prompts.
+             Merges overlapping chunks from the same page and fills the prompt
+             budget in relevance order, trimming chat history first.
+"""
+
+from typing import List, Dict, Any, Callable, Optional
+from app.ai_service.chatbot.tokenizer import count_tokens, truncate_to_tokens
+from app.config.config import RAG_PROMPT_TOKEN_BUDGET
+
+# Minimum tokens worth spending on a truncated document
+MIN_DOCUMENT_TOKENS = 50
+
+# Longest overlap searched for when joining adjacent chunks
+MAX_OVERLAP_CHARS = 1000
+
+
+def _join_overlapping(first: str, second: str) -> str:
+    """
+    Join two adjacent chunks, removing text repeated at the boundary.
+
+    Args:
+        first: Earlier chunk
+        second: Following chunk
+
+    Returns:
+        Joined text
+    """
+    max_overlap = min(len(first), len(second), MAX_OVERLAP_CHARS)
+    for size in range(max_overlap, 0, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return f"{first} {second}"
+
+
+def merge_chunks(context_docs: List[Dict]) -> List[Dict]:
+    """
+    Dedupe and merge retrieved chunks into per-page blocks.
+
+    Chunks from the same URL with consecutive chunk_index values are merged
+    into one block; exact duplicates are dropped. Blocks are ordered by the
+    best relevance score among their chunks.
+
+    Args:
+        context_docs: Documents returned by vector search
+
+    Returns:
+        List of blocks with 'title', 'url', 'text' and 'score'
+    """
+    groups: Dict[str, List[Dict]] = {}
+    for i, doc in enumerate(context_docs):
+        metadata = doc.get('metadata', {})
+        key = metadata.get('url') or doc.get('id') or f"doc_{i}"
+        groups.setdefault(key, []).append(doc)
+
+    blocks = []
+    for docs in groups.values():
+        docs.sort(key=lambda d: d.get('metadata', {}).get('chunk_index', 0))
+
+        seen_texts = set()
+        current = None
+        last_index = None
+        for doc in docs:
+            text = doc.get('text', '')
+            if not text or text in seen_texts:
+                continue
+            seen_texts.add(text)
+
+            metadata = doc.get('metadata', {})
+            chunk_index = metadata.get('chunk_index')
+            score = doc.get('score') or 0
+
+            adjacent = (
+                current is not None
+                and chunk_index is not None
+                and last_index is not None
+                and chunk_index - last_index <= 1
+            )
+            if adjacent:
+                current['text'] = _join_overlapping(current['text'], text)
+                current['score'] = max(current['score'], score)
+            else:
+                current = {
+                    'title': metadata.get('title', 'Không có tiêu đề'),
+                    'url': metadata.get('url', ''),
+                    'text': text,
+                    'score': score
+                }
+                blocks.append(current)
+            last_index = chunk_index
+
+    blocks.sort(key=lambda b: b['score'], reverse=True)
+    return blocks
+
+
+def format_block(position: int, block: Dict) -> str:
+    """Format a merged block for the prompt."""
+    return (
+        f"Document {position} (Relevance: {block['score']:.2f}):\n"
+        f"Title: {block['title']}\n"
+        f"URL: {block['url']}\n"
+        f"Content: {block['text']}"
+    )
+
+
+class ContextPacker:
+    """
+    Packs retrieved context and chat history into a token budget.
+    """
+
+    def __init__(self, token_budget: int = RAG_PROMPT_TOKEN_BUDGET, tokenizer: Optional[Callable[[str], int]] = None):
+        """
+        Initialize the packer.
+
+        Args:
+            token_budget: Total prompt budget including the fixed template
+            tokenizer: Token counting function (defaults to count_tokens)
+        """
+        self.token_budget = token_budget
+        self.count_tokens = tokenizer or count_tokens
+
+    def pack(self, context_docs: List[Dict], history_lines: List[str], reserved_text: str = "",
+             summary: str = "") -> Dict[str, Any]:
+        """
+        Select context and history that fit the budget.
+
+        History is trimmed oldest-first before any context is dropped, then
+        context blocks are added in relevance order until the budget is used.
+        The conversation summary is kept ahead of the history and dropped
+        only after every raw turn.
+
+        Args:
+            context_docs: Documents returned by vector search
+            history_lines: Formatted chat history, oldest first
+            reserved_text: Fixed prompt text (system prompt, question, template)
+            summary: Rolling summary of older turns
+
+        Returns:
+            Dictionary with 'context', 'history', 'documents_used' and 'prompt_tokens'
+        """
+        reserved_tokens = self.count_tokens(reserved_text)
+        available = max(self.token_budget - reserved_tokens, 0)
+
+        blocks = merge_chunks(context_docs)
+        block_tokens = [self.count_tokens(format_block(i, b)) for i, b in enumerate(blocks, 1)]
+        if summary:
+            history_lines = [f"Summary of earlier conversation: {summary}"] + list(history_lines)
+        line_tokens = [self.count_tokens(line) for line in history_lines]
+
+        # Trim history first, oldest turns go first, the summary goes last
+        pinned = 1 if summary else 0
+        history_start = pinned
+        history_tokens = sum(line_tokens)
+        while history_start < len(history_lines) and history_tokens + sum(block_tokens) > available:
+            history_tokens -= line_tokens[history_start]
+            history_start += 1
+        history = history_lines[history_start:]
+        if pinned:
+            if history_tokens + sum(block_tokens) > available:
+                history_tokens -= line_tokens[0]
+            else:
+                history = history_lines[:1] + history
+
+        # Fill remaining budget with context in relevance order
+        remaining = available - history_tokens
+        context_tokens = 0
+        entries = []
+        for block, tokens in zip(blocks, block_tokens):
+            position = len(entries) + 1
+            if tokens <= remaining:
+                entries.append(format_block(position, block))
+                remaining -= tokens
+                context_tokens += tokens
+                continue
+
+            if remaining < MIN_DOCUMENT_TOKENS:
+                break
+
+            header_tokens = self.count_tokens(format_block(position, {**block, 'text': ''}))
+            text = truncate_to_tokens(block['text'], remaining - header_tokens, self.count_tokens)
+            if text:
+                entry = format_block(position, {**block, 'text': text})
+                entries.append(entry)
+                context_tokens += self.count_tokens(entry)
+            break
+
+        return {
+            'context': '\n\n'.join(entries) if entries else "No relevant documentation found.",
+            'history': '\n'.join(history),
+            'documents_used': len(entries),
+            'prompt_tokens': reserved_tokens + history_tokens + context_tokens
+        }
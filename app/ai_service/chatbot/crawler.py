@@ -1,50 +1,103 @@
 """
 Author: Trần Tuấn Anh
 Created at: 2025-11-28
-Updated at: 2025-11-30
+Updated at: 2026-10-19
 Description: Web crawler module for collecting data from UrbanReflex website.
              Extracts text content, metadata, and prepares data for embedding.
 """
 
 import asyncio
 import aiohttp
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
-from typing import List, Dict, Set
+import multiprocessing
+import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urljoin, urlparse, urldefrag
+from urllib.robotparser import RobotFileParser
+from typing import List, Dict, Set, Optional, AsyncIterator, Callable, Awaitable
 import time
 import os
 import json
-from app.config.config import WEBSITE_CRAWL_URL
+from app.config.config import (
+    WEBSITE_CRAWL_URL,
+    CRAWLER_CONCURRENCY,
+    CRAWLER_RATE_PER_HOST,
+    CRAWLER_BURST,
+    CRAWLER_PARSER,
+    CRAWLER_PARSE_WORKERS,
+)
+from app.utils.rate_limit import TokenBucket
+from app.ai_service.chatbot.html_extract import extract_page, resolve_backend
+
+USER_AGENT = 'UrbanReflex-Bot/1.0'
 
 
 class WebCrawler:
     """
     Web crawler for collecting documentation and content from UrbanReflex website.
-    Supports async crawling with rate limiting and content extraction.
+    Crawls concurrently with per-host rate limiting, seeds from sitemap.xml
+    and honours robots.txt.
     """
     
-    def __init__(self, base_url: str = WEBSITE_CRAWL_URL):
+    def __init__(self, base_url: str = WEBSITE_CRAWL_URL, validators: Optional[Dict[str, Dict]] = None,
+                 concurrency: int = CRAWLER_CONCURRENCY, rate_per_host: float = CRAWLER_RATE_PER_HOST,
+                 burst: int = CRAWLER_BURST, keep_pages: bool = True):
+        """
+        Initialize crawler.
+        
+        Args:
+            base_url: Base URL to crawl
+            validators: Per-URL ETag/Last-Modified/links from a previous crawl,
+                        used to send conditional GETs
+            concurrency: Number of concurrent fetch workers
+            rate_per_host: Maximum requests per second to a single host
+            burst: Requests allowed in a burst per host
+            keep_pages: Whether to keep crawled pages in crawled_data;
+                        disable when consuming iter_site on large crawls
+        """
         self.base_url = base_url
         self.visited_urls: Set[str] = set()
         self.crawled_data: List[Dict] = []
+        self.keep_pages = keep_pages
         self.session = None
-        self.rate_limit_delay = 1.0  # seconds between requests
+        self.concurrency = max(1, concurrency)
+        self.rate_per_host = rate_per_host
+        self.burst = burst
+        self.host_buckets: Dict[str, TokenBucket] = {}
+        self.robots: Optional[RobotFileParser] = None
+        self.parser_backend = resolve_backend(CRAWLER_PARSER)
+        self.parse_executor: Optional[ProcessPoolExecutor] = None
+        self.validators = validators or {}
+        self.gone_urls: Set[str] = set()  # URLs that returned 404/410
+        self.failed_urls: Set[str] = set()  # Timeouts, errors and other non-200 responses
+        self.disallowed_urls: Set[str] = set()  # Skipped because of robots.txt
+        self.frontier_exhausted = False  # True when every reachable page was visited
         
     async def __aenter__(self):
         """Async context manager entry."""
-        connector = aiohttp.TCPConnector(limit=10, limit_per_host=5)
+        connector = aiohttp.TCPConnector(limit=self.concurrency * 2, limit_per_host=self.concurrency)
         timeout = aiohttp.ClientTimeout(total=30)
         self.session = aiohttp.ClientSession(
             connector=connector,
             timeout=timeout,
-            headers={'User-Agent': 'UrbanReflex-Bot/1.0'}
+            headers={'User-Agent': USER_AGENT}
         )
+        # Without worker processes, parsing runs in the default thread pool.
+        # Workers are spawned, not forked: forking this multithreaded process
+        # can copy locks held by other threads and deadlock the children.
+        if CRAWLER_PARSE_WORKERS > 0:
+            self.parse_executor = ProcessPoolExecutor(
+                max_workers=CRAWLER_PARSE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
         return self
         
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         """Async context manager exit."""
         if self.session:
             await self.session.close()
+        if self.parse_executor:
+            self.parse_executor.shutdown(wait=False, cancel_futures=True)
     
     def _is_valid_url(self, url: str) -> bool:
         """Check if URL is valid and should be crawled."""
@@ -66,75 +119,121 @@ class WebCrawler:
         
         return not should_skip or should_include
     
-    def _normalize_url(self, url: str) -> str:
-        """Normalize URL to absolute form."""
+    def _normalize_url(self, url: str, page_url: str = None) -> str:
+        """Normalize URL to absolute form without fragment."""
         if url.startswith('/'):
-            return urljoin(self.base_url, url)
+            url = urljoin(self.base_url, url)
         elif not url.startswith('http'):
-            return urljoin(self.base_url, url)
-        return url
+            url = urljoin(page_url or self.base_url, url)
+        return urldefrag(url)[0]
     
-    def _extract_content(self, soup: BeautifulSoup, url: str) -> Dict:
-        """Extract relevant content from HTML page."""
-        # Remove script and style elements
-        for element in soup(['script', 'style', 'nav', 'footer', 'header']):
-            element.decompose()
-        
-        # Extract title
-        title = soup.find('title')
-        title_text = title.get_text().strip() if title else ''
-        
-        # Extract main content with priority for help/documentation
-        content_selectors = [
-            'main', 'article', '.content', '.documentation',
-            '.docs', '#content', '.main-content', '.help-content',
-            '.guide', '.tutorial', '.about-section'
-        ]
-        
-        main_content = None
-        for selector in content_selectors:
-            main_content = soup.select_one(selector)
-            if main_content:
-                break
+    def _host_bucket(self, url: str) -> TokenBucket:
+        """Get the rate limiter for the URL's host."""
+        host = urlparse(url).netloc
+        bucket = self.host_buckets.get(host)
+        if bucket is None:
+            bucket = TokenBucket(rate=self.rate_per_host, capacity=self.burst)
+            self.host_buckets[host] = bucket
+        return bucket
+    
+    async def _fetch_text(self, url: str) -> Optional[str]:
+        """Fetch a helper resource (robots.txt, sitemap) as text."""
+        try:
+            await self._host_bucket(url).acquire()
+            async with self.session.get(url) as response:
+                if response.status != 200:
+                    return None
+                return await response.text()
+        except Exception as e:
+            print(f"Could not fetch {url}: {str(e)}")
+            return None
+    
+    async def _load_robots(self):
+        """Load robots.txt and apply its Crawl-delay to the host rate."""
+        robots_url = urljoin(self.base_url, '/robots.txt')
+        self.robots = RobotFileParser(robots_url)
+        text = await self._fetch_text(robots_url)
+        self.robots.parse(text.splitlines() if text else [])
         
-        if not main_content:
-            main_content = soup.find('body')
+        crawl_delay = self.robots.crawl_delay(USER_AGENT)
+        if crawl_delay:
+            self.rate_per_host = min(self.rate_per_host, 1.0 / float(crawl_delay))
+            self.burst = 1
+            self.host_buckets.clear()
+            print(f"Honouring robots.txt Crawl-delay of {crawl_delay}s")
+    
+    def _is_allowed(self, url: str) -> bool:
+        """Check robots.txt rules for a URL."""
+        return self.robots is None or self.robots.can_fetch(USER_AGENT, url)
+    
+    async def _load_sitemap_urls(self, limit: int) -> List[str]:
+        """
+        Collect page URLs from sitemap.xml (and nested sitemap indexes).
         
-        # Also extract navigation and help links
-        nav_links = []
-        for nav in soup.find_all(['nav', 'menu', '.navigation']):
-            for link in nav.find_all('a', href=True):
-                href = link['href']
-                if self._is_valid_url(href):
-                    nav_links.append(self._normalize_url(href))
+        Args:
+            limit: Maximum number of URLs to collect
+            
+        Returns:
+            List of crawlable page URLs
+        """
+        sitemaps = deque((self.robots.site_maps() if self.robots else None) or [urljoin(self.base_url, '/sitemap.xml')])
+        seen_sitemaps = set()
+        urls = []
         
-        # Extract text and clean it
-        if main_content:
-            text_content = main_content.get_text(separator=' ', strip=True)
-            # Clean up whitespace
-            text_content = ' '.join(text_content.split())
-        else:
-            text_content = ''
+        while sitemaps and len(urls) < limit:
+            sitemap_url = sitemaps.popleft()
+            if sitemap_url in seen_sitemaps:
+                continue
+            seen_sitemaps.add(sitemap_url)
+            
+            text = await self._fetch_text(sitemap_url)
+            if not text:
+                continue
+            try:
+                root = ET.fromstring(text.encode('utf-8'))
+            except ET.ParseError as e:
+                print(f"Invalid sitemap {sitemap_url}: {str(e)}")
+                continue
+            
+            is_index = root.tag.endswith('sitemapindex')
+            for loc in root.iter():
+                if not loc.tag.endswith('loc') or not loc.text:
+                    continue
+                location = loc.text.strip()
+                if is_index:
+                    sitemaps.append(location)
+                elif self._is_valid_url(location):
+                    urls.append(self._normalize_url(location))
+                    if len(urls) >= limit:
+                        break
         
-        # Extract metadata
-        meta_description = soup.find('meta', attrs={'name': 'description'})
-        description = meta_description.get('content', '') if meta_description else ''
+        return urls
+    
+    def _build_content(self, parsed: Dict, url: str) -> Dict:
+        """
+        Build the crawled page record from extracted HTML data.
         
-        # Extract links for further crawling
+        Args:
+            parsed: Output of html_extract.extract_page
+            url: Page URL
+            
+        Returns:
+            Crawled page dictionary
+        """
+        # Keep links for further crawling, including navigation and help links
         links = []
-        for link in soup.find_all('a', href=True):
-            href = link['href']
+        for href in parsed['links']:
             if self._is_valid_url(href):
-                links.append(self._normalize_url(href))
+                links.append(self._normalize_url(href, url))
         
         return {
             'url': url,
-            'title': title_text,
-            'description': description,
-            'content': text_content,
-            'links': links + nav_links,  # Include navigation links
+            'title': parsed['title'],
+            'description': parsed['description'],
+            'content': parsed['content'],
+            'links': links,
             'crawled_at': time.time(),
-            'content_type': self._classify_content_type(title_text, text_content)
+            'content_type': self._classify_content_type(parsed['title'], parsed['content'])
         }
     
     def _classify_content_type(self, title: str, content: str) -> str:
@@ -167,25 +266,66 @@ class WebCrawler:
         if url in self.visited_urls:
             return None
             
+        if not self._is_allowed(url):
+            self.disallowed_urls.add(url)
+            print(f"Disallowed by robots.txt: {url}")
+            return None
+            
         try:
-            await asyncio.sleep(self.rate_limit_delay)  # Rate limiting
+            await self._host_bucket(url).acquire()  # Per-host rate limiting
             
-            async with self.session.get(url) as response:
+            # Conditional GET when we have validators from a previous crawl
+            headers = {}
+            validator = self.validators.get(url, {})
+            if validator.get('etag'):
+                headers['If-None-Match'] = validator['etag']
+            if validator.get('last_modified'):
+                headers['If-Modified-Since'] = validator['last_modified']
+            
+            async with self.session.get(url, headers=headers) as response:
+                if response.status == 304:
+                    # Unchanged since last crawl; reuse known links for discovery
+                    content = {
+                        'url': url,
+                        'not_modified': True,
+                        'links': validator.get('links', []),
+                        'etag': validator.get('etag'),
+                        'last_modified': validator.get('last_modified'),
+                        'crawled_at': time.time()
+                    }
+                    self.visited_urls.add(url)
+                    if self.keep_pages:
+                        self.crawled_data.append(content)
+                    print(f"Not modified: {url}")
+                    return content
+                
+                if response.status in (404, 410):
+                    self.gone_urls.add(url)
+                elif response.status != 200:
+                    self.failed_urls.add(url)
+                
                 if response.status != 200:
                     print(f"Failed to crawl {url}: HTTP {response.status}")
                     return None
                 
                 html = await response.text()
-                soup = BeautifulSoup(html, 'html.parser')
-                
-                content = self._extract_content(soup, url)
-                self.visited_urls.add(url)
+            
+            # Parse off the event loop so other fetches keep going
+            loop = asyncio.get_running_loop()
+            parsed = await loop.run_in_executor(self.parse_executor, extract_page, html, self.parser_backend)
+            
+            content = self._build_content(parsed, url)
+            content['etag'] = response.headers.get('ETag')
+            content['last_modified'] = response.headers.get('Last-Modified')
+            self.visited_urls.add(url)
+            if self.keep_pages:
                 self.crawled_data.append(content)
-                
-                print(f"Crawled: {url} ({len(content['content'])} chars)")
-                return content
+            
+            print(f"Crawled: {url} ({len(content['content'])} chars)")
+            return content
                 
         except Exception as e:
+            self.failed_urls.add(url)
             print(f"Error crawling {url}: {str(e)}")
             return None
     
@@ -199,31 +339,113 @@ class WebCrawler:
         Returns:
             List of dictionaries containing crawled content
         """
+        await self._crawl(max_pages)
+        return self.crawled_data
+    
+    async def iter_site(self, max_pages: int = 50, buffer_size: int = None) -> AsyncIterator[Dict]:
+        """
+        Crawl the website and yield pages as soon as they are crawled.
+        
+        A bounded buffer applies backpressure, so a slow consumer pauses
+        the crawl instead of letting pages pile up in memory.
+        
+        Args:
+            max_pages: Maximum number of pages to crawl
+            buffer_size: Pages buffered ahead of the consumer
+            
+        Yields:
+            Crawled page dictionaries
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size or self.concurrency * 2)
+        done = object()
+        errors = []
+        
+        async def run():
+            try:
+                await self._crawl(max_pages, on_page=queue.put)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                errors.append(e)
+            await queue.put(done)
+        
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                page = await queue.get()
+                if page is done:
+                    break
+                yield page
+            if errors:
+                raise errors[0]
+        finally:
+            if not task.done():
+                task.cancel()
+    
+    async def _crawl(self, max_pages: int, on_page: Optional[Callable[[Dict], Awaitable[None]]] = None):
+        """
+        Run the crawl workers.
+        
+        The frontier is seeded from sitemap.xml and the base URL, then
+        expanded breadth-first by `concurrency` workers.
+        
+        Args:
+            max_pages: Maximum number of pages to crawl
+            on_page: Optional coroutine called with each crawled page
+        """
         if not self.base_url:
             raise ValueError("Base URL is required")
         
         print(f"Starting crawl of {self.base_url}")
+        start_time = time.time()
         
-        # Start with the base URL
-        urls_to_crawl = [self.base_url]
-        crawled_count = 0
+        await self._load_robots()
+        seeds = [self._normalize_url(self.base_url)] + await self._load_sitemap_urls(max_pages)
         
-        while urls_to_crawl and crawled_count < max_pages:
-            current_url = urls_to_crawl.pop(0)
-            
-            if current_url in self.visited_urls:
-                continue
-            
-            content = await self.crawl_page(current_url)
-            if content:
-                crawled_count += 1
-                # Add new URLs to crawl
-                for link in content['links']:
-                    if link not in self.visited_urls and link not in urls_to_crawl:
-                        urls_to_crawl.append(link)
+        frontier = deque()
+        seen: Set[str] = set()
+        for url in seeds:
+            if url not in seen:
+                seen.add(url)
+                frontier.append(url)
         
-        print(f"Crawling completed. Total pages: {len(self.crawled_data)}")
-        return self.crawled_data
+        condition = asyncio.Condition()
+        state = {'in_flight': 0, 'crawled': 0}
+        
+        async def worker():
+            while True:
+                async with condition:
+                    while True:
+                        done = state['crawled'] >= max_pages or (not frontier and state['in_flight'] == 0)
+                        if done:
+                            condition.notify_all()
+                            return
+                        if frontier and state['crawled'] + state['in_flight'] < max_pages:
+                            break
+                        # Wait for in-flight pages to add links or free a slot
+                        await condition.wait()
+                    url = frontier.popleft()
+                    state['in_flight'] += 1
+                
+                content = await self.crawl_page(url)
+                if content and on_page:
+                    await on_page(content)
+                
+                async with condition:
+                    state['in_flight'] -= 1
+                    if content:
+                        state['crawled'] += 1
+                        # Add new URLs to crawl
+                        for link in content['links']:
+                            if link not in seen:
+                                seen.add(link)
+                                frontier.append(link)
+                    condition.notify_all()
+        
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        
+        self.frontier_exhausted = not frontier
+        print(f"Crawling completed. Total pages: {state['crawled']} in {time.time() - start_time:.1f}s")
     
     def save_to_file(self, filename: str = 'crawled_data.json'):
         """Save crawled data to JSON file."""
@@ -1,7 +1,7 @@
 """
 Author: Trần Tuấn Anh
 Created at: 2025-11-28
-Updated at: 2025-12-02
+Updated at: 2026-10-19
 Description: Embedding module for UrbanReflex RAG system.
              Uses EmbedAnything library with Pinecone vector database.
 """
@@ -9,14 +9,30 @@ Description: Embedding module for UrbanReflex RAG system.
 import os
 import asyncio
 import tempfile
-from typing import List, Dict, Optional, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Any, Iterable, AsyncIterable, AsyncIterator, Union
 import embed_anything
 from embed_anything import EmbeddingModel, WhichModel, TextEmbedConfig
 from pinecone import Pinecone, ServerlessSpec
-from app.config.config import PINECONE_API_KEY, PINECONE_INDEX_NAME
+from app.config.config import PINECONE_API_KEY, PINECONE_INDEX_NAME, EMBED_BATCH_SIZE, UPSERT_CONCURRENCY, INDEX_MAX_MISSED_RUNS
+from app.ai_service.chatbot.manifest import IndexManifest, content_hash
+from app.ai_service.chatbot.chunker import chunk_page
+from app.ai_service.chatbot.pipeline import EmbeddingPipeline
+from app.ai_service.chatbot.pinecone_adapter import PineconeAdapter
+from app.ai_service.chatbot.batcher import QueryEmbeddingBatcher
 import time
 
 
+async def _aiter(items: Union[Iterable[Dict], AsyncIterable[Dict]]) -> AsyncIterator[Dict]:
+    """Iterate a list or an async stream uniformly."""
+    if hasattr(items, '__aiter__'):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
 class EmbeddingManager:
     """
     Manages text embeddings and vector database operations for RAG system.
@@ -39,12 +55,39 @@ class EmbeddingManager:
         
         self.pinecone_client = None
         self.embedding_model = None
-        self.embed_config = TextEmbedConfig(chunk_size=512, batch_size=8)  # Smaller batch size for stability
+        self.upserter = None
+        self.embed_config = TextEmbedConfig(chunk_size=512, batch_size=EMBED_BATCH_SIZE)  # Initial batch size, tuned by the pipeline
+        # Dedicated thread so indexing embeds don't queue behind query searches
+        self.embed_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed")
+        # Indexing work (chunking, upserts, deletes) gets its own threads so it
+        # never queues ahead of chat searches in the default executor
+        self.index_executor = ThreadPoolExecutor(max_workers=UPSERT_CONCURRENCY + 1, thread_name_prefix="index")
+        # Concurrent chat queries are embedded together in micro-batches
+        self.query_batcher = QueryEmbeddingBatcher(
+            self._embed_queries_sync,
+            executor=ThreadPoolExecutor(max_workers=1, thread_name_prefix="query-embed")
+        )
         
     async def initialize(self, recreate_index: bool = False):
         """
         Initialize Pinecone connection and embedding model.
         
+        Model loading and Pinecone calls block, so they run in the default
+        executor and the event loop keeps serving while this completes.
+        
+        Args:
+            recreate_index: Whether to recreate index if it exists
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._initialize_sync, recreate_index)
+        if recreate_index:
+            # The new index is empty; a stale manifest would skip every page
+            await IndexManifest(self.index_name).clear()
+    
+    def _initialize_sync(self, recreate_index: bool):
+        """
+        Blocking implementation of initialize.
+        
         Args:
             recreate_index: Whether to recreate index if it exists
         """
@@ -73,6 +116,15 @@ class EmbeddingManager:
             else:
                 print(f"Index {self.index_name} already exists")
             
+            # Shared upserter so its adaptive rate carries across indexing runs
+            self.upserter = PineconeAdapter(
+                self.api_key,
+                self.index_name,
+                client=self.pinecone_client,
+                index=self.pinecone_client.Index(self.index_name),
+                executor=self.index_executor
+            )
+            
             # Initialize embedding model for text
             try:
                 # Use sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2 model (stable multilingual)
@@ -117,7 +169,7 @@ class EmbeddingManager:
                     
                 doc = {
                     'id': text_data.get('id', f"doc_{i}_{int(time.time())}"),
-                    'text': text_data['content'],
+                    'content': text_data['content'],
                     'metadata': text_data.get('metadata', {})
                 }
                 documents.append(doc)
@@ -126,39 +178,12 @@ class EmbeddingManager:
                 print("No valid documents to embed")
                 return False
             
-            # Embed documents using EmbedAnything
             print(f"Embedding {len(documents)} documents...")
+            stats = await self.embed_stream(_aiter(documents))
             
-            # Get the Pinecone index
-            index = self.pinecone_client.Index(self.index_name)
-            
-            # Embed texts in batches
-            batch_size = self.embed_config.batch_size
-            for i in range(0, len(documents), batch_size):
-                batch = documents[i:i+batch_size]
-                texts_to_embed = [doc['text'] for doc in batch]
-                
-                # Embed the batch
-                embeddings = embed_anything.embed_query(
-                    texts_to_embed,
-                    embedder=self.embedding_model
-                )
-                
-                # Prepare vectors for upsert
-                vectors = []
-                for j, embedding_data in enumerate(embeddings):
-                    doc = batch[j]
-                    vectors.append({
-                        'id': doc['id'],
-                        'values': embedding_data.embedding,
-                        'metadata': {
-                            'text': doc['text'],
-                            **doc['metadata']
-                        }
-                    })
-                
-                # Upsert to Pinecone
-                index.upsert(vectors=vectors)
+            if stats['failed_ids']:
+                print(f"Failed to embed {len(stats['failed_ids'])} of {len(documents)} documents")
+                return False
             
             print(f"Successfully embedded {len(documents)} documents")
             return True
@@ -167,13 +192,39 @@ class EmbeddingManager:
             print(f"Error embedding texts: {str(e)}")
             return False
     
-    async def search_similar(self, query: str, top_k: int = 5) -> List[Dict]:
+    async def embed_stream(self, documents: AsyncIterable[Dict[str, Any]],
+                           progress: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Embed and upsert a stream of documents through the pipeline.
+        
+        Args:
+            documents: Async stream of dicts with 'id', 'content' and 'metadata'
+            progress: Optional dict updated in place with live statistics
+            
+        Returns:
+            Pipeline statistics, including 'failed_ids'
+        """
+        if not self.pinecone_client or not self.embedding_model:
+            raise RuntimeError("Embedding manager not initialized. Call initialize() first.")
+        
+        pipeline = EmbeddingPipeline(
+            self.embedding_model,
+            self.upserter,
+            executor=self.embed_executor,
+            batch_size=self.embed_config.batch_size
+        )
+        return await pipeline.run(documents, progress)
+    
+    async def search_similar(self, query: str, top_k: int = 5,
+                             timings: Optional[Dict[str, float]] = None) -> List[Dict]:
         """
         Search for similar documents based on query.
         
         Args:
             query: Search query text
             top_k: Number of top results to return
+            timings: Optional dict receiving 'query_embedding' and
+                'vector_search' durations in seconds
             
         Returns:
             List of similar documents with metadata
@@ -181,95 +232,257 @@ class EmbeddingManager:
         if not self.pinecone_client or not self.embedding_model:
             raise RuntimeError("Embedding manager not initialized. Call initialize() first.")
         
+        timings = timings if timings is not None else {}
         try:
-            # Embed query using correct API
-            query_embeddings = embed_anything.embed_query(
-                [query],
-                embedder=self.embedding_model
-            )
+            start = time.perf_counter()
+            query_vector = await self.query_batcher.embed(query)
+            timings['query_embedding'] = time.perf_counter() - start
             
-            if not query_embeddings:
-                return []
-            
-            # Get Pinecone index
-            index = self.pinecone_client.Index(self.index_name)
-            
-            # Search in Pinecone
-            results = index.query(
-                vector=query_embeddings[0].embedding,
-                top_k=top_k,
-                include_metadata=True
-            )
-            
-            # Format results
-            formatted_results = []
-            for match in results.get('matches', []):
-                formatted_results.append({
-                    'id': match.get('id'),
-                    'score': match.get('score'),
-                    'text': match.get('metadata', {}).get('text', ''),
-                    'metadata': match.get('metadata', {})
-                })
-            
-            return formatted_results
+            # The Pinecone query is a blocking call; run it in the default
+            # executor so concurrent stages keep making progress
+            loop = asyncio.get_running_loop()
+            start = time.perf_counter()
+            results = await loop.run_in_executor(None, self._query_index_sync, query_vector, top_k)
+            timings['vector_search'] = time.perf_counter() - start
+            return results
             
         except Exception as e:
             print(f"Error searching similar documents: {str(e)}")
             return []
     
-    async def process_crawled_data(self, crawled_data: List[Dict]) -> bool:
+    def _embed_queries_sync(self, queries: List[str]) -> List[List[float]]:
+        """
+        Embed a batch of queries (blocking).
+        
+        Args:
+            queries: Query texts
+            
+        Returns:
+            Embedding vectors in query order
+        """
+        query_embeddings = embed_anything.embed_query(
+            queries,
+            embedder=self.embedding_model
+        )
+        return [embedding_data.embedding for embedding_data in query_embeddings]
+    
+    def _query_index_sync(self, query_vector: List[float], top_k: int) -> List[Dict]:
+        """
+        Query Pinecone with an embedded query (blocking).
+        
+        Args:
+            query_vector: Query embedding
+            top_k: Number of top results to return
+            
+        Returns:
+            List of similar documents with metadata
+        """
+        # Get Pinecone index
+        index = self.pinecone_client.Index(self.index_name)
+        
+        # Search in Pinecone
+        results = index.query(
+            vector=query_vector,
+            top_k=top_k,
+            include_metadata=True
+        )
+        
+        # Format results
+        formatted_results = []
+        for match in results.get('matches', []):
+            formatted_results.append({
+                'id': match.get('id'),
+                'score': match.get('score'),
+                'text': match.get('metadata', {}).get('text', ''),
+                'metadata': match.get('metadata', {})
+            })
+        
+        return formatted_results
+    
+    async def process_crawled_data(self, crawled_data: Union[Iterable[Dict], AsyncIterable[Dict]]) -> bool:
         """
         Process crawled web data and embed it.
         
+        Pages are chunked lazily and streamed into the embedding pipeline,
+        so the input may be a stream of any length.
+        
         Args:
-            crawled_data: List of crawled page data from crawler
+            crawled_data: Crawled pages, as a list or an async stream
             
         Returns:
             True if successful, False otherwise
         """
-        if not crawled_data:
+        async def documents():
+            async for page_data in _aiter(crawled_data):
+                if page_data.get('content'):
+                    for doc in chunk_page(page_data):
+                        yield doc
+        
+        try:
+            stats = await self.embed_stream(documents())
+        except Exception as e:
+            print(f"Error processing crawled data: {str(e)}")
+            return False
+        
+        if not stats['documents']:
             print("No crawled data to process")
             return False
         
-        # Convert crawled data to embedding format
-        documents = []
-        for page_data in crawled_data:
-            if not page_data.get('content'):
+        return not stats['failed_ids']
+    
+    def delete_vectors(self, ids: List[str], batch_size: int = 1000):
+        """
+        Delete vectors from the Pinecone index.
+        
+        Args:
+            ids: Vector IDs to delete
+            batch_size: Number of IDs per delete request
+        """
+        if not ids:
+            return
+        
+        index = self.pinecone_client.Index(self.index_name)
+        for i in range(0, len(ids), batch_size):
+            index.delete(ids=ids[i:i+batch_size])
+    
+    def update_metadata(self, documents: List[Dict[str, Any]]):
+        """
+        Overwrite the metadata of existing vectors without re-embedding.
+        
+        Args:
+            documents: Chunk documents with 'id' and 'metadata'
+        """
+        if not documents:
+            return
+        
+        index = self.pinecone_client.Index(self.index_name)
+        for doc in documents:
+            index.update(id=doc['id'], set_metadata=doc['metadata'])
+    
+    async def sync_crawled_data(self, crawled_data: Union[Iterable[Dict], AsyncIterable[Dict]],
+                                manifest: IndexManifest, progress: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Incrementally apply a crawl to the index using the manifest.
+        
+        Unchanged pages are skipped and only new chunks of changed pages
+        are streamed into the embedding pipeline. Once the pipeline is done,
+        the chunks a changed page kept get their metadata (position, title,
+        crawl time) refreshed, stale chunks are deleted and the manifest
+        entry is saved; pages with failed chunks are retried on the next run.
+        
+        Args:
+            crawled_data: Crawled pages, as a list or an async stream
+            manifest: Loaded manifest for this index
+            progress: Optional dict updated in place with live page and
+                pipeline statistics
+            
+        Returns:
+            Page and chunk counts plus pipeline throughput statistics
+        """
+        loop = asyncio.get_running_loop()
+        stats = progress if progress is not None else {}
+        stats.update({
+            'pages_crawled': 0,
+            'pages_unchanged': 0,
+            'pages_updated': 0,
+            'chunks_embedded': 0,
+            'chunks_relabeled': 0,
+            'chunks_deleted': 0
+        })
+        changed_pages = []
+        
+        async def documents():
+            async for page_data in _aiter(crawled_data):
+                stats['pages_crawled'] += 1
+                url = page_data.get('url', '')
+                previous = manifest.get(url) or {}
+                
+                if page_data.get('not_modified') or not page_data.get('content'):
+                    stats['pages_unchanged'] += 1
+                    continue
+                
+                page_hash = content_hash(page_data['content'])
+                if previous.get('content_hash') == page_hash:
+                    stats['pages_unchanged'] += 1
+                    # Keep validators fresh so the next crawl can send conditional GETs
+                    await manifest.save_page(
+                        url, page_hash, previous.get('chunk_ids', []),
+                        etag=page_data.get('etag'),
+                        last_modified=page_data.get('last_modified'),
+                        links=page_data.get('links')
+                    )
+                    continue
+                
+                # Tokenizing is CPU-bound; keep it off the event loop
+                page_documents = await loop.run_in_executor(self.index_executor, chunk_page, page_data)
+                chunk_ids = [doc['id'] for doc in page_documents]
+                old_ids = set(previous.get('chunk_ids', []))
+                new_ids = [chunk_id for chunk_id in chunk_ids if chunk_id not in old_ids]
+                
+                changed_pages.append({
+                    'url': url,
+                    'content_hash': page_hash,
+                    'chunk_ids': chunk_ids,
+                    'new_ids': new_ids,
+                    # Unchanged chunks keep their vectors, but their metadata is from the old page
+                    'kept': [doc for doc in page_documents if doc['id'] in old_ids],
+                    'stale_ids': list(old_ids - set(chunk_ids)),
+                    'etag': page_data.get('etag'),
+                    'last_modified': page_data.get('last_modified'),
+                    'links': page_data.get('links')
+                })
+                
+                for doc in page_documents:
+                    if doc['id'] not in old_ids:
+                        yield doc
+        
+        pipeline_stats = await self.embed_stream(documents(), progress)
+        failed_ids = pipeline_stats['failed_ids']
+        
+        for page in changed_pages:
+            if failed_ids.intersection(page['new_ids']):
+                print(f"Failed to embed changed page {page['url']}, keeping previous vectors")
                 continue
             
-            # Create metadata with URL, title, and description
-            metadata = {
-                'url': page_data.get('url', ''),
-                'title': page_data.get('title', ''),
-                'description': page_data.get('description', ''),
-                'crawled_at': page_data.get('crawled_at', time.time()),
-                'source': 'web_crawl'
-            }
+            try:
+                await loop.run_in_executor(self.index_executor, self.update_metadata, page['kept'])
+            except Exception as e:
+                print(f"Failed to update chunk metadata of {page['url']}, retrying next run: {str(e)}")
+                continue
             
-            # Split content into chunks if too long
-            content = page_data['content']
-            if len(content) > 1000:
-                # Split into chunks of approximately 1000 characters
-                chunks = [content[i:i+1000] for i in range(0, len(content), 1000)]
-                for i, chunk in enumerate(chunks):
-                    chunk_metadata = metadata.copy()
-                    chunk_metadata['chunk_index'] = i
-                    chunk_metadata['total_chunks'] = len(chunks)
-                    
-                    documents.append({
-                        'id': f"{page_data.get('url', 'unknown')}_{i}",
-                        'content': chunk,
-                        'metadata': chunk_metadata
-                    })
-            else:
-                documents.append({
-                    'id': page_data.get('url', 'unknown'),
-                    'content': content,
-                    'metadata': metadata
-                })
+            await loop.run_in_executor(self.index_executor, self.delete_vectors, page['stale_ids'])
+            await manifest.save_page(
+                page['url'], page['content_hash'], page['chunk_ids'],
+                etag=page['etag'], last_modified=page['last_modified'], links=page['links']
+            )
+            stats['pages_updated'] += 1
+            stats['chunks_embedded'] += len(page['new_ids'])
+            stats['chunks_relabeled'] += len(page['kept'])
+            stats['chunks_deleted'] += len(page['stale_ids'])
         
-        # Embed documents
-        return await self.embed_texts(documents)
+        stats['documents_per_second'] = pipeline_stats['documents_per_second']
+        return stats
+    
+    async def remove_pages(self, manifest: IndexManifest, urls: List[str]) -> int:
+        """
+        Drop vectors and manifest entries for pages removed from the site.
+        
+        Args:
+            manifest: Loaded manifest for this index
+            urls: Removed page URLs
+            
+        Returns:
+            Number of vectors deleted
+        """
+        loop = asyncio.get_running_loop()
+        removed = [url for url in urls if manifest.get(url)]
+        deleted = 0
+        for url in removed:
+            stale_ids = manifest.get(url).get('chunk_ids', [])
+            await loop.run_in_executor(self.index_executor, self.delete_vectors, stale_ids)
+            deleted += len(stale_ids)
+        await manifest.remove_pages(removed)
+        return deleted
     
     async def get_stats(self) -> Dict[str, Any]:
         """
@@ -301,31 +514,57 @@ class EmbeddingManager:
 
 # Global embedding manager instance
 _embedding_manager = None
+_embedding_manager_lock = asyncio.Lock()
 
 
 async def get_embedding_manager() -> EmbeddingManager:
     """
     Get or create global embedding manager instance.
     
+    Concurrent first callers wait for a single initialization instead of
+    each loading the model.
+    
     Returns:
         EmbeddingManager instance
     """
     global _embedding_manager
     
     if _embedding_manager is None:
-        _embedding_manager = EmbeddingManager()
-        await _embedding_manager.initialize()
+        async with _embedding_manager_lock:
+            if _embedding_manager is None:
+                embedding_manager = EmbeddingManager()
+                await embedding_manager.initialize()
+                # Publish only once fully initialized
+                _embedding_manager = embedding_manager
     
     return _embedding_manager
 
 
-async def index_website_data(base_url: str, crawled_data: List[Dict] = None) -> bool:
+def current_embedding_manager() -> Optional[EmbeddingManager]:
+    """
+    Return the global embedding manager without creating it.
+    
+    Returns:
+        EmbeddingManager instance, or None if not initialized yet
+    """
+    return _embedding_manager
+
+
+async def index_website_data(base_url: str, crawled_data: List[Dict] = None, max_pages: int = 50,
+                             progress: Optional[Dict[str, Any]] = None) -> bool:
     """
     Index website data for RAG system.
     
+    When crawling, pages are fetched with conditional GETs, streamed
+    through the chunker and compared against the index manifest, so only
+    changed content is re-embedded and crawls are never held in memory.
+    
     Args:
         base_url: Base URL to crawl (if crawled_data is None)
         crawled_data: Pre-crawled data (if provided, skips crawling)
+        max_pages: Maximum number of pages to crawl
+        progress: Optional dict updated in place with live statistics; on
+            failure its 'error' key holds the reason
         
     Returns:
         True if successful, False otherwise
@@ -334,31 +573,58 @@ async def index_website_data(base_url: str, crawled_data: List[Dict] = None) ->
     logger = logging.getLogger(__name__)
     
     try:
-        from app.ai_service.chatbot.crawler import WebCrawler, crawl_website
+        from app.ai_service.chatbot.crawler import WebCrawler
         
         # Get embedding manager
         embedding_manager = await get_embedding_manager()
         
-        # If no crawled data provided, crawl the website
-        if crawled_data is None:
+        manifest = IndexManifest(embedding_manager.index_name)
+        await manifest.load()
+        
+        if crawled_data is not None:
+            stats = await embedding_manager.sync_crawled_data(crawled_data, manifest, progress)
+        else:
+            # Crawl the website and stream pages straight into indexing
             logger.info(f"Crawling website: {base_url}")
-            crawled_data = await crawl_website(base_url=base_url, max_pages=50)
+            async with WebCrawler(base_url, validators=manifest.validators(), keep_pages=False) as crawler:
+                stats = await embedding_manager.sync_crawled_data(
+                    crawler.iter_site(max_pages=max_pages), manifest, progress
+                )
             
-            if not crawled_data:
+            if not stats['pages_crawled']:
                 logger.error("No data crawled from website")
+                if progress is not None:
+                    progress['error'] = "No data crawled from website"
                 return False
+            
+            # Pages confirmed gone (404/410) are removed right away. A page the
+            # crawl did not reach is only removed after INDEX_MAX_MISSED_RUNS
+            # complete crawls in a row; a crawl with failed fetches does not
+            # count, since pages may only be linked from the failed ones.
+            removed_urls = list(crawler.gone_urls)
+            await manifest.mark_seen(list(crawler.visited_urls))
+            if crawler.frontier_exhausted and not crawler.failed_urls:
+                unseen = [
+                    url for url in manifest.pages
+                    if url not in crawler.visited_urls
+                    and url not in crawler.gone_urls
+                    and url not in crawler.disallowed_urls
+                ]
+                removed_urls.extend(await manifest.mark_missing(unseen, INDEX_MAX_MISSED_RUNS))
+            elif crawler.failed_urls:
+                logger.warning(f"{len(crawler.failed_urls)} pages failed to fetch; not counting unseen pages as removed")
+            stats['chunks_deleted'] += await embedding_manager.remove_pages(manifest, removed_urls)
         
-        # Process crawled data and embed it
-        logger.info(f"Processing {len(crawled_data)} crawled pages...")
-        success = await embedding_manager.process_crawled_data(crawled_data)
-        
-        if success:
-            logger.info(f"Successfully indexed {len(crawled_data)} pages from {base_url}")
-        else:
-            logger.error(f"Failed to index data from {base_url}")
-        
-        return success
+        logger.info(
+            f"Indexed {base_url}: {stats['pages_updated']} updated, "
+            f"{stats['pages_unchanged']} unchanged of {stats['pages_crawled']} pages "
+            f"({stats['chunks_embedded']} chunks embedded, {stats['chunks_relabeled']} relabeled, "
+            f"{stats['chunks_deleted']} deleted)"
+        )
+        return True
         
     except Exception as e:
         logger.error(f"Error indexing website data: {str(e)}")
-        return False
\ No newline at end of file
+        if progress is not None:
+            progress['error'] = str(e)
+        return False
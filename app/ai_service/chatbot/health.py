@@ -0,0 +1,263 @@
+"""
+Author: Trần Tuấn Anh
+Created at: 2026-10-19
+Updated at: 2026-10-19
+Description: Background health monitor for the UrbanReflex chatbot.
+             Probes Gemini, the embedding system, Pinecone and MongoDB on an
+             interval and caches the results for liveness/readiness checks.
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+import google.generativeai as genai
+from app.config.config import (
+    HEALTH_CHECK_INTERVAL,
+    HEALTH_PROBE_TIMEOUT,
+    HEALTH_MAX_AGE,
+    CHATBOT_WARMUP,
+    CHATBOT_WARMUP_RETRY_BASE,
+    CHATBOT_WARMUP_RETRY_MAX,
+    get_database,
+)
+
+
+class NotInitialized(RuntimeError):
+    """Raised by a probe whose component has not been created yet."""
+
+
+async def _probe_gemini():
+    """Fetch model metadata; costs no generation tokens."""
+    from app.ai_service.chatbot.rag import current_rag_system
+
+    rag_system = current_rag_system()
+    if rag_system is None:
+        raise NotInitialized("RAG system not initialized")
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, genai.get_model, rag_system.model.model_name)
+
+
+def _initialized_embedding_manager():
+    """Return the embedding manager, never triggering initialization."""
+    from app.ai_service.chatbot.embedding import current_embedding_manager
+
+    embedding_manager = current_embedding_manager()
+    if embedding_manager is None or embedding_manager.embedding_model is None:
+        raise NotInitialized("Embedding system not initialized")
+    return embedding_manager
+
+
+async def _probe_embedding():
+    """Check the embedding model is loaded."""
+    _initialized_embedding_manager()
+
+
+async def _probe_pinecone():
+    """Read index stats; no query embedding or search needed."""
+    embedding_manager = _initialized_embedding_manager()
+    index = embedding_manager.pinecone_client.Index(embedding_manager.index_name)
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, index.describe_index_stats)
+
+
+async def _probe_mongodb():
+    """Round-trip a ping command."""
+    db = get_database()
+    await db.command("ping")
+
+
+class HealthMonitor:
+    """
+    Periodically probes dependencies and caches their status.
+
+    Readers never trigger probes; they get the last result, which is marked
+    unhealthy once it is older than max_age. Probes never initialize
+    components themselves. Until the tracked startup task has succeeded,
+    the system reports not ready. Without a warm-up, components are created
+    by the first chat request, so uninitialized ones do not block readiness.
+    """
+
+    def __init__(self, interval: float = HEALTH_CHECK_INTERVAL, probe_timeout: float = HEALTH_PROBE_TIMEOUT,
+                 max_age: float = HEALTH_MAX_AGE, lazy_init: bool = not CHATBOT_WARMUP):
+        """
+        Initialize health monitor.
+
+        Args:
+            interval: Seconds between probe rounds
+            probe_timeout: Timeout for each probe
+            max_age: Seconds after which a cached result is considered stale
+            lazy_init: Count components that are not initialized yet as healthy
+        """
+        self.interval = interval
+        self.probe_timeout = probe_timeout
+        self.max_age = max_age
+        self.lazy_init = lazy_init
+        self.probes: Dict[str, Callable[[], Awaitable[None]]] = {
+            'gemini_api': _probe_gemini,
+            'embedding_system': _probe_embedding,
+            'pinecone_connection': _probe_pinecone,
+            'mongodb': _probe_mongodb
+        }
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self.startup_task: Optional[asyncio.Task] = None
+        self.startup_error: Optional[str] = None
+        self.startup_complete = False
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start the background probe loop (idempotent)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def track_startup(self, warmup: Callable[[], Awaitable[None]],
+                      retry_base: float = CHATBOT_WARMUP_RETRY_BASE,
+                      retry_max: float = CHATBOT_WARMUP_RETRY_MAX) -> asyncio.Task:
+        """
+        Run a warm-up in the background and hold readiness until it succeeds.
+
+        A failed warm-up is retried with exponential backoff until it
+        succeeds or the task is cancelled.
+
+        Args:
+            warmup: Coroutine function initializing the components
+            retry_base: Seconds before the first retry
+            retry_max: Maximum seconds between retries
+
+        Returns:
+            The warm-up task
+        """
+        self.startup_error = None
+        self.startup_complete = False
+        self.startup_task = asyncio.create_task(self._run_startup(warmup, retry_base, retry_max))
+        return self.startup_task
+
+    async def _run_startup(self, warmup: Callable[[], Awaitable[None]], retry_base: float, retry_max: float):
+        attempt = 0
+        while True:
+            try:
+                await warmup()
+                break
+            except Exception as e:
+                self.startup_error = str(e)
+                delay = min(retry_max, retry_base * 2 ** attempt)
+                attempt += 1
+                print(f"Warm-up attempt {attempt} failed, retrying in {delay:.0f}s: {str(e)}")
+                await asyncio.sleep(delay)
+        self.startup_error = None
+        self.startup_complete = True
+        # Report the new components right away instead of at the next round
+        await self.check_now()
+
+    def _startup_status(self) -> Optional[Dict[str, Any]]:
+        """Return the startup task as a component, if one is tracked."""
+        task = self.startup_task
+        if task is None:
+            return None
+        status = {'ok': False, 'error': None, 'latency_ms': None, 'checked_at': None}
+        if self.startup_complete:
+            status['ok'] = True
+        elif task.cancelled():
+            status['error'] = 'warm-up cancelled'
+        elif self.startup_error:
+            status['error'] = f"warm-up failed, retrying: {self.startup_error}"
+        else:
+            status['error'] = 'warming up'
+        return status
+
+    async def stop(self):
+        """Stop the background probe loop."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await self.check_now()
+            await asyncio.sleep(self.interval)
+
+    async def _probe(self, name: str, probe: Callable[[], Awaitable[None]]):
+        """Run one probe and record its result."""
+        start = time.perf_counter()
+        result = {'ok': False, 'error': None}
+        try:
+            await asyncio.wait_for(probe(), timeout=self.probe_timeout)
+            result['ok'] = True
+        except NotInitialized as e:
+            if self.lazy_init:
+                # Created on first use; nothing is wrong yet
+                result['ok'] = True
+                result['initialized'] = False
+            else:
+                result['error'] = str(e)
+        except asyncio.TimeoutError:
+            result['error'] = f"timed out after {self.probe_timeout:.1f}s"
+        except Exception as e:
+            result['error'] = str(e)
+        result['latency_ms'] = round((time.perf_counter() - start) * 1000, 1)
+        result['checked_at'] = time.time()
+        self.results[name] = result
+
+    async def check_now(self) -> Dict[str, Any]:
+        """
+        Probe all dependencies concurrently and refresh the cache.
+
+        Returns:
+            Fresh snapshot
+        """
+        await asyncio.gather(*(self._probe(name, probe) for name, probe in self.probes.items()))
+        return self.snapshot()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Return the cached status without probing.
+
+        Returns:
+            Dictionary with 'ready', 'components' and 'checked_at'
+        """
+        now = time.time()
+        components = {}
+        for name in self.probes:
+            result = self.results.get(name)
+            if result is None:
+                components[name] = {'ok': False, 'error': 'not checked yet', 'latency_ms': None, 'checked_at': None}
+                continue
+            component = dict(result)
+            if now - result['checked_at'] > self.max_age:
+                component['ok'] = False
+                component['error'] = component['error'] or 'stale result'
+            components[name] = component
+
+        checked = [c['checked_at'] for c in components.values() if c['checked_at'] is not None]
+        checked_at = min(checked) if len(checked) == len(components) else None
+
+        startup = self._startup_status()
+        if startup is not None:
+            components['startup'] = startup
+        return {
+            'ready': all(c['ok'] for c in components.values()),
+            'components': components,
+            'checked_at': checked_at
+        }
+
+
+# Global health monitor instance
+_health_monitor = None
+
+
+def get_health_monitor() -> HealthMonitor:
+    """
+    Get or create global health monitor instance.
+
+    Returns:
+        HealthMonitor instance
+    """
+    global _health_monitor
+
+    if _health_monitor is None:
+        _health_monitor = HealthMonitor()
+
+    return _health_monitor
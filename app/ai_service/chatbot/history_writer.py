@@ -0,0 +1,257 @@
+"""
+Author: Trần Tuấn Anh
+Created at: 2026-10-19
+Updated at: 2026-10-19
+Description: Write-behind persistence for UrbanReflex chat history.
+             Queues chat messages in process and flushes them to
+             chat_sessions in bulk writes off the request path.
+"""
+
+import asyncio
+import uuid
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from app.config.config import (
+    get_database,
+    CHAT_HISTORY_MAX_MESSAGES,
+    CHAT_WRITE_FLUSH_MS,
+    CHAT_WRITE_BATCH_MESSAGES,
+)
+
+# Flush attempts before a batch of messages is dropped
+MAX_FLUSH_ATTEMPTS = 3
+
+# Recent write IDs kept per session to recognise retried updates
+WRITE_ID_HISTORY = 16
+
+# MongoDB duplicate key error code
+DUPLICATE_KEY_ERROR = 11000
+
+
+class ChatHistoryWriter:
+    """
+    Buffers chat messages and writes them with one bulk_write per flush.
+
+    Flushes happen every flush_interval_ms, or sooner once max_batch
+    messages are pending, and on close(). Messages of the same session are
+    merged into a single update, tagged with a write ID so that a retried
+    update is applied at most once.
+    """
+
+    def __init__(self, flush_interval_ms: float = CHAT_WRITE_FLUSH_MS, max_batch: int = CHAT_WRITE_BATCH_MESSAGES,
+                 after_flush: Optional[Callable[[List[str]], Awaitable[None]]] = None):
+        """
+        Initialize writer.
+
+        Args:
+            flush_interval_ms: Longest time a message waits before being written
+            max_batch: Pending message count that triggers an early flush
+            after_flush: Coroutine called with the session IDs just written
+        """
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self.after_flush = after_flush
+
+        self._pending: List[Dict[str, Any]] = []
+        self._inflight: List[Dict[str, Any]] = []
+        self._pending_messages = 0
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self._closing = False
+
+    def enqueue(self, session_id: str, messages: List[Dict[str, Any]], timestamp: datetime):
+        """
+        Queue messages for a session without waiting for the write.
+
+        Args:
+            session_id: Session identifier
+            messages: Message documents, oldest first
+            timestamp: Session update time
+        """
+        self._pending.append({
+            'session_id': session_id, 'messages': messages, 'timestamp': timestamp, 'write_id': None, 'attempts': 0
+        })
+        self._pending_messages += len(messages)
+
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        if self._pending_messages >= self.max_batch:
+            self._wake.set()
+
+    def pending_for(self, session_id: str) -> List[Dict[str, Any]]:
+        """
+        Messages for a session that are queued but not yet written.
+
+        Args:
+            session_id: Session identifier
+
+        Returns:
+            Message documents, oldest first
+        """
+        return [
+            message
+            for entry in self._inflight + self._pending if entry['session_id'] == session_id
+            for message in entry['messages']
+        ]
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Write all pending messages in one bulk_write."""
+        async with self._lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, []
+
+            # One update per session, preserving message order. A retried
+            # update keeps its write ID and contents; newer messages of that
+            # session wait for the next flush so they are never written first.
+            retrying = {entry['session_id'] for entry in batch if entry['write_id']}
+            deferred: List[Dict[str, Any]] = []
+            fresh_ids: Dict[str, str] = {}
+            writes: Dict[str, Dict[str, Any]] = {}
+            for entry in batch:
+                if not entry['write_id']:
+                    if entry['session_id'] in retrying:
+                        deferred.append(entry)
+                        continue
+                    entry['write_id'] = fresh_ids.setdefault(entry['session_id'], uuid.uuid4().hex)
+                write = writes.setdefault(entry['write_id'], {
+                    'session_id': entry['session_id'], 'messages': [], 'timestamp': entry['timestamp'], 'entries': []
+                })
+                write['messages'].extend(entry['messages'])
+                write['timestamp'] = max(write['timestamp'], entry['timestamp'])
+                write['entries'].append(entry)
+
+            self._inflight = [entry for write in writes.values() for entry in write['entries']]
+            self._pending = deferred + self._pending
+            self._pending_messages = sum(len(entry['messages']) for entry in self._pending)
+
+            # The filter skips sessions that already recorded the write ID, so
+            # a retry of an update that was applied but reported as failed
+            # cannot append its messages twice. The update is a pipeline so
+            # message_count of sessions created before it was tracked starts
+            # from their stored messages.
+            operations = [
+                UpdateOne(
+                    {"session_id": write['session_id'], "write_ids": {"$ne": write_id}},
+                    [{"$set": {
+                        "user_id": {"$ifNull": ["$user_id", None]},  # Can be updated later if user authenticates
+                        "created_at": {"$ifNull": ["$created_at", write['timestamp']]},
+                        "updated_at": write['timestamp'],
+                        "message_count": {"$add": [
+                            {"$ifNull": ["$message_count", {"$size": {"$ifNull": ["$messages", []]}}]},
+                            len(write['messages'])
+                        ]},
+                        "messages": {"$slice": [
+                            # $literal keeps message text starting with '$' from being read as a field path
+                            {"$concatArrays": [{"$ifNull": ["$messages", []]}, {"$literal": write['messages']}]},
+                            -CHAT_HISTORY_MAX_MESSAGES
+                        ]},
+                        "write_ids": {"$slice": [
+                            {"$concatArrays": [{"$ifNull": ["$write_ids", []]}, [write_id]]},
+                            -WRITE_ID_HISTORY
+                        ]}
+                    }}],
+                    upsert=True
+                )
+                for write_id, write in writes.items()
+            ]
+
+            write_ids = list(writes)
+            failed: Set[str] = set()
+            try:
+                await get_database().chat_sessions.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                # Updates without an error were applied
+                failed = {write_ids[error['index']] for error in e.details.get('writeErrors', [])}
+                duplicates = [
+                    write_ids[error['index']] for error in e.details.get('writeErrors', [])
+                    if error.get('code') == DUPLICATE_KEY_ERROR
+                ]
+                if duplicates:
+                    # The upsert also hits a duplicate key when the session
+                    # already holds the write ID; those were applied earlier
+                    try:
+                        failed -= await self._applied(writes, duplicates)
+                    except Exception as check_error:
+                        print(f"Error checking chat session writes: {str(check_error)}")
+                if failed:
+                    print(f"Error flushing {len(failed)} of {len(operations)} chat sessions: {str(e)}")
+            except Exception as e:
+                # Outcome unknown; retrying is safe thanks to the write IDs
+                print(f"Error flushing {len(operations)} chat sessions: {str(e)}")
+                failed = set(write_ids)
+            finally:
+                self._inflight = []
+
+            if failed:
+                # Retry on the next flush, ahead of newer messages
+                retry = []
+                dropped = 0
+                for write_id in (write_id for write_id in write_ids if write_id in failed):
+                    entries = writes[write_id]['entries']
+                    if entries[0]['attempts'] + 1 < MAX_FLUSH_ATTEMPTS:
+                        for entry in entries:
+                            entry['attempts'] += 1
+                        retry.extend(entries)
+                    else:
+                        dropped += len(entries)
+                if dropped:
+                    print(f"Dropped {dropped} chat history writes after {MAX_FLUSH_ATTEMPTS} attempts")
+                self._pending = retry + self._pending
+                self._pending_messages += sum(len(entry['messages']) for entry in retry)
+
+            session_ids = list(dict.fromkeys(
+                writes[write_id]['session_id'] for write_id in write_ids if write_id not in failed
+            ))
+
+        if self.after_flush and session_ids:
+            try:
+                await self.after_flush(session_ids)
+            except Exception as e:
+                print(f"Error after flushing chat history: {str(e)}")
+
+    async def _applied(self, writes: Dict[str, Dict[str, Any]], write_ids: List[str]) -> Set[str]:
+        """
+        Find which updates are already recorded in their sessions.
+
+        Args:
+            writes: Updates of the current flush, keyed by write ID
+            write_ids: Write IDs to look up
+
+        Returns:
+            Write IDs found in their session's write_ids
+        """
+        cursor = get_database().chat_sessions.find(
+            {
+                "session_id": {"$in": list({writes[write_id]['session_id'] for write_id in write_ids})},
+                "write_ids": {"$in": write_ids}
+            },
+            {"_id": 0, "write_ids": 1}
+        )
+        applied = set()
+        async for session in cursor:
+            applied.update(session.get('write_ids', []))
+        return applied.intersection(write_ids)
+
+    async def close(self):
+        """Stop the flush loop and write everything still pending."""
+        # Let an in-progress flush finish rather than cancelling its write
+        self._closing = True
+        if self._task is not None:
+            self._wake.set()
+            await self._task
+            self._task = None
+        await self.flush()
@@ -0,0 +1,373 @@
+"""
+Author: Trần Tuấn Anh
+Created at: 2026-10-19
+Updated at: 2026-10-19
+Description: HTML extraction backends for the UrbanReflex web crawler.
+             Extracts title, meta description, main content and links in a
+             single traversal using selectolax, lxml or BeautifulSoup.
+             lxml is a project dependency, so CRAWLER_PARSER=auto uses it by
+             default; installing selectolax (pip install selectolax) makes
+             auto prefer it. html.parser is the last-resort fallback.
+"""
+
+from typing import Dict, List, Optional
+
+# Elements whose text is never part of the page content
+EXCLUDED_TAGS = frozenset(['script', 'style', 'nav', 'footer', 'header', 'noscript', 'template'])
+
+# Main content selectors in priority order: (kind, value)
+CONTENT_SELECTORS = [
+    ('tag', 'main'), ('tag', 'article'), ('class', 'content'), ('class', 'documentation'),
+    ('class', 'docs'), ('id', 'content'), ('class', 'main-content'), ('class', 'help-content'),
+    ('class', 'guide'), ('class', 'tutorial'), ('class', 'about-section')
+]
+
+PARSER_BACKENDS = ['selectolax', 'lxml', 'html.parser']
+
+# Elements that start a new line in the extracted content
+BLOCK_TAGS = frozenset([
+    'p', 'div', 'section', 'article', 'main', 'aside', 'blockquote', 'pre', 'li', 'ul', 'ol',
+    'dl', 'dt', 'dd', 'table', 'tr', 'form', 'figure', 'figcaption', 'br', 'hr'
+])
+HEADING_TAGS = frozenset(['h1', 'h2', 'h3', 'h4', 'h5', 'h6'])
+
+# Boundary markers used while assembling content text
+_BLOCK = object()
+_HEADING = object()
+
+
+def _match_selectors(tag: str, attributes: Dict[str, Optional[str]]) -> List[int]:
+    """
+    Return the positions of CONTENT_SELECTORS matched by an element.
+
+    Args:
+        tag: Element tag name
+        attributes: Element attributes
+
+    Returns:
+        List of selector positions
+    """
+    classes = set((attributes.get('class') or '').split())
+    element_id = attributes.get('id')
+
+    matches = []
+    for position, (kind, value) in enumerate(CONTENT_SELECTORS):
+        if kind == 'tag' and tag == value:
+            matches.append(position)
+        elif kind == 'class' and value in classes:
+            matches.append(position)
+        elif kind == 'id' and element_id == value:
+            matches.append(position)
+    return matches
+
+
+def _boundary(tag: str):
+    """Return the boundary marker an element starts, if any."""
+    if tag in HEADING_TAGS:
+        return _HEADING
+    if tag in BLOCK_TAGS:
+        return _BLOCK
+    return None
+
+
+def _assemble_text(parts: List) -> str:
+    """
+    Join text pieces and boundary markers into content text.
+
+    Inline text is joined with single spaces, blocks start a new line and
+    headings start a new paragraph, so the chunker can split on them.
+
+    Args:
+        parts: Text strings and _BLOCK/_HEADING markers in document order
+
+    Returns:
+        Content text
+    """
+    output = []
+    pending = None
+    for part in parts:
+        if part is _BLOCK or part is _HEADING:
+            if output and pending is not _HEADING:
+                pending = part
+            continue
+
+        text = ' '.join(part.split())
+        if not text:
+            continue
+        if output:
+            output.append('\n\n' if pending is _HEADING else '\n' if pending is _BLOCK else ' ')
+        output.append(text)
+        pending = None
+
+    return ''.join(output)
+
+
+def _empty_result() -> Dict:
+    return {'title': '', 'description': '', 'content': '', 'links': []}
+
+
+def _extract_selectolax(html: str) -> Dict:
+    """Extract page data with selectolax (lexbor)."""
+    from selectolax.lexbor import LexborHTMLParser
+
+    tree = LexborHTMLParser(html)
+    if tree.root is None:
+        return _empty_result()
+
+    title = ''
+    description = ''
+    links = []
+    candidates = {}
+    excluded = []
+
+    for node in tree.root.traverse():
+        tag = node.tag
+        if tag in EXCLUDED_TAGS:
+            excluded.append(node)
+        elif tag == 'title' and not title:
+            title = node.text(strip=True)
+        elif tag == 'meta' and not description:
+            attributes = node.attributes
+            if attributes.get('name') == 'description':
+                description = attributes.get('content') or ''
+        elif tag == 'a':
+            href = node.attributes.get('href')
+            if href:
+                links.append(href)
+
+        if tag in EXCLUDED_TAGS or tag.startswith('-'):
+            continue
+        for position in _match_selectors(tag, node.attributes):
+            candidates.setdefault(position, node)
+
+    # Candidates inside excluded elements are not considered, as with decompose()
+    excluded_ids = {node.mem_id for node in excluded}
+
+    def is_excluded(node) -> bool:
+        parent = node.parent
+        while parent is not None:
+            if parent.mem_id in excluded_ids:
+                return True
+            parent = parent.parent
+        return False
+
+    main_content = None
+    for position in sorted(candidates):
+        if not is_excluded(candidates[position]):
+            main_content = candidates[position]
+            break
+
+    for node in excluded:
+        node.decompose()
+
+    if main_content is None:
+        main_content = tree.body
+
+    parts = []
+    if main_content is not None:
+        for node in main_content.traverse(include_text=True):
+            if node.tag == '-text':
+                parts.append(node.text_content or '')
+            else:
+                marker = _boundary(node.tag)
+                if marker:
+                    parts.append(marker)
+
+    content = _assemble_text(parts)
+    return {'title': title, 'description': description, 'content': content, 'links': links}
+
+
+def _extract_lxml(html: str) -> Dict:
+    """Extract page data with lxml."""
+    from lxml import etree
+    import lxml.html
+
+    try:
+        root = lxml.html.document_fromstring(html)
+    except (etree.ParserError, ValueError):
+        return _empty_result()
+
+    title = ''
+    description = ''
+    links = []
+    candidates = {}
+    excluded = []
+    excluded_depth = 0
+
+    for event, element in etree.iterwalk(root, events=('start', 'end')):
+        tag = element.tag
+        if not isinstance(tag, str):
+            # Comments and processing instructions
+            if event == 'start':
+                excluded.append(element)
+            continue
+
+        if event == 'end':
+            if tag in EXCLUDED_TAGS:
+                excluded_depth -= 1
+            continue
+
+        if tag in EXCLUDED_TAGS:
+            excluded_depth += 1
+            excluded.append(element)
+        elif tag == 'title' and not title:
+            title = (element.text_content() or '').strip()
+        elif tag == 'meta' and not description:
+            if element.get('name') == 'description':
+                description = element.get('content') or ''
+        elif tag == 'a':
+            href = element.get('href')
+            if href:
+                links.append(href)
+
+        if excluded_depth == 0:
+            for position in _match_selectors(tag, element.attrib):
+                candidates.setdefault(position, element)
+
+    main_content = candidates[min(candidates)] if candidates else root.find('body')
+
+    for element in excluded:
+        if element.getparent() is not None:
+            element.drop_tree()
+
+    parts = []
+    if main_content is not None:
+        for event, element in etree.iterwalk(main_content, events=('start', 'end')):
+            if event == 'start':
+                marker = _boundary(element.tag)
+                if marker:
+                    parts.append(marker)
+                if element.text:
+                    parts.append(element.text)
+            elif element is not main_content and element.tail:
+                parts.append(element.tail)
+
+    content = _assemble_text(parts)
+    return {'title': title, 'description': description, 'content': content, 'links': links}
+
+
+def _extract_bs4(html: str) -> Dict:
+    """Extract page data with BeautifulSoup's built-in html.parser."""
+    from bs4 import BeautifulSoup, Tag, NavigableString
+
+    soup = BeautifulSoup(html, 'html.parser')
+
+    title = ''
+    description = ''
+    links = []
+    candidates = {}
+    excluded = []
+
+    for element in soup.descendants:
+        if not isinstance(element, Tag):
+            continue
+        tag = element.name
+        if tag in EXCLUDED_TAGS:
+            excluded.append(element)
+            continue
+        if tag == 'title' and not title:
+            title = element.get_text().strip()
+        elif tag == 'meta' and not description:
+            if element.get('name') == 'description':
+                description = element.get('content', '')
+        elif tag == 'a':
+            href = element.get('href')
+            if href:
+                links.append(href)
+
+        attributes = {
+            'class': ' '.join(element.get('class', [])),
+            'id': element.get('id')
+        }
+        for position in _match_selectors(tag, attributes):
+            candidates.setdefault(position, element)
+
+    excluded_set = set(map(id, excluded))
+    main_content = None
+    for position in sorted(candidates):
+        candidate = candidates[position]
+        if not any(id(parent) in excluded_set for parent in candidate.parents):
+            main_content = candidate
+            break
+
+    for element in excluded:
+        element.decompose()
+
+    if main_content is None:
+        main_content = soup.find('body')
+
+    parts = []
+    if main_content is not None:
+        for element in main_content.descendants:
+            if isinstance(element, Tag):
+                marker = _boundary(element.name)
+                if marker:
+                    parts.append(marker)
+            elif type(element) is NavigableString:
+                # Subclasses are comments, CDATA and doctypes
+                parts.append(str(element))
+
+    content = _assemble_text(parts)
+    return {'title': title, 'description': description, 'content': content, 'links': links}
+
+
+_EXTRACTORS = {
+    'selectolax': _extract_selectolax,
+    'lxml': _extract_lxml,
+    'html.parser': _extract_bs4
+}
+
+
+def available_backends() -> List[str]:
+    """
+    List parser backends that can be imported, fastest first.
+
+    Returns:
+        Backend names
+    """
+    backends = []
+    for backend, module in [('selectolax', 'selectolax.lexbor'), ('lxml', 'lxml.html'), ('html.parser', 'bs4')]:
+        try:
+            __import__(module)
+            backends.append(backend)
+        except ImportError:
+            continue
+    return backends
+
+
+def resolve_backend(backend: str = 'auto') -> str:
+    """
+    Resolve a configured backend name to an available backend.
+
+    Args:
+        backend: 'auto' or one of PARSER_BACKENDS
+
+    Returns:
+        Backend name
+    """
+    available = available_backends()
+    if backend != 'auto':
+        if backend not in _EXTRACTORS:
+            raise ValueError(f"Unknown parser backend: {backend}")
+        if backend in available:
+            return backend
+        print(f"Parser backend {backend} is not installed, falling back")
+    if not available:
+        raise RuntimeError("No HTML parser backend available")
+    return available[0]
+
+
+def extract_page(html: str, backend: str = 'html.parser') -> Dict:
+    """
+    Extract title, meta description, main content text and raw links.
+
+    Module-level so it can run in a process pool.
+
+    Args:
+        html: Page HTML
+        backend: Resolved backend name
+
+    Returns:
+        Dictionary with 'title', 'description', 'content' and 'links'
+    """
+    return _EXTRACTORS[backend](html)
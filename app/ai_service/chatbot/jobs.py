@@ -0,0 +1,235 @@
+"""
+Author: Trần Tuấn Anh
+Created at: 2026-10-19
+Updated at: 2026-10-19
+Description: Background indexing job registry for the UrbanReflex RAG system.
+             Tracks job state, live progress and per-stage throughput, allows
+             cancellation and runs at most one job per index.
+"""
+
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# Job states
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED_STATES = frozenset([COMPLETED, FAILED, CANCELLED])
+
+
+class JobConflictError(Exception):
+    """Raised when a job is already running for the same index."""
+
+    def __init__(self, job: 'IndexJob'):
+        super().__init__(f"Indexing job {job.id} is already {job.state} for index {job.index_name}")
+        self.job = job
+
+
+class IndexJob:
+    """State and live progress of one indexing run."""
+
+    def __init__(self, index_name: str, base_url: str, max_pages: int, recreate_index: bool = False):
+        """
+        Initialize job.
+
+        Args:
+            index_name: Vector index the job writes to
+            base_url: Base URL being crawled
+            max_pages: Maximum number of pages to crawl
+            recreate_index: Whether the job recreates the index before indexing
+        """
+        self.id = uuid.uuid4().hex
+        self.index_name = index_name
+        self.base_url = base_url
+        self.max_pages = max_pages
+        self.recreate_index = recreate_index
+        self.state = QUEUED
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # Updated in place by the crawler/pipeline while the job runs
+        self.progress: Dict[str, Any] = {}
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds the job has been running."""
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Serialize job status for the API.
+
+        Returns:
+            Dictionary with state, counts and per-stage rates
+        """
+        progress = self.progress
+        elapsed = self.elapsed
+
+        def rate(count: float, seconds: float) -> float:
+            return round(count / seconds, 2) if seconds > 0 else 0.0
+
+        return {
+            'job_id': self.id,
+            'index_name': self.index_name,
+            'base_url': self.base_url,
+            'max_pages': self.max_pages,
+            'recreate_index': self.recreate_index,
+            'state': self.state,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'elapsed_seconds': round(elapsed, 2),
+            'pages_crawled': progress.get('pages_crawled', 0),
+            'pages_updated': progress.get('pages_updated', 0),
+            'pages_unchanged': progress.get('pages_unchanged', 0),
+            'chunks_embedded': progress.get('embedded', 0),
+            'vectors_upserted': progress.get('upserted', 0),
+            'chunks_relabeled': progress.get('chunks_relabeled', 0),
+            'chunks_deleted': progress.get('chunks_deleted', 0),
+            'failed_chunks': len(progress.get('failed_ids', ())),
+            'upsert_retries': progress.get('upsert_retries', 0),
+            'batch_size': progress.get('batch_size'),
+            'rates': {
+                'pages_per_second': rate(progress.get('pages_crawled', 0), elapsed),
+                'chunks_embedded_per_second': rate(progress.get('embedded', 0), elapsed),
+                'vectors_upserted_per_second': rate(progress.get('upserted', 0), elapsed),
+                # Throughput while the embedding stage was busy
+                'embed_busy_per_second': rate(progress.get('embedded', 0), progress.get('embed_seconds', 0.0))
+            }
+        }
+
+
+class IndexJobRegistry:
+    """
+    In-process registry of indexing jobs.
+
+    Keeps the most recent finished jobs for status queries and allows only
+    one active job per index.
+    """
+
+    def __init__(self, max_finished: int = 50):
+        """
+        Initialize registry.
+
+        Args:
+            max_finished: Number of finished jobs kept for status queries
+        """
+        self.max_finished = max_finished
+        self.jobs: 'OrderedDict[str, IndexJob]' = OrderedDict()
+        self._active: Dict[str, IndexJob] = {}
+
+    def start(self, index_name: str, base_url: str, max_pages: int,
+              run: Callable[[IndexJob], Awaitable[bool]], recreate_index: bool = False) -> IndexJob:
+        """
+        Create a job and start it as a background task.
+
+        The conflict check and slot reservation happen synchronously, so any
+        destructive setup (such as recreating the index) belongs in `run`.
+
+        Args:
+            index_name: Vector index the job writes to
+            base_url: Base URL to crawl
+            max_pages: Maximum number of pages to crawl
+            run: Coroutine function performing the indexing; returns success
+            recreate_index: Whether `run` recreates the index first
+
+        Returns:
+            The new job
+
+        Raises:
+            JobConflictError: If a job is already active for the index
+        """
+        active = self._active.get(index_name)
+        if active is not None and active.state not in FINISHED_STATES:
+            raise JobConflictError(active)
+
+        job = IndexJob(index_name, base_url, max_pages, recreate_index)
+        self.jobs[job.id] = job
+        self._active[index_name] = job
+        job.task = asyncio.create_task(self._run(job, run))
+        self._prune()
+        return job
+
+    async def _run(self, job: IndexJob, run: Callable[[IndexJob], Awaitable[bool]]):
+        job.state = RUNNING
+        job.started_at = time.time()
+        try:
+            success = await run(job)
+            job.state = COMPLETED if success else FAILED
+            if not success:
+                job.error = job.progress.get('error') or "Indexing failed"
+        except asyncio.CancelledError:
+            job.state = CANCELLED
+        except Exception as e:
+            job.state = FAILED
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            if self._active.get(job.index_name) is job:
+                del self._active[job.index_name]
+
+    def _prune(self):
+        """Drop the oldest finished jobs beyond max_finished."""
+        finished = [job_id for job_id, job in self.jobs.items() if job.state in FINISHED_STATES]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[IndexJob]:
+        """Return a job by ID, if known."""
+        return self.jobs.get(job_id)
+
+    def list(self) -> List[IndexJob]:
+        """Return known jobs, newest first."""
+        return list(reversed(self.jobs.values()))
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Request cancellation of a running job.
+
+        Args:
+            job_id: Job ID
+
+        Returns:
+            True if cancellation was requested, False if the job is finished
+        """
+        job = self.jobs.get(job_id)
+        if job is None or job.state in FINISHED_STATES or job.task is None:
+            return False
+        return job.task.cancel()
+
+    async def cancel_all(self):
+        """Cancel all running jobs and wait for them to stop."""
+        tasks = [job.task for job in self.jobs.values() if job.task is not None and not job.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# Global job registry instance
+_job_registry = None
+
+
+def get_job_registry() -> IndexJobRegistry:
+    """
+    Get or create global job registry instance.
+
+    Returns:
+        IndexJobRegistry instance
+    """
+    global _job_registry
+
+    if _job_registry is None:
+        _job_registry = IndexJobRegistry()
+
+    return _job_registry
@@ -0,0 +1,198 @@
+"""
+Author: Trần Tuấn Anh
+Created at: 2026-10-19
+Updated at: 2026-10-19
+Description: Index manifest for incremental re-indexing of the website corpus.
+             Tracks per-URL content hashes, HTTP validators, vector IDs and
+             how many complete crawls in a row missed each page.
+"""
+
+import hashlib
+from datetime import datetime
+from typing import Dict, List, Optional, Any
+from pymongo import ASCENDING
+from app.config.config import get_database
+
+
+def content_hash(text: str) -> str:
+    """
+    Hash page or chunk content.
+
+    Args:
+        text: Content to hash
+
+    Returns:
+        Hex SHA-256 digest
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def make_chunk_id(url: str, text: str) -> str:
+    """
+    Build a stable, content-addressed vector ID.
+
+    The same chunk of the same page always maps to the same ID, across
+    processes and runs.
+
+    Args:
+        url: Source page URL
+        text: Chunk text
+
+    Returns:
+        Vector ID
+    """
+    digest = hashlib.sha256(f"{url}\n{text}".encode('utf-8')).hexdigest()
+    return f"chunk_{digest[:32]}"
+
+
+class IndexManifest:
+    """
+    MongoDB-backed manifest of indexed pages for one vector index.
+    """
+
+    collection_name = "index_manifest"
+
+    def __init__(self, index_name: str, db=None):
+        """
+        Initialize manifest.
+
+        Args:
+            index_name: Vector index the manifest describes
+            db: MongoDB database instance (defaults to app database)
+        """
+        self.index_name = index_name
+        self.db = db if db is not None else get_database()
+        self.collection = self.db[self.collection_name]
+        self.pages: Dict[str, Dict[str, Any]] = {}
+
+    async def load(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Load all manifest entries for the index.
+
+        Returns:
+            Mapping of URL to manifest entry
+        """
+        await self.collection.create_index(
+            [("index_name", ASCENDING), ("url", ASCENDING)],
+            unique=True,
+            name="index_name_url_unique"
+        )
+
+        self.pages = {}
+        cursor = self.collection.find({"index_name": self.index_name}, {"_id": 0})
+        async for entry in cursor:
+            self.pages[entry["url"]] = entry
+        return self.pages
+
+    def validators(self) -> Dict[str, Dict[str, Any]]:
+        """
+        HTTP validators for conditional GETs, keyed by URL.
+
+        Returns:
+            Mapping of URL to ETag, Last-Modified and known links
+        """
+        return {
+            url: {
+                'etag': entry.get('etag'),
+                'last_modified': entry.get('last_modified'),
+                'links': entry.get('links', [])
+            }
+            for url, entry in self.pages.items()
+        }
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        """Return the manifest entry for a URL, if any."""
+        return self.pages.get(url)
+
+    async def save_page(self, url: str, page_hash: str, chunk_ids: List[str],
+                        etag: Optional[str] = None, last_modified: Optional[str] = None,
+                        links: Optional[List[str]] = None):
+        """
+        Record the indexed state of a page.
+
+        Args:
+            url: Page URL
+            page_hash: Hash of the page content
+            chunk_ids: Vector IDs stored for the page
+            etag: ETag response header
+            last_modified: Last-Modified response header
+            links: Outgoing links, reused when the page is not modified
+        """
+        entry = {
+            "index_name": self.index_name,
+            "url": url,
+            "content_hash": page_hash,
+            "chunk_ids": chunk_ids,
+            "etag": etag,
+            "last_modified": last_modified,
+            "links": links or [],
+            "missed_runs": 0,
+            "updated_at": datetime.utcnow()
+        }
+        await self.collection.update_one(
+            {"index_name": self.index_name, "url": url},
+            {"$set": entry},
+            upsert=True
+        )
+        self.pages[url] = entry
+
+    async def remove_pages(self, urls: List[str]):
+        """
+        Remove pages from the manifest.
+
+        Args:
+            urls: Page URLs to remove
+        """
+        if not urls:
+            return
+        await self.collection.delete_many({"index_name": self.index_name, "url": {"$in": list(urls)}})
+        for url in urls:
+            self.pages.pop(url, None)
+
+    async def mark_seen(self, urls: List[str]):
+        """
+        Reset the miss count of pages a crawl reached.
+
+        Args:
+            urls: Page URLs the crawl fetched (including not-modified pages)
+        """
+        urls = [url for url in urls if self.pages.get(url, {}).get("missed_runs")]
+        if not urls:
+            return
+        await self.collection.update_many(
+            {"index_name": self.index_name, "url": {"$in": urls}},
+            {"$set": {"missed_runs": 0}}
+        )
+        for url in urls:
+            self.pages[url]["missed_runs"] = 0
+
+    async def mark_missing(self, urls: List[str], max_missed_runs: int) -> List[str]:
+        """
+        Count one more complete crawl that did not reach these pages.
+
+        Args:
+            urls: Indexed page URLs the crawl did not reach
+            max_missed_runs: Consecutive misses after which a page counts as removed
+
+        Returns:
+            URLs missed in at least max_missed_runs consecutive crawls
+        """
+        urls = [url for url in urls if url in self.pages]
+        if not urls:
+            return []
+        await self.collection.update_many(
+            {"index_name": self.index_name, "url": {"$in": urls}},
+            {"$inc": {"missed_runs": 1}}
+        )
+        removed = []
+        for url in urls:
+            entry = self.pages[url]
+            entry["missed_runs"] = entry.get("missed_runs", 0) + 1
+            if entry["missed_runs"] >= max_missed_runs:
+                removed.append(url)
+        return removed
+
+    async def clear(self):
+        """Remove every entry for the index, e.g. after the index was recreated."""
+        await self.collection.delete_many({"index_name": self.index_name})
+        self.pages = {}
@@ -1,17 +1,56 @@
 """
 Author: Trần Tuấn Anh
 Created at: 2025-11-30
-Updated at: 2025-12-02
+Updated at: 2026-10-19
 Description: Custom PineconeAdapter for EmbedAnything library
              Implements the Adapter interface for Pinecone vector database
 """
 
 import os
-from typing import List, Dict
+import time
+import random
+import asyncio
+from concurrent.futures import Executor
+from typing import List, Dict, Any, Optional
 from embed_anything.vectordb import Adapter
 from embed_anything._embed_anything import EmbedData
 import pinecone
 from pinecone import Pinecone, ServerlessSpec
+from app.ai_service.chatbot.manifest import IndexManifest, make_chunk_id
+from app.utils.rate_limit import AdaptiveTokenBucket
+from app.config.config import (
+    UPSERT_BATCH_SIZE,
+    UPSERT_CONCURRENCY,
+    UPSERT_RATE,
+    UPSERT_MAX_RATE,
+    UPSERT_MAX_RETRIES,
+)
+
+# Backoff between retries: base * 2^attempt, capped, with full jitter
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 30.0
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    """Extract an HTTP status code from a Pinecone/HTTP exception, if any."""
+    for attr in ('status', 'status_code', 'code'):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def _is_retryable(error: Exception) -> bool:
+    """Retry on throttling, server errors and connection failures."""
+    status = _status_code(error)
+    if status is None:
+        return isinstance(error, (ConnectionError, TimeoutError, OSError))
+    return status == 429 or status >= 500
+
+
+def _backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
 
 
 class PineconeAdapter(Adapter):
@@ -20,18 +59,37 @@ class PineconeAdapter(Adapter):
     Implements the Adapter interface for Pinecone vector database
     """
     
-    def __init__(self, api_key: str, index_name: str = "default"):
+    def __init__(self, api_key: str, index_name: str = "default", client: Pinecone = None, index=None,
+                 batch_size: int = UPSERT_BATCH_SIZE, max_parallel: int = UPSERT_CONCURRENCY,
+                 max_retries: int = UPSERT_MAX_RETRIES, executor: Optional[Executor] = None):
         """
         Initialize Pinecone adapter
         
         Args:
             api_key: Pinecone API key
             index_name: Name of the index to use
+            client: Existing Pinecone client to reuse
+            index: Existing index handle to reuse
+            batch_size: Vectors per upsert request
+            max_parallel: Maximum concurrent upsert requests
+            max_retries: Retries per batch on 429/5xx errors
+            executor: Executor for blocking upsert calls (defaults to the loop's)
         """
         super().__init__(api_key)
-        self.pc = Pinecone(api_key=api_key)
+        self.pc = client or Pinecone(api_key=api_key)
         self.index_name = index_name
-        self.index = None
+        self.index = index
+        self.batch_size = batch_size
+        self.max_parallel = max(1, max_parallel)
+        self.max_retries = max_retries
+        self.executor = executor
+        self.limiter = AdaptiveTokenBucket(
+            rate=UPSERT_RATE,
+            capacity=self.max_parallel,
+            min_rate=1.0,
+            max_rate=UPSERT_MAX_RATE
+        )
+        self._semaphore = None
     
     async def initialize(self):
         """
@@ -95,15 +153,16 @@ class PineconeAdapter(Adapter):
             List of dictionaries in Pinecone format
         """
         vectors = []
-        for i, embed_data in enumerate(embeddings):
-            vector_id = f"vec_{i}_{hash(embed_data.text) % 1000000}"
-            
+        for embed_data in embeddings:
             # Prepare metadata
             metadata = {
                 'text': embed_data.text,
-                **embed_data.metadata
+                **(embed_data.metadata or {})
             }
             
+            # Content-addressed ID, stable across processes and runs
+            vector_id = make_chunk_id(metadata.get('url', ''), embed_data.text)
+            
             vectors.append({
                 'id': vector_id,
                 'values': embed_data.embedding,
@@ -112,33 +171,114 @@ class PineconeAdapter(Adapter):
         
         return vectors
     
-    def upsert(self, data: List[Dict]):
+    def _prepare(self, data: List) -> List[Dict]:
+        """Check the index and convert EmbedData objects if needed."""
+        if not self.index:
+            raise RuntimeError("Index not initialized. Call create_index() first.")
+        
+        if data and isinstance(data[0], EmbedData):
+            data = self.convert(data)
+        return data
+    
+    def upsert(self, data: List[Dict]) -> Dict[str, Any]:
         """
         Upsert data to Pinecone index
         
+        Blocking variant kept for the EmbedAnything Adapter interface.
+        Batches are retried with exponential backoff on 429/5xx errors.
+        
         Args:
             data: List of vectors to upsert
+            
+        Returns:
+            Report with 'upserted', 'retries' and 'failed_batches'
         """
-        if not self.index:
-            raise RuntimeError("Index not initialized. Call create_index() first.")
+        data = self._prepare(data)
+        report = {'upserted': 0, 'retries': 0, 'failed_batches': []}
         
-        # Convert data if needed
-        if data and isinstance(data[0], EmbedData):
-            data = self.convert(data)
+        for batch_number, i in enumerate(range(0, len(data), self.batch_size)):
+            batch = data[i:i+self.batch_size]
+            for attempt in range(self.max_retries + 1):
+                try:
+                    self.index.upsert(vectors=batch)
+                    report['upserted'] += len(batch)
+                    break
+                except Exception as e:
+                    if attempt < self.max_retries and _is_retryable(e):
+                        report['retries'] += 1
+                        time.sleep(_backoff_delay(attempt))
+                        continue
+                    print(f"Error upserting batch {batch_number}: {str(e)}")
+                    report['failed_batches'].append({
+                        'batch': batch_number,
+                        'ids': [vector['id'] for vector in batch],
+                        'error': str(e)
+                    })
+                    break
+        
+        return report
+    
+    async def upsert_async(self, data: List[Dict]) -> Dict[str, Any]:
+        """
+        Upsert data to Pinecone without blocking the event loop.
+        
+        Batches are sent in up to max_parallel concurrent streams, paced by
+        an adaptive token bucket that backs off on 429 responses. Failed
+        batches are retried with exponential backoff and reported rather
+        than skipped.
+        
+        Args:
+            data: List of vectors (or EmbedData) to upsert
+            
+        Returns:
+            Report with 'upserted', 'retries' and 'failed_batches'
+        """
+        data = self._prepare(data)
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_parallel)
+        
+        report = {'upserted': 0, 'retries': 0, 'failed_batches': []}
+        batches = [data[i:i+self.batch_size] for i in range(0, len(data), self.batch_size)]
+        
+        await asyncio.gather(*(
+            self._upsert_batch(batch_number, batch, report)
+            for batch_number, batch in enumerate(batches)
+        ))
+        return report
+    
+    async def _upsert_batch(self, batch_number: int, batch: List[Dict], report: Dict[str, Any]):
+        """
+        Upsert one batch with rate limiting and retries.
+        
+        Args:
+            batch_number: Position of the batch, for reporting
+            batch: Vectors to upsert
+            report: Shared report updated in place
+        """
+        loop = asyncio.get_running_loop()
         
-        # Upsert in batches with error handling and rate limiting
-        batch_size = 10  # Very small batch size to avoid capacity overflow
-        for i in range(0, len(data), batch_size):
-            batch = data[i:i+batch_size]
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire()
             try:
-                self.index.upsert(vectors=batch)
-                # Add longer delay to avoid rate limiting
-                import time
-                time.sleep(0.5)  # 500ms delay between batches
+                async with self._semaphore:
+                    await loop.run_in_executor(self.executor, lambda: self.index.upsert(vectors=batch))
+                self.limiter.on_success()
+                report['upserted'] += len(batch)
+                return
             except Exception as e:
-                print(f"Error upserting batch {i//batch_size}: {str(e)}")
-                # Continue with next batch instead of failing completely
-                continue
+                if _status_code(e) == 429:
+                    self.limiter.on_throttle()
+                if attempt < self.max_retries and _is_retryable(e):
+                    report['retries'] += 1
+                    await asyncio.sleep(_backoff_delay(attempt))
+                    continue
+                print(f"Error upserting batch {batch_number} after {attempt + 1} attempts: {str(e)}")
+                report['failed_batches'].append({
+                    'batch': batch_number,
+                    'ids': [vector['id'] for vector in batch],
+                    'error': str(e)
+                })
+                return
     
     async def clear_index(self, index_name: str = None) -> bool:
         """
@@ -154,6 +294,8 @@ class PineconeAdapter(Adapter):
         try:
             self.pc.delete_index(index_name)
             print(f"Successfully deleted index: {index_name}")
+            # Forget indexed pages so the next indexing run re-embeds them
+            await IndexManifest(index_name).clear()
             return True
         except Exception as e:
             print(f"Error deleting index {index_name}: {str(e)}")
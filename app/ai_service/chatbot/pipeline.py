@@ -0,0 +1,200 @@
+"""
+Author: Trần Tuấn Anh
+Created at: 2026-10-19
+Updated at: 2026-10-19
+Description: Pipelined embedding and upsert for the UrbanReflex RAG indexer.
+             Embeds batches in an executor while earlier batches are upserted
+             concurrently, adapting the batch size to measured throughput.
+"""
+
+import asyncio
+import time
+from concurrent.futures import Executor
+from typing import Any, AsyncIterable, Dict, List, Optional, Set
+import embed_anything
+from app.config.config import (
+    EMBED_BATCH_SIZE,
+    EMBED_MIN_BATCH_SIZE,
+    EMBED_MAX_BATCH_SIZE,
+    UPSERT_CONCURRENCY,
+)
+
+
+class EmbeddingPipeline:
+    """
+    Producer/consumer pipeline: documents -> embed -> upsert.
+
+    Embedding runs one batch at a time in an executor; finished batches go
+    through a bounded queue to several concurrent upsert workers, so total
+    time is bounded by the slowest stage rather than the sum of stages.
+    """
+
+    def __init__(self, embedding_model, upserter, executor: Optional[Executor] = None,
+                 batch_size: int = EMBED_BATCH_SIZE, min_batch_size: int = EMBED_MIN_BATCH_SIZE,
+                 max_batch_size: int = EMBED_MAX_BATCH_SIZE, upsert_concurrency: int = UPSERT_CONCURRENCY):
+        """
+        Initialize pipeline.
+
+        Args:
+            embedding_model: EmbedAnything embedding model
+            upserter: PineconeAdapter used for rate-limited, retrying upserts
+            executor: Executor for blocking embed calls (defaults to the loop's)
+            batch_size: Initial embedding batch size
+            min_batch_size: Smallest batch size the tuner may choose
+            max_batch_size: Largest batch size the tuner may choose
+            upsert_concurrency: Number of concurrent upsert workers
+        """
+        self.embedding_model = embedding_model
+        self.upserter = upserter
+        self.executor = executor
+        self.batch_size = batch_size
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.upsert_concurrency = max(1, upsert_concurrency)
+
+        self._best_throughput = 0.0
+        self._direction = 1  # 1 grows the batch size, -1 shrinks it
+
+    def _embed_batch(self, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Embed a batch and build Pinecone vectors (blocking)."""
+        embeddings = embed_anything.embed_query(
+            [doc['content'] for doc in batch],
+            embedder=self.embedding_model
+        )
+        return [
+            {
+                'id': doc['id'],
+                'values': embedding_data.embedding,
+                'metadata': {
+                    'text': doc['content'],
+                    **doc.get('metadata', {})
+                }
+            }
+            for doc, embedding_data in zip(batch, embeddings)
+        ]
+
+    def _tune(self, batch_len: int, seconds: float):
+        """
+        Hill-climb the batch size on embedding throughput.
+
+        Keeps moving in the current direction while throughput improves and
+        reverses when it drops.
+
+        Args:
+            batch_len: Documents in the measured batch
+            seconds: Time spent embedding the batch
+        """
+        if batch_len < self.batch_size or seconds <= 0:
+            # Partial final batches say nothing about the batch size
+            return
+
+        throughput = batch_len / seconds
+        if throughput >= self._best_throughput * 1.05:
+            self._best_throughput = throughput
+        elif throughput < self._best_throughput * 0.9:
+            self._direction = -self._direction
+            self._best_throughput = throughput
+        else:
+            return
+
+        if self._direction > 0:
+            self.batch_size = min(self.max_batch_size, self.batch_size * 2)
+        else:
+            self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+
+    async def run(self, documents: AsyncIterable[Dict[str, Any]],
+                  progress: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Embed and upsert a stream of documents.
+
+        Args:
+            documents: Async stream of dicts with 'id', 'content' and 'metadata'
+            progress: Optional dict updated in place with live statistics
+
+        Returns:
+            Statistics including throughput and the IDs of failed documents
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.upsert_concurrency * 2)
+        done = object()
+        failed_ids: Set[str] = set()
+        stats = progress if progress is not None else {}
+        stats.update({
+            'documents': 0,
+            'embedded': 0,
+            'upserted': 0,
+            'embed_seconds': 0.0,
+            'upsert_seconds': 0.0,
+            'upsert_retries': 0
+        })
+        start = time.perf_counter()
+
+        async def embed_stage():
+            batch: List[Dict[str, Any]] = []
+
+            async def embed(batch):
+                began = time.perf_counter()
+                try:
+                    vectors = await loop.run_in_executor(self.executor, self._embed_batch, batch)
+                except Exception as e:
+                    print(f"Error embedding batch of {len(batch)}: {str(e)}")
+                    failed_ids.update(doc['id'] for doc in batch)
+                    return
+                elapsed = time.perf_counter() - began
+                stats['embed_seconds'] += elapsed
+                stats['embedded'] += len(vectors)
+                self._tune(len(batch), elapsed)
+                await queue.put(vectors)
+
+            cancelled = False
+            try:
+                async for doc in documents:
+                    if not doc.get('content'):
+                        continue
+                    stats['documents'] += 1
+                    batch.append(doc)
+                    if len(batch) >= self.batch_size:
+                        await embed(batch)
+                        batch = []
+                if batch:
+                    await embed(batch)
+            except asyncio.CancelledError:
+                cancelled = True
+                raise
+            finally:
+                # Upsert workers are cancelled along with this stage
+                if not cancelled:
+                    for _ in range(self.upsert_concurrency):
+                        await queue.put(done)
+
+        async def upsert_stage():
+            while True:
+                vectors = await queue.get()
+                if vectors is done:
+                    return
+                began = time.perf_counter()
+                try:
+                    report = await self.upserter.upsert_async(vectors)
+                    stats['upserted'] += report['upserted']
+                    stats['upsert_retries'] += report['retries']
+                    for failed in report['failed_batches']:
+                        failed_ids.update(failed['ids'])
+                except Exception as e:
+                    print(f"Error upserting batch of {len(vectors)}: {str(e)}")
+                    failed_ids.update(vector['id'] for vector in vectors)
+                stats['upsert_seconds'] += time.perf_counter() - began
+
+        await asyncio.gather(embed_stage(), *(upsert_stage() for _ in range(self.upsert_concurrency)))
+
+        elapsed = time.perf_counter() - start
+        stats['elapsed_seconds'] = elapsed
+        stats['documents_per_second'] = stats['upserted'] / elapsed if elapsed > 0 else 0.0
+        stats['batch_size'] = self.batch_size
+        stats['failed_ids'] = failed_ids
+
+        print(
+            f"Pipeline: {stats['upserted']}/{stats['documents']} documents in {elapsed:.1f}s "
+            f"({stats['documents_per_second']:.1f} docs/s, embed {stats['embed_seconds']:.1f}s, "
+            f"upsert {stats['upsert_seconds']:.1f}s, batch size {self.batch_size})"
+        )
+        return stats
@@ -1,26 +1,76 @@
 """
 Author: Trần Tuấn Anh
 Created at: 2025-11-28
-Updated at: 2025-11-30
+Updated at: 2026-10-19
 Description: RAG (Retrieval-Augmented Generation) module for UrbanReflex chatbot.
              Integrates with Gemini API for intelligent responses based on retrieved context.
              Optimized for user support with detailed guidance and web links.
 """
 
 import os
+import time
 import asyncio
-from typing import List, Dict, Optional, Any
+import hashlib
+import textwrap
+from typing import List, Dict, Optional, Any, Set, Tuple
 from datetime import datetime
 import google.generativeai as genai
 from dotenv import load_dotenv
 from app.ai_service.chatbot.embedding import get_embedding_manager
+from app.ai_service.chatbot.context_packer import ContextPacker
+from app.ai_service.chatbot.history_writer import ChatHistoryWriter
+from app.ai_service.chatbot.tokenizer import load_tokenizer, truncate_to_tokens
+from app.utils.metrics import get_chat_latency
 from app.models.chat_history import ChatSession, ChatMessage
-from app.config.config import get_database
+from app.config.config import (
+    get_database,
+    CHAT_HISTORY_CONTEXT_MESSAGES,
+    CHAT_HISTORY_TIMEOUT,
+    RETRIEVAL_TIMEOUT,
+    CHAT_SUMMARY_TRIGGER_MESSAGES,
+    CHAT_SUMMARY_MAX_TOKENS,
+)
 
 # Load environment variables
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
+# Prompt layout; the packer fills history and context within the token budget
+PROMPT_TEMPLATE = """{system_prompt}
+
+CHAT HISTORY FOR CONTEXT:
+{chat_history}
+
+CONTEXT FROM URBANREFLEX DOCUMENTATION:
+{context}
+
+USER QUESTION: {query}
+
+PLEASE PROVIDE A HELPFUL RESPONSE BASED ON THE CONTEXT ABOVE.
+
+IMPORTANT:
+- Always respond in the user's language (Vietnamese for Vietnamese questions)
+- Provide detailed step-by-step guidance
+- Include relevant web links
+- If multiple steps, number them sequentially
+- Add important notes if applicable
+- Consider previous conversation context for continuity
+"""
+
+# Folds older turns into the rolling conversation summary
+SUMMARY_PROMPT_TEMPLATE = """You maintain a running summary of a support conversation on the UrbanReflex smart city platform.
+
+CURRENT SUMMARY:
+{summary}
+
+NEW MESSAGES:
+{messages}
+
+Rewrite the summary so it also covers the new messages. Keep the user's goals, key facts,
+answers already given and open questions. Write at most {max_words} words, in the conversation's language.
+Return only the summary text.
+"""
+
 
 class RAGSystem:
     """
@@ -44,9 +94,15 @@ class RAGSystem:
         # Configure Gemini
         genai.configure(api_key=self.api_key)
         self.model = genai.GenerativeModel('gemini-2.5-flash')
+        self.context_packer = ContextPacker()
+        # Sessions with a summary in progress, and the tasks doing it
+        self._summarizing: Set[str] = set()
+        self._background_tasks: Set[asyncio.Task] = set()
+        # Chat messages are persisted write-behind, off the request path
+        self.history_writer = ChatHistoryWriter(after_flush=self._check_summaries)
         
         # System prompt for UrbanReflex help assistant
-        self.system_prompt = """
+        self.system_prompt = textwrap.dedent("""
         You are a professional support assistant for the UrbanReflex smart city platform.
         Your role is to help users understand how to use the platform, answer questions about features,
         and provide detailed guidance on reporting issues and using services.
@@ -74,7 +130,7 @@ class RAGSystem:
         - Relevant web links for the answer
         - Detailed implementation steps
         - Contact information if additional support is needed
-        """
+        """).strip()
     
     async def generate_response(self, query: str, session_id: str = None, context_docs: List[Dict] = None) -> Dict[str, Any]:
         """
@@ -86,106 +142,140 @@ class RAGSystem:
             context_docs: Retrieved context documents (if None, will search)
             
         Returns:
-            Dictionary containing response and metadata
+            Dictionary containing response and metadata, including
+            per-stage 'timings' in seconds
         """
+        start = time.perf_counter()
+        # Filled with 'query_embedding' and 'vector_search' by the search
+        timings: Dict[str, float] = {}
+        packed = {'prompt_tokens': None}
+        
         try:
-            # Get chat history if session_id provided
-            chat_history = ""
-            if session_id:
-                chat_history = await self._get_chat_history(session_id)
-            
-            # Get context if not provided
-            if context_docs is None:
-                embedding_manager = await get_embedding_manager()
-                context_docs = await embedding_manager.search_similar(query, top_k=5)
-            
-            # Format context for prompt
-            context_text = self._format_context(context_docs)
-            
-            # Create prompt with context and history
-            full_prompt = f"""
-            {self.system_prompt}
-            
-            CHAT HISTORY FOR CONTEXT:
-            {chat_history}
-            
-            CONTEXT FROM URBANREFLEX DOCUMENTATION:
-            {context_text}
-            
-            USER QUESTION: {query}
-            
-            PLEASE PROVIDE A HELPFUL RESPONSE BASED ON THE CONTEXT ABOVE.
+            # Fetch chat history and retrieve context concurrently
+            ((summary, chat_history), history_time), (context_docs, retrieval_time) = await asyncio.gather(
+                self._run_stage("history", self._fetch_history(session_id), CHAT_HISTORY_TIMEOUT, ("", [])),
+                self._run_stage("retrieval", self._retrieve_context(query, context_docs, timings), RETRIEVAL_TIMEOUT, [])
+            )
+            timings['history'] = history_time
+            timings['retrieval'] = retrieval_time
+            
+            stage_start = time.perf_counter()
+            # Pack history and context into the prompt token budget
+            reserved_text = PROMPT_TEMPLATE.format(
+                system_prompt=self.system_prompt,
+                chat_history="",
+                context="",
+                query=query
+            )
+            packed = self.context_packer.pack(context_docs, chat_history, reserved_text, summary=summary)
             
-            IMPORTANT:
-            - Always respond in the user's language (Vietnamese for Vietnamese questions)
-            - Provide detailed step-by-step guidance
-            - Include relevant web links
-            - If multiple steps, number them sequentially
-            - Add important notes if applicable
-            - Consider previous conversation context for continuity
-            """
+            full_prompt = PROMPT_TEMPLATE.format(
+                system_prompt=self.system_prompt,
+                chat_history=packed['history'],
+                context=packed['context'],
+                query=query
+            )
+            timings['packing'] = time.perf_counter() - stage_start
             
-            # Generate response with Gemini
-            response = self.model.generate_content(full_prompt)
+            # Generate response with Gemini without blocking the event loop
+            stage_start = time.perf_counter()
+            response = await self.model.generate_content_async(full_prompt)
             
             # Extract response text
             response_text = response.text
+            timings['generation'] = time.perf_counter() - stage_start
             
             # Extract relevant links from context
             web_links = self._extract_web_links(context_docs)
             
-            # Save chat messages if session_id provided
+            # Queue chat messages for persistence if session_id provided
             if session_id:
-                await self._save_chat_message(session_id, query, response_text)
+                stage_start = time.perf_counter()
+                self._save_chat_message(session_id, query, response_text)
+                timings['history_write'] = time.perf_counter() - stage_start
             
+            self._record_timings(timings, start, packed['prompt_tokens'], session_id)
             return {
                 'response': response_text,
                 'sources': self._format_sources(context_docs),
                 'web_links': web_links,
                 'context_used': len(context_docs) > 0,
                 'query': query,
-                'session_id': session_id
+                'session_id': session_id,
+                'timings': timings,
+                'prompt_tokens': packed['prompt_tokens']
             }
             
         except Exception as e:
+            self._record_timings(timings, start, packed['prompt_tokens'], session_id, error=str(e))
             return {
                 'response': f"Xin lỗi, tôi đã gặp lỗi khi xử lý câu hỏi của bạn: {str(e)}",
                 'sources': [],
                 'web_links': [],
                 'context_used': False,
                 'query': query,
+                'timings': timings,
                 'error': str(e)
             }
     
-    def _format_context(self, context_docs: List[Dict]) -> str:
+    def _record_timings(self, timings: Dict[str, float], start: float, prompt_tokens: Optional[int],
+                        session_id: Optional[str], error: Optional[str] = None):
         """
-        Format context documents for prompt.
+        Record stage timings in the latency histograms and slow samples.
+        
+        Samples carry a short hash of the session ID rather than the ID
+        itself, enough to correlate repeated slow requests of one session.
+        """
+        total = time.perf_counter() - start
+        timings['total'] = total
+        stages = {stage: seconds for stage, seconds in timings.items() if stage != 'total'}
+        get_chat_latency().record(
+            stages, total,
+            prompt_tokens=prompt_tokens,
+            session_hash=hashlib.sha256(session_id.encode('utf-8')).hexdigest()[:12] if session_id else None,
+            error=error
+        )
+    
+    async def _run_stage(self, name: str, coro, timeout: float, default: Any):
+        """
+        Run one pipeline stage with its own timeout.
+        
+        A failed or timed-out stage falls back to its default value so the
+        other stages can still be used.
         
         Args:
-            context_docs: List of context documents
+            name: Stage name used in log messages
+            coro: Coroutine performing the stage
+            timeout: Timeout in seconds
+            default: Value returned when the stage fails
             
         Returns:
-            Formatted context string
+            Tuple of (stage result, elapsed seconds)
         """
-        if not context_docs:
-            return "No relevant documentation found."
-        
-        formatted_context = []
-        for i, doc in enumerate(context_docs, 1):
-            title = doc.get('metadata', {}).get('title', 'Không có tiêu đề')
-            url = doc.get('metadata', {}).get('url', '')
-            text = doc.get('text', '')
-            score = doc.get('score', 0)
-            
-            context_entry = f"""
-            Document {i} (Relevance: {score:.2f}):
-            Title: {title}
-            URL: {url}
-            Content: {text[:1000]}{'...' if len(text) > 1000 else ''}
-            """
-            formatted_context.append(context_entry)
-        
-        return '\n'.join(formatted_context)
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(coro, timeout=timeout)
+        except asyncio.TimeoutError:
+            print(f"Stage '{name}' timed out after {timeout:.1f}s")
+            result = default
+        except Exception as e:
+            print(f"Stage '{name}' failed: {str(e)}")
+            result = default
+        return result, time.perf_counter() - start
+    
+    async def _fetch_history(self, session_id: Optional[str]) -> Tuple[str, List[str]]:
+        """Fetch the summary and formatted recent turns, or nothing without a session."""
+        if not session_id:
+            return "", []
+        return await self._get_chat_history(session_id)
+    
+    async def _retrieve_context(self, query: str, context_docs: Optional[List[Dict]],
+                                timings: Optional[Dict[str, float]] = None) -> List[Dict]:
+        """Return the provided context documents or search for them."""
+        if context_docs is not None:
+            return context_docs
+        embedding_manager = await get_embedding_manager()
+        return await embedding_manager.search_similar(query, top_k=5, timings=timings)
     
     def _format_sources(self, context_docs: List[Dict]) -> List[Dict]:
         """
@@ -260,133 +350,176 @@ class RAGSystem:
         
         return "Thông tin liên quan"
     
-    async def health_check(self) -> Dict[str, Any]:
-        """
-        Check health of RAG system components.
-        
-        Returns:
-            Health status information
-        """
-        status = {
-            'gemini_api': False,
-            'embedding_system': False,
-            'overall': False
-        }
-        
-        try:
-            # Test Gemini API
-            test_response = self.model.generate_content("Xin chào")
-            if test_response.text:
-                status['gemini_api'] = True
-            
-            # Test embedding system
-            embedding_manager = await get_embedding_manager()
-            test_results = await embedding_manager.search_similar("test", top_k=1)
-            status['embedding_system'] = True
-            
-            # Overall status
-            status['overall'] = status['gemini_api'] and status['embedding_system']
-            
-        except Exception as e:
-            status['error'] = str(e)
-        
-        return status
-    
-    async def _get_chat_history(self, session_id: str, limit: int = 10) -> str:
+    async def _get_chat_history(self, session_id: str,
+                                limit: int = CHAT_HISTORY_CONTEXT_MESSAGES) -> Tuple[str, List[str]]:
         """
         Get chat history for context.
         
+        Only the rolling summary and the tail of the messages array are
+        fetched from MongoDB, so the prompt stays the same size however long
+        the session runs. Messages still waiting in the write-behind queue
+        are appended so the latest turns are never missing.
+        
         Args:
             session_id: Session identifier
-            limit: Maximum number of messages to retrieve
+            limit: Maximum number of recent messages to retrieve
             
         Returns:
-            Formatted chat history string
+            Tuple of (summary of older turns, recent history lines oldest first)
         """
         try:
-            from app.models.chat_history import ChatSession
             db = get_database()
-            session = await db.chat_sessions.find_one({"session_id": session_id})
-            
-            if not session or not session.get('messages'):
-                return ""
-            
-            # Get recent messages
-            messages = session['messages'][-limit:]
+            session = await db.chat_sessions.find_one(
+                {"session_id": session_id},
+                {"_id": 0, "summary": 1, "messages": {"$slice": -limit}}
+            )
             
-            # Format history
-            history_lines = []
-            for msg in messages:
-                role = "User" if msg['role'] == 'user' else "Assistant"
-                history_lines.append(f"{role}: {msg['content']}")
+            session = session or {}
+            messages = (session.get('messages', []) + self.history_writer.pending_for(session_id))[-limit:]
             
-            return "\n".join(history_lines[-6:])  # Last 6 messages for context
+            return session.get('summary') or "", self._format_messages(messages)
             
         except Exception as e:
             print(f"Error getting chat history: {str(e)}")
-            return ""
+            return "", []
+    
+    def _format_messages(self, messages: List[Dict]) -> List[str]:
+        """Format stored messages as 'Role: content' lines."""
+        history_lines = []
+        for msg in messages:
+            role = "User" if msg['role'] == 'user' else "Assistant"
+            history_lines.append(f"{role}: {msg['content']}")
+        return history_lines
     
-    async def _save_chat_message(self, session_id: str, user_message: str, assistant_message: str):
+    def _save_chat_message(self, session_id: str, user_message: str, assistant_message: str):
         """
-        Save chat messages to database.
+        Queue chat messages for saving to the database.
+        
+        Messages go to the write-behind ChatHistoryWriter, which flushes them
+        in bulk and caps how many messages each session keeps.
         
         Args:
             session_id: Session identifier
             user_message: User's message
             assistant_message: Assistant's response
         """
+        now = datetime.utcnow()
+        
+        user_msg = ChatMessage(
+            role="user",
+            content=user_message,
+            timestamp=now
+        )
+        
+        assistant_msg = ChatMessage(
+            role="assistant",
+            content=assistant_message,
+            timestamp=now
+        )
+        
+        self.history_writer.enqueue(session_id, [user_msg.model_dump(), assistant_msg.model_dump()], now)
+    
+    async def _check_summaries(self, session_ids: List[str]):
+        """
+        Schedule summaries for flushed sessions with too many unsummarized turns.
+        
+        Once enough turns are not covered by the summary, a background task
+        folds them in.
+        
+        Args:
+            session_ids: Sessions just written by the history writer
+        """
+        db = get_database()
+        cursor = db.chat_sessions.find(
+            {"session_id": {"$in": session_ids}},
+            {"_id": 0, "session_id": 1, "message_count": 1, "summarized_count": 1}
+        )
+        async for session in cursor:
+            unsummarized = session.get('message_count', 0) - session.get('summarized_count', 0)
+            if unsummarized > CHAT_SUMMARY_TRIGGER_MESSAGES:
+                self._schedule_summary(session['session_id'])
+    
+    async def close(self):
+        """Flush queued chat history and wait for running summaries."""
+        await self.history_writer.close()
+        if self._background_tasks:
+            await asyncio.gather(*self._background_tasks, return_exceptions=True)
+    
+    def _schedule_summary(self, session_id: str):
+        """Start a background summary update unless one is already running."""
+        if session_id in self._summarizing:
+            return
+        self._summarizing.add(session_id)
+        
+        task = asyncio.create_task(self._summarize_session(session_id))
+        self._background_tasks.add(task)
+        
+        def finished(task: asyncio.Task):
+            self._background_tasks.discard(task)
+            self._summarizing.discard(session_id)
+        
+        task.add_done_callback(finished)
+    
+    async def _summarize_session(self, session_id: str):
+        """
+        Fold turns older than the recent window into the rolling summary.
+        
+        The write is conditional on summarized_count being unchanged, so a
+        concurrent summarizer (e.g. in another worker) cannot overwrite a
+        newer summary.
+        
+        Args:
+            session_id: Session identifier
+        """
         try:
             db = get_database()
-            
-            # Create or update session
-            now = datetime.utcnow()
-            
-            # Add user message
-            user_msg = ChatMessage(
-                role="user",
-                content=user_message,
-                timestamp=now
+            session = await db.chat_sessions.find_one(
+                {"session_id": session_id},
+                {"_id": 0, "summary": 1, "message_count": 1, "summarized_count": 1, "messages": 1}
             )
-            
-            # Add assistant message
-            assistant_msg = ChatMessage(
-                role="assistant",
-                content=assistant_message,
-                timestamp=now
+            if not session:
+                return
+            
+            messages = session.get('messages', [])
+            # message_count can never be below the messages actually stored
+            total = max(session.get('message_count', 0), len(messages))
+            summarized = session.get('summarized_count', 0)
+            # Keep the recent window verbatim; it is sent as raw turns
+            target = total - CHAT_HISTORY_CONTEXT_MESSAGES
+            if target <= summarized:
+                return
+            
+            # messages holds the last len(messages) of `total` messages
+            offset = total - len(messages)
+            to_fold = messages[max(summarized - offset, 0):max(target - offset, 0)]
+            if not to_fold:
+                return
+            
+            prompt = SUMMARY_PROMPT_TEMPLATE.format(
+                summary=session.get('summary') or "(none)",
+                messages="\n".join(self._format_messages(to_fold)),
+                max_words=CHAT_SUMMARY_MAX_TOKENS * 2 // 3
             )
+            response = await self.model.generate_content_async(prompt)
+            summary = truncate_to_tokens(response.text.strip(), CHAT_SUMMARY_MAX_TOKENS)
             
-            # Update session
-            # First try to update existing session
             result = await db.chat_sessions.update_one(
-                {"session_id": session_id},
                 {
-                    "$set": {
-                        "updated_at": now
-                    },
-                    "$push": {
-                        "messages": {
-                            "$each": [user_msg.model_dump(), assistant_msg.model_dump()]
-                        }
-                    }
-                }
-            )
-            
-            # If no document was updated, create new one
-            if result.matched_count == 0:
-                await db.chat_sessions.insert_one({
                     "session_id": session_id,
-                    "user_id": None,  # Can be updated later if user authenticates
-                    "messages": [user_msg.model_dump(), assistant_msg.model_dump()],
-                    "created_at": now,
-                    "updated_at": now
-                })
+                    "summarized_count": summarized if 'summarized_count' in session else {"$exists": False}
+                },
+                {"$set": {"summary": summary, "summarized_count": target}}
+            )
+            if result.modified_count == 0:
+                print(f"Summary for session {session_id} superseded by a concurrent update")
             
         except Exception as e:
-            print(f"Error saving chat message: {str(e)}")
+            print(f"Error summarizing chat session {session_id}: {str(e)}")
 
 
 # Global RAG system instance
 _rag_system = None
+_rag_system_lock = asyncio.Lock()
 
 
 async def get_rag_system() -> RAGSystem:
@@ -399,11 +532,38 @@ async def get_rag_system() -> RAGSystem:
     global _rag_system
     
     if _rag_system is None:
-        _rag_system = RAGSystem()
+        async with _rag_system_lock:
+            if _rag_system is None:
+                _rag_system = RAGSystem()
     
     return _rag_system
 
 
+def current_rag_system() -> Optional[RAGSystem]:
+    """
+    Return the global RAG system without creating it.
+    
+    Returns:
+        RAGSystem instance, or None if not initialized yet
+    """
+    return _rag_system
+
+
+async def initialize_chatbot():
+    """
+    Eagerly create the chatbot singletons.
+    
+    Loads the embedding model and tokenizer, connects to Pinecone and
+    configures Gemini so the first chat request does not pay the cold start.
+    """
+    start = time.time()
+    await get_embedding_manager()
+    await get_rag_system()
+    # Downloading the tokenizer blocks; keep it off the event loop
+    await asyncio.get_running_loop().run_in_executor(None, load_tokenizer)
+    print(f"Chatbot initialized in {time.time() - start:.1f}s")
+
+
 async def chat_with_rag(query: str, context_docs: List[Dict] = None, session_id: str = None) -> Dict[str, Any]:
     """
     Convenience function for chat interaction with RAG.
@@ -441,8 +601,9 @@ if __name__ == "__main__":
                 print("Links:", response['web_links'])
                 print("-" * 50)
             
-            # Health check
-            health = await rag.health_check()
+            # Health check; the same snapshot the /health endpoint serves
+            from app.ai_service.chatbot.health import get_health_monitor
+            health = await get_health_monitor().check_now()
             print("System Health Status:", health)
             
         except Exception as e:
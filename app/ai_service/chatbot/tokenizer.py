@@ -0,0 +1,139 @@
+"""
+Author: Trần Tuấn Anh
+Created at: 2026-10-19
+Updated at: 2026-10-19
+Description: Token counting helpers for the UrbanReflex RAG system.
+             Uses the multilingual embedding model's tokenizer when available,
+             with a regex approximation as fallback (also used on the event
+             loop until the tokenizer has been loaded in the background).
+"""
+
+import re
+import asyncio
+import threading
+from typing import Callable, Optional
+from app.config.config import RAG_TOKENIZER_MODEL
+
+# Words and individual punctuation marks; close to subword counts for Vietnamese
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+_tokenizer = None
+_tokenizer_loaded = False
+_tokenizer_loading = False
+_tokenizer_lock = threading.Lock()
+
+
+def load_tokenizer():
+    """
+    Load the HuggingFace tokenizer once per process.
+
+    Blocks while the tokenizer is downloaded, so call it from a worker
+    thread (the chatbot warm-up does). If it cannot be loaded, counts fall
+    back to the regex approximation and the reason is printed once.
+
+    Returns:
+        Tokenizer instance, or None if it cannot be loaded
+    """
+    global _tokenizer, _tokenizer_loaded
+
+    if _tokenizer_loaded:
+        return _tokenizer
+
+    with _tokenizer_lock:
+        if not _tokenizer_loaded:
+            try:
+                from tokenizers import Tokenizer
+                _tokenizer = Tokenizer.from_pretrained(RAG_TOKENIZER_MODEL)
+            except Exception as e:
+                print(f"Tokenizer {RAG_TOKENIZER_MODEL} unavailable, using approximate counts: {str(e)}")
+                _tokenizer = None
+            _tokenizer_loaded = True
+
+    return _tokenizer
+
+
+def _get_tokenizer():
+    """
+    Return the tokenizer without ever blocking the event loop.
+
+    On the event loop a tokenizer that is not loaded yet is loaded in the
+    default executor and None is returned meanwhile; worker threads load it
+    directly.
+
+    Returns:
+        Tokenizer instance, or None if not (yet) available
+    """
+    global _tokenizer_loading
+
+    if _tokenizer_loaded:
+        return _tokenizer
+
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return load_tokenizer()
+
+    if not _tokenizer_loading:
+        _tokenizer_loading = True
+        loop.run_in_executor(None, load_tokenizer)
+    return None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count tokens in text.
+
+    Args:
+        text: Text to measure
+
+    Returns:
+        Number of tokens
+    """
+    if not text:
+        return 0
+
+    tokenizer = _get_tokenizer()
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+    return len(_TOKEN_PATTERN.findall(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, counter: Optional[Callable[[str], int]] = None) -> Optional[str]:
+    """
+    Truncate text to at most max_tokens, preferring a sentence boundary.
+
+    Args:
+        text: Text to truncate
+        max_tokens: Token limit
+        counter: Token counting function (defaults to count_tokens)
+
+    Returns:
+        Truncated text, or None if nothing fits
+    """
+    counter = counter or count_tokens
+    if max_tokens <= 0:
+        return None
+    if counter(text) <= max_tokens:
+        return text
+
+    # Binary search for the longest prefix that fits, leaving room for '...'
+    limit = max_tokens - counter('...')
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if counter(text[:mid]) <= limit:
+            low = mid
+        else:
+            high = mid - 1
+
+    prefix = text[:low]
+    if not prefix.strip():
+        return None
+
+    # Cut back to the last sentence end if it keeps most of the prefix
+    boundary = max(prefix.rfind('. '), prefix.rfind('! '), prefix.rfind('? '), prefix.rfind('\n'))
+    if boundary > len(prefix) // 2:
+        prefix = prefix[:boundary + 1]
+
+    return prefix.rstrip() + '...'
@@ -1,17 +1,81 @@
 """
 Author: Trần Tuấn Anh
 Created at: 2025-11-19
-Updated at: 2025-11-19
+Updated at: 2026-10-19
 Description: Main FastAPI application instance for UrbanReflex.
              Configures CORS, includes routers, and defines health endpoints.
+             The lifespan connects MongoDB and bootstraps its indexes, warms
+             up the chatbot and runs the health monitor.
 """
 
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.routers import items, users, auth, chatbot, citizen_reports
 from app.internal import admin
+from app.ai_service.chatbot.health import get_health_monitor
+from app.ai_service.chatbot.rag import initialize_chatbot, current_rag_system
+from app.ai_service.chatbot.jobs import get_job_registry
+from app.utils.auth import get_current_admin
+from app.utils.api_keys import get_revocation_list, require_api_key
+from app.utils.rate_limit_middleware import RateLimitMiddleware
+from app.utils.indexes import ensure_indexes
+from app.utils.metrics import get_mongo_pool_metrics
+from app.utils.responses import MongoJSONResponse
+from app.config.config import (
+    connect_database,
+    close_database,
+    CHATBOT_WARMUP,
+    API_KEYS_REQUIRED,
+    RATE_LIMIT_ENABLED,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    print("UrbanReflex app startup — version=1.0.0")
+    monitor = get_health_monitor()
+
+    # Open and warm the connection pool, then create indexes (idempotent)
+    try:
+        db = await connect_database()
+        await ensure_indexes(db)
+    except Exception as e:
+        print(f"Error connecting to MongoDB: {str(e)}")
+
+    # Warm up in the background so /live answers immediately;
+    # /ready stays 503 until initialization has succeeded (retried on failure)
+    warmup = None
+    if CHATBOT_WARMUP:
+        warmup = monitor.track_startup(initialize_chatbot)
+    monitor.start()
+    get_revocation_list().start()
+
+    yield
+
+    if warmup is not None and not warmup.done():
+        warmup.cancel()
+    await get_job_registry().cancel_all()
+    await monitor.stop()
+    await get_revocation_list().stop()
+
+    # Flush write-behind chat history before exiting
+    rag_system = current_rag_system()
+    if rag_system is not None:
+        await rag_system.close()
+    close_database()
+
+
+app = FastAPI(
+    title="UrbanReflex Backend",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=MongoJSONResponse
+)
 
-app = FastAPI(title="UrbanReflex Backend", version="1.0.0")
+# Added before CORS so CORS wraps it and 429 responses stay readable by the browser
+if RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware)
 
 # CORS middleware for Next.js frontend
 app.add_middleware(
@@ -23,11 +87,15 @@ app.add_middleware(
 )
 
 app.include_router(auth.router, prefix="/auth", tags=["authentication"])
-app.include_router(items.router, prefix="/api/v1", tags=["items"])
-app.include_router(users.router, prefix="/api/v1", tags=["users"])
+# /api/v1 consumers authenticate with signed API keys once enforcement is on;
+# reads need the "read" scope, citizen report submissions the "write" scope
+api_v1_dependencies = [Depends(require_api_key("read"))] if API_KEYS_REQUIRED else []
+api_v1_write_dependencies = [Depends(require_api_key("write"))] if API_KEYS_REQUIRED else []
+app.include_router(items.router, prefix="/api/v1", tags=["items"], dependencies=api_v1_dependencies)
+app.include_router(users.router, prefix="/api/v1", tags=["users"], dependencies=api_v1_dependencies)
 app.include_router(admin.router, prefix="/admin", tags=["admin"])
 app.include_router(chatbot.router, prefix="/ai-service/chatbot", tags=["chatbot"])
-app.include_router(citizen_reports.router)
+app.include_router(citizen_reports.router, dependencies=api_v1_write_dependencies)
 
 @app.get("/")
 async def root():
@@ -43,6 +111,7 @@ async def health_check():
     return {"service": "UrbanReflex", "status": "running", "version": "1.0.0"}
 
 
-@app.on_event("startup")
-async def startup_event():
-    print("UrbanReflex app startup — version=1.0.0")
\ No newline at end of file
+@app.get("/metrics/mongodb")
+async def mongodb_pool_metrics(current_admin = Depends(get_current_admin)):
+    """MongoDB connection pool usage and checkout wait times."""
+    return get_mongo_pool_metrics().snapshot()
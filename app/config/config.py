@@ -1,12 +1,13 @@
 """
 Author: Trần Tuấn Anh
 Created at: 2025-11-30
-Updated at: 2025-11-30
+Updated at: 2026-10-19
 Description: Configuration module for UrbanReflex.
              Reads configuration from environment variables.
 """
 
 import os
+import asyncio
 from dotenv import load_dotenv
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
 
@@ -16,26 +17,154 @@ load_dotenv()
 # Database configuration
 MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
 DATABASE_NAME = os.getenv("DATABASE_NAME", "urbanreflex")
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "100"))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "5"))  # connections opened at startup and kept
+MONGODB_MAX_IDLE_TIME_MS = int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", "300000"))
+MONGODB_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", "5000"))  # max wait for a free connection
+MONGODB_CONNECT_TIMEOUT_MS = int(os.getenv("MONGODB_CONNECT_TIMEOUT_MS", "5000"))
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGODB_SOCKET_TIMEOUT_MS = int(os.getenv("MONGODB_SOCKET_TIMEOUT_MS", "0"))  # 0 = no timeout
+MONGODB_COMPRESSORS = os.getenv("MONGODB_COMPRESSORS", "")  # e.g. "zstd,zlib"; zstd and snappy need extra packages
 
 # Authentication configuration
-SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
+DEFAULT_SECRET_KEY = "your-secret-key-here"  # Public placeholder; set SECRET_KEY in production
+SECRET_KEY = os.getenv("SECRET_KEY", DEFAULT_SECRET_KEY)
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+PASSWORD_HASH_ROUNDS = int(os.getenv("PASSWORD_HASH_ROUNDS", "29000"))  # pbkdf2_sha256 iterations
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))  # seconds; also capped by token exp
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+
+# API keys for /api/v1 consumers
+API_KEY_SECRET = os.getenv("API_KEY_SECRET")  # HMAC key shared with the key issuer; required when API_KEYS_REQUIRED is on
+API_KEY_MAX_DAYS = int(os.getenv("API_KEY_MAX_DAYS", "365"))
+API_KEY_REVOCATION_REFRESH = float(os.getenv("API_KEY_REVOCATION_REFRESH", "60"))  # seconds
+API_KEYS_REQUIRED = os.getenv("API_KEYS_REQUIRED", "false").lower() in ("1", "true", "yes")
+
+# Per-client request rate limits (per API key, user or IP)
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+RATE_LIMIT_DEFAULT = os.getenv("RATE_LIMIT_DEFAULT", "120/minute")
+# Comma-separated "METHOD /path/prefix=N/period" rules ("*" for any method, "off" to exempt).
+# Health probes and metrics scrapes are exempt: they come from a few IPs at a steady rate.
+RATE_LIMIT_ROUTES = os.getenv(
+    "RATE_LIMIT_ROUTES",
+    "POST /auth/login=10/minute,POST /auth/register=5/minute,POST /ai-service/chatbot/chat=30/minute,"
+    "GET /health=off,GET /metrics/=off,GET /ai-service/chatbot/live=off,GET /ai-service/chatbot/ready=off,"
+    "GET /ai-service/chatbot/health=off,GET /ai-service/chatbot/metrics/=off"
+)
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
 
 # AI Service configuration
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "urbanreflex-index")
 WEBSITE_CRAWL_URL = os.getenv("WEBSITE_CRAWL_URL", "https://urbanreflex.vn")
+CRAWLER_CONCURRENCY = int(os.getenv("CRAWLER_CONCURRENCY", "8"))
+CRAWLER_RATE_PER_HOST = float(os.getenv("CRAWLER_RATE_PER_HOST", "10"))
+CRAWLER_BURST = int(os.getenv("CRAWLER_BURST", "10"))
+CRAWLER_PARSER = os.getenv("CRAWLER_PARSER", "auto")  # auto, selectolax, lxml or html.parser; auto picks selectolax if installed, else lxml
+CRAWLER_PARSE_WORKERS = int(os.getenv("CRAWLER_PARSE_WORKERS", "2"))
+INDEX_MAX_MISSED_RUNS = int(os.getenv("INDEX_MAX_MISSED_RUNS", "3"))  # complete crawls missing a page before it is dropped
+
+# Startup configuration
+CHATBOT_WARMUP = os.getenv("CHATBOT_WARMUP", "true").lower() in ("1", "true", "yes")
+CHATBOT_WARMUP_RETRY_BASE = float(os.getenv("CHATBOT_WARMUP_RETRY_BASE", "2"))  # seconds before the first retry
+CHATBOT_WARMUP_RETRY_MAX = float(os.getenv("CHATBOT_WARMUP_RETRY_MAX", "60"))
+
+# Health monitor configuration
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", "30"))
+HEALTH_PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", "5"))
+HEALTH_MAX_AGE = float(os.getenv("HEALTH_MAX_AGE", "90"))  # Older results count as unhealthy
+
+# Chat history configuration
+CHAT_HISTORY_MAX_MESSAGES = int(os.getenv("CHAT_HISTORY_MAX_MESSAGES", "50"))
+CHAT_HISTORY_CONTEXT_MESSAGES = int(os.getenv("CHAT_HISTORY_CONTEXT_MESSAGES", "6"))
+CHAT_SESSION_TTL_DAYS = int(os.getenv("CHAT_SESSION_TTL_DAYS", "30"))
+CHAT_HISTORY_TIMEOUT = float(os.getenv("CHAT_HISTORY_TIMEOUT", "2.0"))
+RETRIEVAL_TIMEOUT = float(os.getenv("RETRIEVAL_TIMEOUT", "5.0"))
+CHAT_SUMMARY_TRIGGER_MESSAGES = int(os.getenv("CHAT_SUMMARY_TRIGGER_MESSAGES", "12"))  # unsummarized messages before compressing
+CHAT_SUMMARY_MAX_TOKENS = int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "300"))
+CHAT_WRITE_FLUSH_MS = float(os.getenv("CHAT_WRITE_FLUSH_MS", "100"))
+CHAT_WRITE_BATCH_MESSAGES = int(os.getenv("CHAT_WRITE_BATCH_MESSAGES", "200"))
+SLOW_REQUEST_THRESHOLD = float(os.getenv("SLOW_REQUEST_THRESHOLD", "5.0"))  # seconds
+SLOW_REQUEST_SAMPLES = int(os.getenv("SLOW_REQUEST_SAMPLES", "50"))
+
+# Chat admission control
+CHAT_MAX_CONCURRENT = int(os.getenv("CHAT_MAX_CONCURRENT", "8"))
+CHAT_MAX_QUEUE = int(os.getenv("CHAT_MAX_QUEUE", "32"))
+CHAT_QUEUE_TIMEOUT = float(os.getenv("CHAT_QUEUE_TIMEOUT", "2.0"))
+CHAT_SESSION_RATE = float(os.getenv("CHAT_SESSION_RATE", "0.2"))  # requests per second
+CHAT_SESSION_BURST = float(os.getenv("CHAT_SESSION_BURST", "5"))
+CHAT_CLIENT_RATE = float(os.getenv("CHAT_CLIENT_RATE", "0.5"))  # per authenticated user or IP
+CHAT_CLIENT_BURST = float(os.getenv("CHAT_CLIENT_BURST", "10"))
+
+# RAG prompt configuration
+RAG_PROMPT_TOKEN_BUDGET = int(os.getenv("RAG_PROMPT_TOKEN_BUDGET", "3000"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "8"))
+EMBED_MIN_BATCH_SIZE = int(os.getenv("EMBED_MIN_BATCH_SIZE", "4"))
+EMBED_MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", "128"))
+UPSERT_CONCURRENCY = int(os.getenv("UPSERT_CONCURRENCY", "4"))
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "100"))
+UPSERT_RATE = float(os.getenv("UPSERT_RATE", "10"))  # requests per second, adapts on 429
+UPSERT_MAX_RATE = float(os.getenv("UPSERT_MAX_RATE", "50"))
+UPSERT_MAX_RETRIES = int(os.getenv("UPSERT_MAX_RETRIES", "5"))
+QUERY_EMBED_MAX_BATCH = int(os.getenv("QUERY_EMBED_MAX_BATCH", "32"))
+QUERY_EMBED_MAX_WAIT_MS = float(os.getenv("QUERY_EMBED_MAX_WAIT_MS", "5"))
+CHUNK_TARGET_TOKENS = int(os.getenv("CHUNK_TARGET_TOKENS", "120"))  # model max sequence is 128
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "20"))
+RAG_TOKENIZER_MODEL = os.getenv("RAG_TOKENIZER_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
 
 # Database client
 client = None
 database = None
 
+def _create_client() -> AsyncIOMotorClient:
+    """Create a Motor client with the configured pool settings."""
+    from app.utils.metrics import get_mongo_pool_metrics
+
+    options = {
+        "maxPoolSize": MONGODB_MAX_POOL_SIZE,
+        "minPoolSize": MONGODB_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGODB_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+        "connectTimeoutMS": MONGODB_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        "socketTimeoutMS": MONGODB_SOCKET_TIMEOUT_MS or None,
+        "event_listeners": [get_mongo_pool_metrics()],
+    }
+    if MONGODB_COMPRESSORS:
+        options["compressors"] = MONGODB_COMPRESSORS
+    return AsyncIOMotorClient(MONGODB_URL, **options)
+
 def get_database() -> AsyncIOMotorDatabase:
     """Get MongoDB database instance."""
     global client, database
     if client is None:
-        client = AsyncIOMotorClient(MONGODB_URL)
+        # Normally created by connect_database() in the app lifespan;
+        # scripts and tests fall back to creating it on first use
+        client = _create_client()
         database = client[DATABASE_NAME]
-    return database
\ No newline at end of file
+    return database
+
+async def connect_database() -> AsyncIOMotorDatabase:
+    """
+    Create the MongoDB client and warm its connection pool.
+
+    Runs one ping per MONGODB_MIN_POOL_SIZE connection concurrently so the
+    first requests do not pay for connection setup.
+
+    Returns:
+        MongoDB database instance
+    """
+    db = get_database()
+    await asyncio.gather(*(db.command("ping") for _ in range(max(1, MONGODB_MIN_POOL_SIZE))))
+    return db
+
+def close_database():
+    """Close the MongoDB client and its pooled connections."""
+    global client, database
+    if client is not None:
+        client.close()
+        client = None
+        database = None
@@ -1,30 +1,110 @@
 """
 Author: Trần Tuấn Anh
 Created at: 2025-11-19
-Updated at: 2025-11-19
+Updated at: 2026-10-19
 Description: Admin internal routes for UrbanReflex.
              Handles admin-only operations like user management.
 """
 
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import timedelta
+from typing import List, Optional
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from app.config.config import get_database
-from app.utils.auth import get_current_admin
-from app.utils.db import serialize_doc
+from app.utils.auth import get_current_admin, invalidate_user
+from app.utils.api_keys import issue_api_key, get_revocation_list
+from app.utils.responses import MongoJSONResponse, dumps
+from app.config.config import API_KEY_MAX_DAYS
 
 router = APIRouter()
 
+# Fields returned by the user listing; everything else stays in MongoDB
+USER_LIST_PROJECTION = {
+    "email": 1,
+    "username": 1,
+    "full_name": 1,
+    "phone": 1,
+    "latitude": 1,
+    "longitude": 1,
+    "is_admin": 1,
+    "created_at": 1,
+}
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
 @router.get("/users")
-async def get_all_users(db: AsyncIOMotorDatabase = Depends(get_database), current_admin = Depends(get_current_admin)):
-    """Get all users - Admin only"""
-    users = await db.users.find().to_list(length=None)
-    return [serialize_doc(user) for user in users]
+async def get_all_users(
+    limit: Optional[int] = Query(None, ge=1, description=f"Page size (default {DEFAULT_PAGE_SIZE}, max {MAX_PAGE_SIZE}); in stream mode, no limit unless given"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    stream: bool = Query(False, description="Stream users as NDJSON instead of a page"),
+    db: AsyncIOMotorDatabase = Depends(get_database),
+    current_admin = Depends(get_current_admin)
+):
+    """
+    List users ordered by _id - Admin only.
+
+    Pages are keyset-paginated on _id: pass the returned next_cursor to get
+    the following page. With stream=true, users are written one JSON object
+    per line as the cursor yields them.
+    """
+    query = {}
+    if cursor:
+        try:
+            query["_id"] = {"$gt": ObjectId(cursor)}
+        except (InvalidId, TypeError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if stream:
+        users = db.users.find(query, USER_LIST_PROJECTION).sort("_id", 1).batch_size(DEFAULT_PAGE_SIZE)
+        if limit:
+            users = users.limit(limit)
+
+        async def lines():
+            async for user in users:
+                yield dumps(user) + b"\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    page_size = min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+    # Fetch one extra document to know whether another page exists
+    users = await db.users.find(query, USER_LIST_PROJECTION).sort("_id", 1).limit(page_size + 1).to_list(length=page_size + 1)
+    next_cursor = str(users[page_size - 1]["_id"]) if len(users) > page_size else None
+    # The projection already excludes secrets, so documents are encoded as-is
+    return MongoJSONResponse({
+        "users": users[:page_size],
+        "next_cursor": next_cursor
+    })
 
 @router.put("/users/{user_id}/admin")
 async def set_user_admin(user_id: str, is_admin: bool, db: AsyncIOMotorDatabase = Depends(get_database), current_admin = Depends(get_current_admin)):
     """Set user admin status - Admin only"""
-    from bson import ObjectId
-    result = await db.users.update_one({"_id": ObjectId(user_id)}, {"$set": {"is_admin": is_admin}})
-    if result.matched_count == 0:
+    user = await db.users.find_one_and_update(
+        {"_id": ObjectId(user_id)},
+        {"$set": {"is_admin": is_admin}},
+        projection={"username": 1}
+    )
+    if user is None:
         raise HTTPException(status_code=404, detail="User not found")
-    return {"message": "User admin status updated"}
\ No newline at end of file
+    # Cached user documents would otherwise keep the old permissions
+    invalidate_user(user.get("username"))
+    return {"message": "User admin status updated"}
+
+class APIKeyRequest(BaseModel):
+    """Request model for issuing an API key."""
+    scopes: List[str] = Field(default_factory=lambda: ["read"], description="Scopes granted to the key: 'read' for /api/v1 reads, 'write' to submit citizen reports")
+    expires_days: int = Field(90, ge=1, le=API_KEY_MAX_DAYS, description="Key lifetime in days")
+
+@router.post("/api-keys")
+async def create_api_key(request: APIKeyRequest, current_admin = Depends(get_current_admin)):
+    """Issue a signed API key - Admin only. The key itself is not stored."""
+    return issue_api_key(request.scopes, timedelta(days=request.expires_days))
+
+@router.post("/api-keys/{key_id}/revoke")
+async def revoke_api_key(key_id: str, current_admin = Depends(get_current_admin)):
+    """Revoke an API key by ID - Admin only"""
+    await get_revocation_list().revoke(key_id)
+    return {"message": "API key revoked", "key_id": key_id}
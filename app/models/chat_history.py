@@ -1,7 +1,7 @@
 """
 Author: Trần Tuấn Anh
 Created at: 2025-11-29
-Updated at: 2025-11-29
+Updated at: 2026-10-19
 Description: Chat history model for UrbanReflex RAG system.
              Stores conversation context for better responses.
 """
@@ -46,6 +46,10 @@ class ChatSession(BaseModel):
     session_id: str = Field(..., description="Unique session identifier")
     user_id: Optional[str] = Field(None, description="User ID if authenticated")
     messages: List[ChatMessage] = Field(default_factory=list, description="Chat message history")
+    summary: Optional[str] = Field(None, description="Rolling summary of older messages")
+    message_count: int = Field(0, description="Total messages ever appended to the session")
+    summarized_count: int = Field(0, description="Number of leading messages covered by the summary")
+    write_ids: List[str] = Field(default_factory=list, description="Recent history writer update IDs, used to skip retried updates")
     created_at: datetime = Field(default_factory=datetime.utcnow, description="Session creation time")
     updated_at: datetime = Field(default_factory=datetime.utcnow, description="Last update time")
     
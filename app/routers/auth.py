@@ -1,7 +1,7 @@
 """
 Author: Trần Tuấn Anh
 Created at: 2025-11-19
-Updated at: 2025-11-19
+Updated at: 2026-10-19
 Description: Authentication router for UrbanReflex.
              Handles user registration, login, and profile retrieval.
 """
@@ -9,9 +9,10 @@ Description: Authentication router for UrbanReflex.
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
 from app.config.config import get_database
 from app.schemas.user import UserCreate, User, Token, LoginRequest
-from app.utils.auth import get_password_hash, verify_password, create_access_token, get_current_user
+from app.utils.auth import get_password_hash_async, verify_password_async, create_access_token, get_current_user, invalidate_user
 from app.utils.db import serialize_doc
 
 router = APIRouter()
@@ -24,7 +25,7 @@ async def register(user: UserCreate, db: AsyncIOMotorDatabase = Depends(get_data
         raise HTTPException(status_code=400, detail="Email or username already registered")
     
     # Hash password
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash_async(user.password)
     
     # Create user document
     user_doc = {
@@ -38,8 +39,12 @@ async def register(user: UserCreate, db: AsyncIOMotorDatabase = Depends(get_data
         "hashed_password": hashed_password
     }
     
-    # Insert into database
-    result = await db.users.insert_one(user_doc)
+    # Insert into database; the unique indexes catch a concurrent registration
+    try:
+        result = await db.users.insert_one(user_doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email or username already registered")
+    invalidate_user(user.username)
     # Convert ObjectId to string and sanitize before returning
     user_doc["_id"] = str(result.inserted_id)
     return serialize_doc(user_doc)
@@ -47,12 +52,19 @@ async def register(user: UserCreate, db: AsyncIOMotorDatabase = Depends(get_data
 @router.post("/login", response_model=Token)
 async def login(login_data: LoginRequest, db: AsyncIOMotorDatabase = Depends(get_database)):
     user = await db.users.find_one({"$or": [{"email": login_data.identifier}, {"username": login_data.identifier}]})
-    if not user or not verify_password(login_data.password, user["hashed_password"]):
+    valid, new_hash = (False, None)
+    if user:
+        valid, new_hash = await verify_password_async(login_data.password, user["hashed_password"])
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email/username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        # Upgrade hashes created with fewer rounds than configured
+        await db.users.update_one({"_id": user["_id"]}, {"$set": {"hashed_password": new_hash}})
+        invalidate_user(user["username"])
     access_token = create_access_token(data={"sub": user["username"]})
     return {"access_token": access_token, "token_type": "bearer"}
 
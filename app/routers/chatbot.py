@@ -1,15 +1,18 @@
 """
 Author: Trần Tuấn Anh
 Created at: 2025-11-28
-Updated at: 2025-11-28
+Updated at: 2026-10-19
 Description: Chatbot router for UrbanReflex RAG system.
              Provides endpoints for chat interaction, indexing, and health checks.
+             Health, liveness and readiness answer from the cached health monitor.
 """
 
+import math
 import time
 import asyncio
 from typing import Dict, Any
-from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 from typing import List, Dict, Optional, Any
 from datetime import datetime
@@ -32,6 +35,7 @@ class ChatResponse(BaseModel):
     session_id: Optional[str] = Field(None, description="Session identifier for conversation tracking")
     timestamp: datetime = Field(default_factory=datetime.utcnow, description="Response timestamp")
     processing_time: Optional[float] = Field(None, description="Time taken to process the request (seconds)")
+    timings: Optional[Dict[str, float]] = Field(None, description="Seconds spent in each processing stage")
 
 
 class IndexRequest(BaseModel):
@@ -48,6 +52,7 @@ class IndexResponse(BaseModel):
     pages_crawled: Optional[int] = Field(None, description="Number of pages crawled")
     documents_indexed: Optional[int] = Field(None, description="Number of documents indexed")
     processing_time: Optional[float] = Field(None, description="Time taken for indexing (seconds)")
+    job_id: Optional[str] = Field(None, description="Indexing job identifier for status queries")
     timestamp: datetime = Field(default_factory=datetime.utcnow, description="Operation timestamp")
 
 
@@ -72,11 +77,22 @@ class HealthStatus(BaseModel):
     pinecone_connection: bool = Field(..., description="Pinecone vector database status")
     overall: bool = Field(..., description="Overall system health")
     error: Optional[str] = Field(None, description="Error message if any component failed")
+    components: Dict[str, Dict] = Field(default_factory=dict, description="Per-component status, latency and check time")
     timestamp: datetime = Field(default_factory=datetime.utcnow, description="Health check timestamp")
 from app.ai_service.chatbot.rag import get_rag_system, chat_with_rag
 from app.ai_service.chatbot.embedding import get_embedding_manager, index_website_data
 from app.ai_service.chatbot.pinecone_adapter import PineconeAdapter
+from app.ai_service.chatbot.health import get_health_monitor
+from app.ai_service.chatbot.jobs import get_job_registry, JobConflictError, IndexJob, COMPLETED
 from app.config.config import WEBSITE_CRAWL_URL, PINECONE_API_KEY, PINECONE_INDEX_NAME
+from app.utils.admission import (
+    get_chat_admission,
+    AdmissionRejected,
+    PRIORITY_AUTHENTICATED,
+    PRIORITY_ANONYMOUS,
+)
+from app.utils.auth import get_optional_user, get_current_admin
+from app.utils.metrics import get_chat_latency
 import logging
 
 # Configure logging
@@ -87,12 +103,51 @@ router = APIRouter()
 
 
 @router.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request, current_user: Optional[dict] = Depends(get_optional_user)):
     """
     Process a chat query using the RAG system.
     
+    Requests pass admission control first: per-session and per-client
+    token buckets, then a global concurrency cap with a short wait queue in
+    which authenticated users are served first. Shed requests get a fast 429.
+    
     Args:
         request: Chat request containing query and optional parameters
+        http_request: Incoming HTTP request, used for the client address
+        current_user: Authenticated user, if a valid token was sent
+        
+    Returns:
+        ChatResponse with generated answer and sources
+    """
+    if current_user:
+        client_key = f"user:{current_user['_id']}"
+        priority = PRIORITY_AUTHENTICATED
+    else:
+        client_key = f"ip:{http_request.client.host if http_request.client else 'unknown'}"
+        priority = PRIORITY_ANONYMOUS
+    
+    try:
+        admission_start = time.perf_counter()
+        async with get_chat_admission().admit(request.session_id, client_key, priority):
+            admission_wait = time.perf_counter() - admission_start
+            get_chat_latency().observe('admission', admission_wait)
+            return await _process_chat(request, admission_wait)
+    except AdmissionRejected as e:
+        logger.warning(f"Chat request rejected ({e.reason}) for {client_key}")
+        raise HTTPException(
+            status_code=429,
+            detail=f"Too many requests: {e.reason}",
+            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))}
+        )
+
+
+async def _process_chat(request: ChatRequest, admission_wait: float = 0.0) -> ChatResponse:
+    """
+    Generate a chat response once the request has been admitted.
+    
+    Args:
+        request: Chat request containing query and optional parameters
+        admission_wait: Seconds spent waiting for admission
         
     Returns:
         ChatResponse with generated answer and sources
@@ -111,6 +166,9 @@ async def chat(request: ChatRequest):
         
         # Calculate processing time
         processing_time = time.time() - start_time
+        timings = response_data.get('timings')
+        if timings is not None:
+            timings = {'admission': admission_wait, **timings}
         
         # Format response
         chat_response = ChatResponse(
@@ -120,7 +178,8 @@ async def chat(request: ChatRequest):
             context_used=response_data.get('context_used', False),
             query=request.query,
             session_id=request.session_id,
-            processing_time=processing_time
+            processing_time=processing_time,
+            timings=timings
         )
         
         logger.info(f"Chat response generated in {processing_time:.2f}s")
@@ -135,66 +194,72 @@ async def chat(request: ChatRequest):
 
 
 @router.post("/index", response_model=IndexResponse)
-async def index_website(request: IndexRequest, background_tasks: BackgroundTasks):
+async def index_website(request: IndexRequest):
     """
     Index website data for the RAG system.
     
+    Indexing always runs as a registered background job. Small crawls
+    (max_pages <= 20) wait for the job and report its results; larger
+    ones return immediately with the job ID.
+    
     Args:
         request: Index request with crawling parameters
-        background_tasks: FastAPI background tasks for async processing
         
     Returns:
         IndexResponse with indexing status
     """
     start_time = time.time()
+    base_url = request.base_url or WEBSITE_CRAWL_URL
     
     try:
-        logger.info(f"Starting website indexing for: {request.base_url or WEBSITE_CRAWL_URL}")
+        logger.info(f"Starting website indexing for: {base_url}")
         
         # Initialize embedding manager if needed
         embedding_manager = await get_embedding_manager()
         
-        # If recreate_index is requested, reinitialize
-        if request.recreate_index:
-            logger.info("Recreating vector index...")
-            await embedding_manager.initialize(recreate_index=True)
+        # Reserves the index before anything runs; a recreate happens inside the job
+        job = get_job_registry().start(
+            embedding_manager.index_name,
+            base_url,
+            request.max_pages,
+            _run_index_job,
+            recreate_index=request.recreate_index
+        )
         
         # Start indexing in background for large sites
         if request.max_pages > 20:
-            background_tasks.add_task(
-                _index_website_background,
-                base_url=request.base_url or WEBSITE_CRAWL_URL,
-                max_pages=request.max_pages
-            )
-            
             return IndexResponse(
                 success=True,
                 message=f"Indexing started in background for {request.max_pages} pages",
-                processing_time=time.time() - start_time
+                processing_time=time.time() - start_time,
+                job_id=job.id
             )
         
-        # For smaller sites, do it synchronously
-        success = await index_website_data(
-            base_url=request.base_url or WEBSITE_CRAWL_URL,
-            crawled_data=None
-        )
-        
+        # For smaller sites, wait for the job; a disconnecting client does not cancel it
+        await asyncio.shield(job.task)
+        status = job.to_dict()
         processing_time = time.time() - start_time
         
-        if success:
+        if job.state == COMPLETED:
             return IndexResponse(
                 success=True,
                 message="Website indexing completed successfully",
-                pages_crawled=request.max_pages,
-                processing_time=processing_time
+                pages_crawled=status['pages_crawled'],
+                documents_indexed=status['vectors_upserted'],
+                processing_time=processing_time,
+                job_id=job.id
             )
         else:
             return IndexResponse(
                 success=False,
-                message="Failed to index website data",
-                processing_time=processing_time
+                message=f"Failed to index website data: {job.error or job.state}",
+                pages_crawled=status['pages_crawled'],
+                processing_time=processing_time,
+                job_id=job.id
             )
-            
+    
+    except JobConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         logger.error(f"Error during website indexing: {str(e)}")
         raise HTTPException(
@@ -203,48 +268,141 @@ async def index_website(request: IndexRequest, background_tasks: BackgroundTasks
         )
 
 
+@router.get("/index/jobs")
+async def list_index_jobs():
+    """
+    List recent indexing jobs, newest first.
+    
+    Returns:
+        Dictionary with job statuses
+    """
+    return {"jobs": [job.to_dict() for job in get_job_registry().list()]}
+
+
+@router.get("/index/jobs/{job_id}")
+async def get_index_job(job_id: str):
+    """
+    Get status, progress and throughput of an indexing job.
+    
+    Args:
+        job_id: Job identifier returned by /index
+        
+    Returns:
+        Job status
+    """
+    job = get_job_registry().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Indexing job {job_id} not found")
+    return job.to_dict()
+
+
+@router.post("/index/jobs/{job_id}/cancel")
+async def cancel_index_job(job_id: str):
+    """
+    Cancel a running indexing job.
+    
+    Pages already fully indexed stay indexed; the rest are picked up by the
+    next run.
+    
+    Args:
+        job_id: Job identifier returned by /index
+        
+    Returns:
+        Job status after the cancellation request
+    """
+    registry = get_job_registry()
+    job = registry.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Indexing job {job_id} not found")
+    if not registry.cancel(job_id):
+        raise HTTPException(status_code=409, detail=f"Indexing job {job_id} is already {job.state}")
+    
+    logger.info(f"Cancellation requested for indexing job {job_id}")
+    return job.to_dict()
+
+
 @router.get("/health", response_model=HealthStatus)
 async def health_check():
     """
     Check the health status of the chatbot system components.
     
+    Answers from the health monitor's cache; dependencies are probed in the
+    background, never per request.
+    
     Returns:
         HealthStatus with component status information
     """
-    try:
-        # Get RAG system health
-        rag_system = await get_rag_system()
-        rag_health = await rag_system.health_check()
-        
-        # Check embedding system separately
-        try:
-            embedding_manager = await get_embedding_manager()
-            # Test a simple search to verify Pinecone connection
-            await embedding_manager.search_similar("health_check", top_k=1)
-            pinecone_status = True
-        except Exception as e:
-            logger.warning(f"Pinecone connection check failed: {str(e)}")
-            pinecone_status = False
-        
-        health_status = HealthStatus(
-            gemini_api=rag_health.get('gemini_api', False),
-            embedding_system=rag_health.get('embedding_system', False),
-            pinecone_connection=pinecone_status,
-            overall=rag_health.get('overall', False) and pinecone_status,
-            error=rag_health.get('error')
-        )
-        
-        return health_status
-        
-    except Exception as e:
-        logger.error(f"Health check failed: {str(e)}")
-        return HealthStatus(
-            gemini_api=False,
-            embedding_system=False,
-            pinecone_connection=False,
-            overall=False,
-            error=str(e)
-        )
+    monitor = get_health_monitor()
+    monitor.start()
+    snapshot = monitor.snapshot()
+    components = snapshot['components']
+    
+    errors = [f"{name}: {c['error']}" for name, c in components.items() if c['error']]
+    checked_at = snapshot['checked_at']
+    
+    return HealthStatus(
+        gemini_api=components['gemini_api']['ok'],
+        embedding_system=components['embedding_system']['ok'],
+        pinecone_connection=components['pinecone_connection']['ok'],
+        overall=snapshot['ready'],
+        error="; ".join(errors) or None,
+        components=components,
+        timestamp=datetime.utcfromtimestamp(checked_at) if checked_at else datetime.utcnow()
+    )
+
+
+@router.get("/admission")
+async def admission_stats(current_admin = Depends(get_current_admin)):
+    """
+    Chat admission control load and rejection counters.
+    
+    Returns:
+        Active requests, queue depth and rejection counts
+    """
+    return get_chat_admission().stats()
+
+
+@router.get("/metrics/latency")
+async def latency_metrics(current_admin = Depends(get_current_admin)):
+    """
+    Chat latency histograms per stage and recent slow requests.
+    
+    Returns:
+        Histograms (seconds) and slow request samples with prompt token counts
+        and hashed session IDs
+    """
+    return get_chat_latency().snapshot()
+
+
+@router.get("/live")
+async def liveness():
+    """
+    Liveness probe: the process is up and serving requests.
+    
+    Returns:
+        Static status; never touches dependencies
+    """
+    return {"status": "alive"}
+
+
+@router.get("/ready")
+async def readiness():
+    """
+    Readiness probe from the cached dependency status.
+    
+    Returns:
+        200 when every dependency passed its last probe, 503 otherwise
+    """
+    monitor = get_health_monitor()
+    monitor.start()
+    snapshot = monitor.snapshot()
+    
+    body = {
+        "ready": snapshot['ready'],
+        "components": {name: c['ok'] for name, c in snapshot['components'].items()},
+        "checked_at": snapshot['checked_at']
+    }
+    return JSONResponse(status_code=200 if snapshot['ready'] else 503, content=body)
 
 
 @router.post("/initialize")
@@ -266,26 +424,25 @@ async def initialize_system(recreate_index: bool = False):
         await embedding_manager.initialize(recreate_index=recreate_index)
         
         # Initialize RAG system
-        rag_system = await get_rag_system()
+        await get_rag_system()
         
-        # Perform health check
-        health = await rag_system.health_check()
+        # Refresh the cached health status right away
+        health = await get_health_monitor().check_now()
+        components = {name: c['ok'] for name, c in health['components'].items()}
         
-        if health.get('overall', False):
+        if health['ready']:
             return {
                 "success": True,
                 "message": "Chatbot system initialized successfully",
-                "components": {
-                    "embedding_system": health.get('embedding_system', False),
-                    "gemini_api": health.get('gemini_api', False)
-                }
+                "components": components
             }
         else:
+            errors = [f"{name}: {c['error']}" for name, c in health['components'].items() if c['error']]
             return {
                 "success": False,
                 "message": "Chatbot system initialization incomplete",
-                "error": health.get('error', 'Unknown error'),
-                "components": health
+                "error": "; ".join(errors) or 'Unknown error',
+                "components": components
             }
             
     except Exception as e:
@@ -296,25 +453,33 @@ async def initialize_system(recreate_index: bool = False):
         )
 
 
-async def _index_website_background(base_url: str, max_pages: int):
+async def _run_index_job(job: IndexJob) -> bool:
     """
-    Background task for website indexing.
+    Run an indexing job.
     
     Args:
-        base_url: Base URL to crawl
-        max_pages: Maximum number of pages to crawl
-    """
-    try:
-        logger.info(f"Background indexing started for {base_url}")
-        success = await index_website_data(base_url=base_url)
+        job: Registered job; its progress dict is updated while indexing
         
-        if success:
-            logger.info(f"Background indexing completed for {base_url}")
-        else:
-            logger.error(f"Background indexing failed for {base_url}")
-            
-    except Exception as e:
-        logger.error(f"Background indexing error: {str(e)}")
+    Returns:
+        True if indexing succeeded
+    """
+    logger.info(f"Indexing job {job.id} started for {job.base_url} (max {job.max_pages} pages)")
+    if job.recreate_index:
+        logger.info("Recreating vector index...")
+        embedding_manager = await get_embedding_manager()
+        await embedding_manager.initialize(recreate_index=True)
+    
+    success = await index_website_data(
+        base_url=job.base_url,
+        max_pages=job.max_pages,
+        progress=job.progress
+    )
+    
+    if success:
+        logger.info(f"Indexing job {job.id} completed for {job.base_url}")
+    else:
+        logger.error(f"Indexing job {job.id} failed for {job.base_url}")
+    return success
 
 
 @router.get("/stats")
@@ -343,9 +508,9 @@ async def get_system_stats():
             }
         }
         
-        # Add health status
-        health = await health_check()
-        stats["health"] = health
+        # Add cached health status and chat load
+        stats["health"] = await health_check()
+        stats["admission"] = get_chat_admission().stats()
         
         return stats
         
@@ -0,0 +1,243 @@
+"""
+Author: Trần Tuấn Anh
+Created at: 2026-10-19
+Updated at: 2026-10-19
+Description: Admission control for expensive UrbanReflex endpoints.
+             Combines per-key token buckets with a global concurrency cap,
+             a short priority wait queue and fast rejection.
+"""
+
+import asyncio
+import heapq
+import itertools
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Tuple
+from app.utils.rate_limit import TokenBucket
+from app.config.config import (
+    CHAT_MAX_CONCURRENT,
+    CHAT_MAX_QUEUE,
+    CHAT_QUEUE_TIMEOUT,
+    CHAT_SESSION_RATE,
+    CHAT_SESSION_BURST,
+    CHAT_CLIENT_RATE,
+    CHAT_CLIENT_BURST,
+)
+
+# Queue priorities, lower is served first
+PRIORITY_AUTHENTICATED = 0
+PRIORITY_ANONYMOUS = 1
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is shed instead of admitted."""
+
+    def __init__(self, reason: str, retry_after: float):
+        """
+        Args:
+            reason: 'rate_limited', 'queue_full' or 'queue_timeout'
+            retry_after: Suggested seconds before retrying
+        """
+        super().__init__(f"Request rejected: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Admits requests under per-key rate limits and a global concurrency cap.
+
+    Rate limits are checked first and fail fast. Admitted requests run
+    while fewer than max_concurrent are active; otherwise they wait in a
+    bounded priority queue for at most queue_timeout seconds.
+    """
+
+    def __init__(self, max_concurrent: int = CHAT_MAX_CONCURRENT, max_queue: int = CHAT_MAX_QUEUE,
+                 queue_timeout: float = CHAT_QUEUE_TIMEOUT, session_rate: float = CHAT_SESSION_RATE,
+                 session_burst: float = CHAT_SESSION_BURST, client_rate: float = CHAT_CLIENT_RATE,
+                 client_burst: float = CHAT_CLIENT_BURST, max_keys: int = 10000):
+        """
+        Initialize admission controller.
+
+        Args:
+            max_concurrent: Requests processed at once
+            max_queue: Requests allowed to wait for a slot
+            queue_timeout: Longest wait for a slot in seconds
+            session_rate: Requests per second per session
+            session_burst: Burst size per session
+            client_rate: Requests per second per client (user or IP)
+            client_burst: Burst size per client
+            max_keys: Buckets kept per kind; least recently used are evicted
+        """
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.session_limits = (session_rate, session_burst)
+        self.client_limits = (client_rate, client_burst)
+        self.max_keys = max_keys
+
+        self._session_buckets: 'OrderedDict[str, TokenBucket]' = OrderedDict()
+        self._client_buckets: 'OrderedDict[str, TokenBucket]' = OrderedDict()
+        self._active = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+
+        self.counters = {
+            'admitted': 0,
+            'queued': 0,
+            'rejected_rate_limited': 0,
+            'rejected_queue_full': 0,
+            'rejected_queue_timeout': 0
+        }
+        self.max_queue_depth_seen = 0
+
+    def _bucket(self, buckets: 'OrderedDict[str, TokenBucket]', key: str, limits: Tuple[float, float]) -> TokenBucket:
+        """Get or create the bucket for a key, evicting the least recently used."""
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(*limits)
+            buckets[key] = bucket
+            if len(buckets) > self.max_keys:
+                buckets.popitem(last=False)
+        else:
+            buckets.move_to_end(key)
+        return bucket
+
+    def check_rate(self, session_key: Optional[str], client_key: str):
+        """
+        Take a token from the session and client buckets.
+
+        Args:
+            session_key: Chat session ID, if any
+            client_key: Authenticated user or client IP
+
+        Raises:
+            AdmissionRejected: If either bucket is empty
+        """
+        buckets = [self._bucket(self._client_buckets, client_key, self.client_limits)]
+        if session_key:
+            buckets.append(self._bucket(self._session_buckets, session_key, self.session_limits))
+
+        waits = [bucket.time_until_available() for bucket in buckets]
+        if max(waits) > 0:
+            self.counters['rejected_rate_limited'] += 1
+            raise AdmissionRejected('rate_limited', max(waits))
+        for bucket in buckets:
+            bucket.try_acquire()
+
+    @property
+    def queue_depth(self) -> int:
+        """Requests currently waiting for a slot."""
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    async def acquire(self, priority: int = PRIORITY_ANONYMOUS):
+        """
+        Wait for a processing slot.
+
+        Args:
+            priority: Queue priority, lower is served first
+
+        Raises:
+            AdmissionRejected: If the queue is full or the wait times out
+        """
+        if self._active < self.max_concurrent and not self.queue_depth:
+            self._active += 1
+            self.counters['admitted'] += 1
+            return
+
+        if self.queue_depth >= self.max_queue:
+            self.counters['rejected_queue_full'] += 1
+            raise AdmissionRejected('queue_full', self.queue_timeout)
+
+        if len(self._waiters) > 2 * self.max_queue:
+            # Drop entries of waiters that gave up
+            self._waiters = [waiter for waiter in self._waiters if not waiter[2].done()]
+            heapq.heapify(self._waiters)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self.counters['queued'] += 1
+        self.max_queue_depth_seen = max(self.max_queue_depth_seen, self.queue_depth)
+
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.queue_timeout)
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as the wait ended
+                if isinstance(e, asyncio.TimeoutError):
+                    self.counters['admitted'] += 1
+                    return
+                self.release()
+                raise
+            future.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                self.counters['rejected_queue_timeout'] += 1
+                raise AdmissionRejected('queue_timeout', self.queue_timeout)
+            raise
+        self.counters['admitted'] += 1
+
+    def release(self):
+        """Hand the slot to the highest-priority waiter, or free it."""
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._active -= 1
+
+    @asynccontextmanager
+    async def admit(self, session_key: Optional[str], client_key: str, priority: int = PRIORITY_ANONYMOUS):
+        """
+        Rate-limit, then hold a processing slot for the duration of the block.
+
+        Args:
+            session_key: Chat session ID, if any
+            client_key: Authenticated user or client IP
+            priority: Queue priority, lower is served first
+
+        Raises:
+            AdmissionRejected: If the request is shed
+        """
+        self.check_rate(session_key, client_key)
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Current load and rejection counters for capacity planning.
+
+        Returns:
+            Dictionary with limits, active/queued requests and counters
+        """
+        return {
+            'max_concurrent': self.max_concurrent,
+            'max_queue': self.max_queue,
+            'active': self._active,
+            'queue_depth': self.queue_depth,
+            'max_queue_depth_seen': self.max_queue_depth_seen,
+            'tracked_sessions': len(self._session_buckets),
+            'tracked_clients': len(self._client_buckets),
+            **self.counters
+        }
+
+
+# Global admission controller for /chat
+_chat_admission = None
+
+
+def get_chat_admission() -> AdmissionController:
+    """
+    Get or create the admission controller for chat requests.
+
+    Returns:
+        AdmissionController instance
+    """
+    global _chat_admission
+
+    if _chat_admission is None:
+        _chat_admission = AdmissionController()
+
+    return _chat_admission
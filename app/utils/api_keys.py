@@ -0,0 +1,280 @@
+"""
+Author: Trần Tuấn Anh
+Created at: 2026-10-19
+Updated at: 2026-10-19
+Description: Stateless signed API keys for UrbanReflex /api/v1 consumers.
+             Keys carry their ID, scopes and expiry under an HMAC-SHA256
+             signature, so they are verified without any I/O. Revoked key
+             IDs are mirrored from MongoDB into memory on an interval.
+"""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set
+from fastapi import Depends, HTTPException, status
+from fastapi.security import APIKeyHeader
+from app.config.config import (
+    get_database,
+    SECRET_KEY,
+    DEFAULT_SECRET_KEY,
+    API_KEY_SECRET,
+    API_KEYS_REQUIRED,
+    API_KEY_MAX_DAYS,
+    API_KEY_REVOCATION_REFRESH,
+    AUTH_CACHE_TTL,
+    AUTH_CACHE_MAX_ENTRIES,
+)
+from app.utils.cache import TTLCache
+
+# Prefix identifying UrbanReflex keys (and their format version)
+API_KEY_PREFIX = "urk1_"
+
+api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
+
+# Claims of recently verified keys; revocation is checked separately
+verified_keys = TTLCache(AUTH_CACHE_TTL, AUTH_CACHE_MAX_ENTRIES)
+
+
+class InvalidAPIKey(Exception):
+    """Raised when an API key is malformed, forged or expired."""
+
+
+def _signing_key() -> bytes:
+    """
+    Resolve the HMAC key for API keys.
+
+    A dedicated API_KEY_SECRET is used when set. Otherwise a key is derived
+    from SECRET_KEY under its own label, so API keys never share the JWT
+    key; with the public default SECRET_KEY a random per-process key is used
+    instead, so keys cannot be forged (but do not survive a restart).
+
+    Returns:
+        Signing key bytes
+
+    Raises:
+        RuntimeError: If API_KEYS_REQUIRED is on without a dedicated secret
+    """
+    if API_KEY_SECRET and API_KEY_SECRET != DEFAULT_SECRET_KEY:
+        return API_KEY_SECRET.encode("utf-8")
+    if API_KEYS_REQUIRED:
+        raise RuntimeError("API_KEYS_REQUIRED is enabled but API_KEY_SECRET is not set to a private value")
+    if SECRET_KEY == DEFAULT_SECRET_KEY:
+        print("Warning: API_KEY_SECRET and SECRET_KEY are not set; API keys are only valid until restart")
+        return secrets.token_bytes(32)
+    return hmac.new(SECRET_KEY.encode("utf-8"), b"urbanreflex-api-keys-v1", hashlib.sha256).digest()
+
+
+_SIGNING_KEY = _signing_key()
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(_SIGNING_KEY, payload.encode("ascii"), hashlib.sha256).digest())
+
+
+def issue_api_key(scopes: List[str], expires_in: timedelta, key_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Create a signed API key.
+
+    Args:
+        scopes: Scopes granted to the key, e.g. ["read"]
+        expires_in: Key lifetime, capped at API_KEY_MAX_DAYS
+        key_id: Key identifier (random if omitted)
+
+    Returns:
+        Dictionary with 'api_key', 'key_id', 'scopes' and 'expires_at'
+    """
+    key_id = key_id or secrets.token_hex(8)
+    expires_in = min(expires_in, timedelta(days=API_KEY_MAX_DAYS))
+    expires_at = int(time.time() + expires_in.total_seconds())
+    claims = {"kid": key_id, "scopes": sorted(set(scopes)), "exp": expires_at}
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+    return {
+        "api_key": f"{API_KEY_PREFIX}{payload}.{_sign(payload)}",
+        "key_id": key_id,
+        "scopes": claims["scopes"],
+        "expires_at": datetime.utcfromtimestamp(expires_at)
+    }
+
+
+def decode_api_key(api_key: str) -> Dict[str, Any]:
+    """
+    Verify a key's signature and expiry.
+
+    The signature is compared in constant time before the payload is parsed.
+    Verified keys are cached until their expiry or the cache TTL.
+
+    Args:
+        api_key: Key as sent by the client
+
+    Returns:
+        Claims with 'kid', 'scopes' and 'exp'
+
+    Raises:
+        InvalidAPIKey: If the key is malformed, forged or expired
+    """
+    claims = verified_keys.get(api_key)
+    if claims is not None:
+        return claims
+
+    if not api_key.startswith(API_KEY_PREFIX):
+        raise InvalidAPIKey("Unknown API key format")
+    # Keys are pure ASCII; anything else cannot be signed or compared
+    if not api_key.isascii():
+        raise InvalidAPIKey("Malformed API key")
+    payload, _, signature = api_key[len(API_KEY_PREFIX):].partition(".")
+    if not payload or not signature:
+        raise InvalidAPIKey("Malformed API key")
+    if not hmac.compare_digest(_sign(payload), signature):
+        raise InvalidAPIKey("Invalid API key signature")
+
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        raise InvalidAPIKey("Malformed API key")
+    if not isinstance(claims, dict) or not isinstance(claims.get("exp"), (int, float)) or "kid" not in claims:
+        raise InvalidAPIKey("Malformed API key")
+    if claims["exp"] <= time.time():
+        raise InvalidAPIKey("API key expired")
+    verified_keys.set(api_key, claims, expires_at=claims["exp"])
+    return claims
+
+
+class RevocationList:
+    """
+    In-memory set of revoked key IDs, refreshed from MongoDB.
+
+    Requests only read the set; a background task reloads it every
+    refresh_interval seconds. Revocations made in this process apply
+    immediately, other processes pick them up on their next refresh.
+    """
+
+    collection_name = "api_key_revocations"
+
+    def __init__(self, refresh_interval: float = API_KEY_REVOCATION_REFRESH):
+        """
+        Initialize revocation list.
+
+        Args:
+            refresh_interval: Seconds between reloads from MongoDB
+        """
+        self.refresh_interval = refresh_interval
+        self.revoked: Set[str] = set()
+        self.refreshed_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def is_revoked(self, key_id: str) -> bool:
+        """Check a key ID against the last loaded revocations."""
+        return key_id in self.revoked
+
+    async def refresh(self):
+        """Reload revoked key IDs from MongoDB."""
+        collection = get_database()[self.collection_name]
+        revoked = set()
+        async for entry in collection.find({}, {"_id": 0, "key_id": 1}):
+            revoked.add(entry["key_id"])
+        self.revoked = revoked
+        self.refreshed_at = time.time()
+
+    async def revoke(self, key_id: str):
+        """
+        Revoke a key for all processes.
+
+        The record expires once any key with this ID must have expired.
+
+        Args:
+            key_id: Key identifier
+        """
+        now = datetime.utcnow()
+        await get_database()[self.collection_name].update_one(
+            {"key_id": key_id},
+            {"$setOnInsert": {
+                "key_id": key_id,
+                "revoked_at": now,
+                "expires_at": now + timedelta(days=API_KEY_MAX_DAYS)
+            }},
+            upsert=True
+        )
+        self.revoked.add(key_id)
+
+    def start(self):
+        """Start the refresh loop (idempotent)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the refresh loop."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                # Keep serving the last known revocations
+                print(f"Error refreshing API key revocations: {str(e)}")
+            await asyncio.sleep(self.refresh_interval)
+
+
+# Global revocation list
+_revocation_list = None
+
+
+def get_revocation_list() -> RevocationList:
+    """
+    Get or create the API key revocation list.
+
+    Returns:
+        RevocationList instance
+    """
+    global _revocation_list
+
+    if _revocation_list is None:
+        _revocation_list = RevocationList()
+
+    return _revocation_list
+
+
+def require_api_key(scope: Optional[str] = None):
+    """
+    Build a dependency that requires a valid API key.
+
+    Args:
+        scope: Scope the key must grant, if any
+
+    Returns:
+        Dependency returning the key's claims
+    """
+    async def dependency(api_key: Optional[str] = Depends(api_key_header)) -> Dict[str, Any]:
+        if not api_key:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing API key")
+        try:
+            claims = decode_api_key(api_key)
+        except InvalidAPIKey as e:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(e))
+        if get_revocation_list().is_revoked(claims["kid"]):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="API key revoked")
+        if scope and scope not in claims.get("scopes", []):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"API key lacks scope '{scope}'")
+        return claims
+
+    return dependency
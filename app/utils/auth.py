@@ -1,24 +1,50 @@
 """
 Author: Trần Tuấn Anh
 Created at: 2025-11-19
-Updated at: 2025-11-19
+Updated at: 2026-10-19
 Description: Authentication utilities for UrbanReflex.
              Includes password hashing, JWT token creation, and user verification.
 """
 
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from app.config.config import get_database, SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
+from app.config.config import (
+    get_database,
+    SECRET_KEY,
+    ALGORITHM,
+    ACCESS_TOKEN_EXPIRE_MINUTES,
+    PASSWORD_HASH_ROUNDS,
+    PASSWORD_HASH_WORKERS,
+    AUTH_CACHE_TTL,
+    AUTH_CACHE_MAX_ENTRIES,
+)
 from app.schemas.user import TokenData
+from app.utils.cache import TTLCache
 from app.utils.db import serialize_doc
 
-pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+# Hashes below the configured rounds are upgraded on the next successful login
+pwd_context = CryptContext(
+    schemes=["pbkdf2_sha256"],
+    deprecated="auto",
+    pbkdf2_sha256__default_rounds=PASSWORD_HASH_ROUNDS,
+    pbkdf2_sha256__min_rounds=PASSWORD_HASH_ROUNDS,
+)
+# Hashing is CPU-bound; the pool size caps how many run at once
+password_executor = ThreadPoolExecutor(max_workers=max(1, PASSWORD_HASH_WORKERS), thread_name_prefix="password")
+
+# Decoded tokens (token -> (username, exp)) and users by username; entries
+# never outlive the token that loaded them
+token_cache = TTLCache(AUTH_CACHE_TTL, AUTH_CACHE_MAX_ENTRIES)
+user_cache = TTLCache(AUTH_CACHE_TTL, AUTH_CACHE_MAX_ENTRIES)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login", auto_error=False)
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -26,6 +52,26 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verify a password off the event loop.
+
+    Args:
+        plain_password: Password supplied by the user
+        hashed_password: Stored hash
+
+    Returns:
+        Tuple of (valid, new_hash); new_hash is set when the stored hash
+        should be replaced because its rounds are out of date
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, pwd_context.verify_and_update, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """Hash a password off the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, pwd_context.hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -36,24 +82,64 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def invalidate_user(username: Optional[str]):
+    """Drop a cached user so the next request reloads it from the database."""
+    if username:
+        user_cache.delete(username)
+
+def decode_token_cached(token: str) -> Optional[Tuple[str, Optional[float]]]:
+    """
+    Verify a JWT, reusing earlier decodes of the same token.
+
+    Args:
+        token: Bearer token
+
+    Returns:
+        Tuple of (username, exp), or None if the token is invalid or expired
+    """
+    cached = token_cache.get(token)
+    if cached is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            username: str = payload.get("sub")
+            if username is None:
+                return None
+            token_data = TokenData(username=username)
+        except JWTError:
+            return None
+        cached = (token_data.username, payload.get("exp"))
+        token_cache.set(token, cached, expires_at=cached[1])
+    return cached
+
 async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncIOMotorDatabase = Depends(get_database)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = TokenData(username=username)
-    except JWTError:
+    cached = decode_token_cached(token)
+    if cached is None:
         raise credentials_exception
-    user = await db.users.find_one({"username": token_data.username})
+    username, expires_at = cached
+
+    user = user_cache.get(username)
     if user is None:
-        raise credentials_exception
-    return serialize_doc(user)
+        user = await db.users.find_one({"username": username})
+        if user is None:
+            raise credentials_exception
+        user = serialize_doc(user)
+        user_cache.set(username, user, expires_at=expires_at)
+    # Handlers get their own copy of the cached document
+    return dict(user)
+
+async def get_optional_user(token: Optional[str] = Depends(optional_oauth2_scheme), db: AsyncIOMotorDatabase = Depends(get_database)):
+    """Return the authenticated user, or None for anonymous or invalid credentials."""
+    if not token:
+        return None
+    try:
+        return await get_current_user(token, db)
+    except HTTPException:
+        return None
 
 async def get_current_admin(current_user = Depends(get_current_user)):
     if not current_user.get("is_admin", False):
@@ -0,0 +1,90 @@
+"""
+Author: Trần Tuấn Anh
+Created at: 2026-10-19
+Updated at: 2026-10-19
+Description: Small in-process caches for UrbanReflex.
+             Bounded LRU mapping whose entries also expire at a given time.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class TTLCache:
+    """
+    LRU cache with a per-entry expiry time.
+
+    Entries expire after `ttl` seconds, or earlier when set() is given a
+    sooner deadline. The least recently used entry is evicted once
+    max_entries is exceeded.
+    """
+
+    def __init__(self, ttl: float, max_entries: int):
+        """
+        Initialize cache.
+
+        Args:
+            ttl: Longest lifetime of an entry in seconds
+            max_entries: Entries kept before evicting the least recently used
+        """
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._entries: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Return a live entry, or None if missing or expired.
+
+        Args:
+            key: Cache key
+
+        Returns:
+            Cached value or None
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, expires_at = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, expires_at: Optional[float] = None):
+        """
+        Store a value.
+
+        Args:
+            key: Cache key
+            value: Value to store
+            expires_at: Optional Unix time after which the entry must not be served
+        """
+        deadline = time.time() + self.ttl
+        if expires_at is not None:
+            deadline = min(deadline, expires_at)
+        self._entries[key] = (value, deadline)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        """Drop an entry if present."""
+        self._entries.pop(key, None)
+
+    def clear(self):
+        """Drop all entries."""
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        """Entry count and hit/miss counters."""
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
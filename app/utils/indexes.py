@@ -0,0 +1,89 @@
+"""
+Author: Trần Tuấn Anh
+Created at: 2026-10-19
+Updated at: 2026-10-19
+Description: MongoDB index bootstrap for UrbanReflex.
+             Declares the indexes behind hot queries and creates them
+             idempotently at startup.
+"""
+
+import logging
+from typing import Dict, List
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from app.config.config import CHAT_SESSION_TTL_DAYS
+
+logger = logging.getLogger(__name__)
+
+# MongoDB error code for an existing index with different options
+INDEX_OPTIONS_CONFLICT = 85
+
+# Indexes per collection. Login and register query users with $or on email
+# and username, which is answered by one index per branch.
+INDEX_SPECS: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True, name="email_unique"),
+        IndexModel([("username", ASCENDING)], unique=True, name="username_unique"),
+    ],
+    "chat_sessions": [
+        IndexModel([("session_id", ASCENDING)], unique=True, name="session_id_unique"),
+        IndexModel(
+            [("updated_at", ASCENDING)],
+            expireAfterSeconds=CHAT_SESSION_TTL_DAYS * 24 * 3600,
+            name="updated_at_ttl"
+        ),
+    ],
+    "api_key_revocations": [
+        IndexModel([("key_id", ASCENDING)], unique=True, name="key_id_unique"),
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl"),
+    ],
+}
+
+
+async def _update_ttl(db: AsyncIOMotorDatabase, collection: str, index: IndexModel):
+    """Apply a changed expireAfterSeconds to an existing TTL index."""
+    await db.command({
+        "collMod": collection,
+        "index": {
+            "name": index.document["name"],
+            "expireAfterSeconds": index.document["expireAfterSeconds"]
+        }
+    })
+
+
+async def ensure_indexes(db: AsyncIOMotorDatabase) -> Dict[str, List[str]]:
+    """
+    Create every declared index; indexes that already exist are left alone.
+
+    A TTL index whose expiry changed is updated in place with collMod.
+    Failures (e.g. duplicate data blocking a unique index) are logged per
+    index so the remaining indexes are still created.
+
+    Args:
+        db: MongoDB database instance
+
+    Returns:
+        Mapping of collection name to the index names now in place
+    """
+    created: Dict[str, List[str]] = {}
+    for collection, indexes in INDEX_SPECS.items():
+        for index in indexes:
+            name = index.document["name"]
+            try:
+                await db[collection].create_indexes([index])
+            except OperationFailure as e:
+                if e.code == INDEX_OPTIONS_CONFLICT and "expireAfterSeconds" in index.document:
+                    try:
+                        await _update_ttl(db, collection, index)
+                    except Exception as mod_error:
+                        logger.error(f"Error updating TTL of {collection}.{name}: {str(mod_error)}")
+                        continue
+                else:
+                    logger.error(f"Error creating index {collection}.{name}: {str(e)}")
+                    continue
+            except Exception as e:
+                logger.error(f"Error creating index {collection}.{name}: {str(e)}")
+                continue
+            created.setdefault(collection, []).append(name)
+    return created
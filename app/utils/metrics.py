@@ -0,0 +1,256 @@
+"""
+Author: Trần Tuấn Anh
+Created at: 2026-10-19
+Updated at: 2026-10-19
+Description: In-process latency metrics for UrbanReflex.
+             Fixed-bucket histograms per stage plus a ring buffer of slow
+             request samples, and MongoDB connection pool metrics.
+"""
+
+import bisect
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+from pymongo import monitoring
+from app.config.config import SLOW_REQUEST_THRESHOLD, SLOW_REQUEST_SAMPLES
+
+# Histogram bucket upper bounds in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class LatencyHistogram:
+    """Latency histogram with fixed bucket upper bounds."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Initialize histogram.
+
+        Args:
+            buckets: Sorted bucket upper bounds in seconds
+        """
+        self.bounds = list(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)  # Last bucket is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        """Record one observation."""
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        Estimate a quantile as the upper bound of the bucket containing it.
+
+        Args:
+            q: Quantile between 0 and 1
+
+        Returns:
+            Estimated latency in seconds, or None without observations
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds + [self.max], self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize counts, mean and estimated percentiles."""
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'max': self.max,
+            'buckets': {
+                **{f"le_{bound:g}": count for bound, count in zip(self.bounds, self.counts)},
+                'le_inf': self.counts[-1]
+            }
+        }
+
+
+class LatencyRecorder:
+    """
+    Per-stage latency histograms and slow request samples for one endpoint.
+    """
+
+    def __init__(self, slow_threshold: float = SLOW_REQUEST_THRESHOLD, max_samples: int = SLOW_REQUEST_SAMPLES):
+        """
+        Initialize recorder.
+
+        Args:
+            slow_threshold: Total seconds above which a request is sampled
+            max_samples: Number of slow samples kept
+        """
+        self.slow_threshold = slow_threshold
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.slow_samples: deque = deque(maxlen=max_samples)
+
+    def observe(self, stage: str, seconds: float):
+        """Record a duration for one stage."""
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = LatencyHistogram()
+        histogram.observe(seconds)
+
+    def record(self, timings: Dict[str, float], total: float, **sample: Any):
+        """
+        Record a request's stage timings and keep it if slow.
+
+        Args:
+            timings: Seconds per stage
+            total: Total seconds for the request
+            **sample: Extra fields stored with a slow sample
+        """
+        for stage, seconds in timings.items():
+            self.observe(stage, seconds)
+        self.observe('total', total)
+
+        if total >= self.slow_threshold:
+            self.slow_samples.append({
+                'timestamp': time.time(),
+                'total': total,
+                'timings': dict(timings),
+                **sample
+            })
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Return histograms and slow samples.
+
+        Returns:
+            Dictionary with 'stages' and 'slow_requests' (newest first)
+        """
+        return {
+            'slow_threshold': self.slow_threshold,
+            'stages': {stage: histogram.to_dict() for stage, histogram in self.histograms.items()},
+            'slow_requests': list(reversed(self.slow_samples))
+        }
+
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    Connection pool listener counting connections and checkout waits.
+
+    PyMongo calls listeners from driver threads, so updates take a lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open_connections = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures: Dict[str, int] = {}
+        self.pool_clears = 0
+        self.checkout_wait = LatencyHistogram()
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open_connections += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open_connections -= 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures[event.reason] = self.checkout_failures.get(event.reason, 0) + 1
+            if event.duration is not None:
+                self.checkout_wait.observe(event.duration)
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            if event.duration is not None:
+                self.checkout_wait.observe(event.duration)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Current pool usage and checkout wait times.
+
+        Returns:
+            Dictionary with connection counts, failures and a wait histogram
+        """
+        with self._lock:
+            return {
+                'open_connections': self.open_connections,
+                'checked_out': self.checked_out,
+                'max_checked_out': self.max_checked_out,
+                'checkouts': self.checkouts,
+                'checkout_failures': dict(self.checkout_failures),
+                'pool_clears': self.pool_clears,
+                'checkout_wait': self.checkout_wait.to_dict()
+            }
+
+
+# Global pool metrics for the MongoDB client
+_mongo_pool_metrics = None
+
+
+def get_mongo_pool_metrics() -> MongoPoolMetrics:
+    """
+    Get or create the MongoDB connection pool listener.
+
+    Returns:
+        MongoPoolMetrics instance
+    """
+    global _mongo_pool_metrics
+
+    if _mongo_pool_metrics is None:
+        _mongo_pool_metrics = MongoPoolMetrics()
+
+    return _mongo_pool_metrics
+
+
+# Global recorder for chat turns
+_chat_latency = None
+
+
+def get_chat_latency() -> LatencyRecorder:
+    """
+    Get or create the latency recorder for chat turns.
+
+    Returns:
+        LatencyRecorder instance
+    """
+    global _chat_latency
+
+    if _chat_latency is None:
+        _chat_latency = LatencyRecorder()
+
+    return _chat_latency
@@ -0,0 +1,192 @@
+"""
+Author: Trần Tuấn Anh
+Created at: 2026-10-19
+Updated at: 2026-10-19
+Description: Rate limiting primitives for UrbanReflex.
+             Includes asyncio-friendly fixed and adaptive token buckets and
+             a bounded per-key GCRA table.
+"""
+
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from typing import Hashable, NamedTuple, Optional
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter.
+
+    Tokens refill continuously at `rate` per second up to `capacity`.
+    `try_acquire` never waits; `acquire` sleeps until tokens are available.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        """
+        Initialize token bucket.
+
+        Args:
+            rate: Tokens added per second
+            capacity: Maximum number of tokens (burst size)
+        """
+        if rate <= 0 or capacity <= 0:
+            raise ValueError("rate and capacity must be positive")
+
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        """Add tokens accrued since the last update."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """
+        Take tokens if available, without waiting.
+
+        Args:
+            tokens: Number of tokens to take
+
+        Returns:
+            True if the tokens were taken
+        """
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    def time_until_available(self, tokens: float = 1.0) -> float:
+        """
+        Seconds until the requested tokens will be available.
+
+        Args:
+            tokens: Number of tokens needed
+
+        Returns:
+            Wait time in seconds (0 if available now)
+        """
+        self._refill()
+        return max(0.0, (tokens - self.tokens) / self.rate)
+
+    async def acquire(self, tokens: float = 1.0):
+        """
+        Wait until tokens are available and take them.
+
+        Waiters are served in arrival order.
+
+        Args:
+            tokens: Number of tokens to take
+        """
+        async with self._lock:
+            while not self.try_acquire(tokens):
+                await asyncio.sleep(self.time_until_available(tokens))
+
+
+class AdaptiveTokenBucket(TokenBucket):
+    """
+    Token bucket whose rate adapts to backpressure (AIMD).
+
+    The rate grows additively after successful calls and is halved when
+    the remote service signals throttling.
+    """
+
+    def __init__(self, rate: float, capacity: float, min_rate: float, max_rate: float, increase: float = None):
+        """
+        Initialize adaptive token bucket.
+
+        Args:
+            rate: Initial tokens per second
+            capacity: Maximum number of tokens (burst size)
+            min_rate: Lowest rate after repeated throttling
+            max_rate: Highest rate reached by additive increase
+            increase: Rate added per success (defaults to 5% of max_rate)
+        """
+        super().__init__(rate, capacity)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase if increase is not None else max_rate * 0.05
+
+    def on_success(self):
+        """Additively increase the rate after a successful call."""
+        self._refill()
+        self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self):
+        """Halve the rate and drop accumulated burst after throttling."""
+        self._refill()
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = min(self.tokens, 0.0)
+
+
+class RateLimitDecision(NamedTuple):
+    """Outcome of a GCRA check."""
+    allowed: bool
+    remaining: int  # requests still allowed right now
+    reset: float  # seconds until the full limit is available again
+    retry_after: float  # seconds until the next request is allowed (0 if allowed)
+
+
+class GCRALimiter:
+    """
+    Generic cell rate algorithm: `limit` requests per `period` per key.
+
+    Equivalent to a sliding window that allows bursts of up to `limit`,
+    but stores a single float per key (the theoretical arrival time), so
+    each check is O(1). Keys live in a bounded LRU table; evicting an idle
+    key only forgets credit it would have regained anyway.
+    """
+
+    def __init__(self, limit: int, period: float, max_keys: int = 100000):
+        """
+        Initialize limiter.
+
+        Args:
+            limit: Requests allowed per period (also the burst size)
+            period: Window length in seconds
+            max_keys: Keys tracked before evicting the least recently used
+        """
+        if limit <= 0 or period <= 0:
+            raise ValueError("limit and period must be positive")
+
+        self.limit = limit
+        self.period = period
+        self.interval = period / limit
+        self.max_keys = max(1, max_keys)
+        self._tats: 'OrderedDict[Hashable, float]' = OrderedDict()
+
+    def hit(self, key: Hashable, now: Optional[float] = None) -> RateLimitDecision:
+        """
+        Count one request for a key if it is within the limit.
+
+        Args:
+            key: Client key (API key, user or IP)
+            now: Current monotonic time (defaults to time.monotonic())
+
+        Returns:
+            RateLimitDecision for the request
+        """
+        if now is None:
+            now = time.monotonic()
+        tats = self._tats
+        tat = max(tats.get(key, now), now)
+        new_tat = tat + self.interval
+        allow_at = new_tat - self.period
+
+        if now < allow_at:
+            return RateLimitDecision(False, 0, tat - now, allow_at - now)
+
+        tats[key] = new_tat
+        tats.move_to_end(key)
+        if len(tats) > self.max_keys:
+            tats.popitem(last=False)
+        remaining = min(self.limit, math.floor((now - allow_at) / self.interval + 1e-9))
+        return RateLimitDecision(True, remaining, new_tat - now, 0.0)
+
+    def __len__(self) -> int:
+        return len(self._tats)
@@ -0,0 +1,188 @@
+"""
+Author: Trần Tuấn Anh
+Created at: 2026-10-19
+Updated at: 2026-10-19
+Description: Per-client rate limiting middleware for UrbanReflex.
+             Applies GCRA limits per route rule to each API key, user or IP
+             and reports them with RateLimit response headers.
+"""
+
+import math
+import time
+from typing import List, Optional, Tuple
+from app.utils.rate_limit import GCRALimiter
+from app.utils.api_keys import decode_api_key
+from app.utils.auth import decode_token_cached
+from app.utils.responses import dumps
+from app.config.config import (
+    RATE_LIMIT_DEFAULT,
+    RATE_LIMIT_ROUTES,
+    RATE_LIMIT_MAX_KEYS,
+)
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+def parse_rate(rate: str) -> Optional[Tuple[int, int]]:
+    """
+    Parse a rate such as "10/minute".
+
+    Args:
+        rate: "N/second", "N/minute", "N/hour", "N/day" or "off"
+
+    Returns:
+        Tuple of (limit, period seconds), or None for "off"
+
+    Raises:
+        ValueError: If the rate is malformed
+    """
+    rate = rate.strip().lower()
+    if rate == "off":
+        return None
+    count, _, unit = rate.partition("/")
+    if unit not in PERIODS:
+        raise ValueError(f"Invalid rate limit '{rate}'")
+    return int(count), PERIODS[unit]
+
+
+class RateLimitRule:
+    """A limit applied to requests matching a method and path prefix."""
+
+    def __init__(self, method: str, prefix: str, rate: str, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        """
+        Initialize rule.
+
+        Args:
+            method: HTTP method, or "*" for any
+            prefix: Path prefix the rule applies to
+            rate: Rate such as "10/minute", or "off" to exempt the route
+            max_keys: Clients tracked for this rule
+        """
+        self.method = method.upper()
+        self.prefix = prefix
+        self.name = f"{self.method} {prefix or '/'}"
+        parsed = parse_rate(rate)
+        self.limiter = GCRALimiter(parsed[0], parsed[1], max_keys) if parsed else None
+        # RateLimit-Policy header value, e.g. "10;w=60"
+        self.policy = f"{parsed[0]};w={parsed[1]}".encode("ascii") if parsed else b""
+
+    def matches(self, method: str, path: str) -> bool:
+        return (self.method == "*" or self.method == method) and path.startswith(self.prefix)
+
+
+def parse_rules(routes: str, default: str) -> List[RateLimitRule]:
+    """
+    Build rules from the RATE_LIMIT_ROUTES format, most specific first.
+
+    Args:
+        routes: Comma-separated "METHOD /prefix=rate" entries
+        default: Rate for requests matching no entry
+
+    Returns:
+        Rules ordered by descending prefix length, ending with the default
+    """
+    rules = []
+    for entry in filter(None, (part.strip() for part in routes.split(","))):
+        route, _, rate = entry.rpartition("=")
+        method, _, prefix = route.strip().partition(" ")
+        rules.append(RateLimitRule(method, prefix.strip(), rate))
+    rules.sort(key=lambda rule: (len(rule.prefix), rule.method != "*"), reverse=True)
+    rules.append(RateLimitRule("*", "", default))
+    return rules
+
+
+def client_key(scope) -> str:
+    """
+    Identify the client: verified API key, then verified user, then IP.
+
+    Unverifiable credentials fall back to the IP so forged keys cannot be
+    used to spread requests over fresh buckets.
+    """
+    api_key = authorization = None
+    for name, value in scope["headers"]:
+        if name == b"x-api-key":
+            api_key = value
+        elif name == b"authorization":
+            authorization = value
+
+    if api_key:
+        try:
+            return f"key:{decode_api_key(api_key.decode('latin-1'))['kid']}"
+        except Exception:
+            # Any undecodable key is treated like a missing one; never fail the request
+            pass
+    if authorization and authorization[:7].lower() == b"bearer ":
+        claims = decode_token_cached(authorization[7:].decode("latin-1"))
+        if claims is not None:
+            return f"user:{claims[0]}"
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware enforcing per-client limits for each route rule.
+
+    Allowed responses carry RateLimit-Limit, RateLimit-Remaining,
+    RateLimit-Reset and RateLimit-Policy headers; rejected requests get a
+    429 with the same headers plus Retry-After.
+    """
+
+    def __init__(self, app, routes: str = RATE_LIMIT_ROUTES, default: str = RATE_LIMIT_DEFAULT):
+        """
+        Initialize middleware.
+
+        Args:
+            app: Wrapped ASGI application
+            routes: Per-route rules in the RATE_LIMIT_ROUTES format
+            default: Rate for requests matching no rule
+        """
+        self.app = app
+        self.rules = parse_rules(routes, default)
+
+    def match(self, method: str, path: str) -> RateLimitRule:
+        """Return the most specific rule for a request."""
+        for rule in self.rules:
+            if rule.matches(method, path):
+                return rule
+        return self.rules[-1]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        rule = self.match(scope["method"], scope["path"])
+        if rule.limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        decision = rule.limiter.hit(client_key(scope), time.monotonic())
+        headers = [
+            (b"ratelimit-limit", str(rule.limiter.limit).encode("ascii")),
+            (b"ratelimit-remaining", str(decision.remaining).encode("ascii")),
+            (b"ratelimit-reset", str(math.ceil(decision.reset)).encode("ascii")),
+            (b"ratelimit-policy", rule.policy),
+        ]
+
+        if not decision.allowed:
+            body = dumps({"detail": "Rate limit exceeded"})
+            await send({
+                "type": "http.response.start",
+                "status": 429,
+                "headers": headers + [
+                    (b"retry-after", str(math.ceil(decision.retry_after)).encode("ascii")),
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode("ascii")),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
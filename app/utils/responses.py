@@ -0,0 +1,54 @@
+"""
+Author: Trần Tuấn Anh
+Created at: 2026-10-19
+Updated at: 2026-10-19
+Description: orjson-based JSON responses for UrbanReflex.
+             Serializes MongoDB documents directly, without copying them to
+             stringify ObjectId values first.
+"""
+
+from datetime import date, datetime
+from typing import Any
+import orjson
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+
+
+def orjson_default(obj: Any) -> Any:
+    """
+    Serialize types orjson does not handle natively.
+
+    orjson already encodes datetime, date and time; subclasses such as
+    bson's datetimes are routed here and formatted the same way.
+
+    Args:
+        obj: Object orjson could not serialize
+
+    Returns:
+        JSON-compatible replacement
+
+    Raises:
+        TypeError: If the type is not supported
+    """
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Encode content to JSON bytes with ObjectId support."""
+    return orjson.dumps(content, default=orjson_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class MongoJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson.
+
+    Endpoints may return raw MongoDB documents in this response directly;
+    ObjectId values are written as strings.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
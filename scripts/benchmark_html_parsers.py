@@ -0,0 +1,73 @@
+"""
+Author: Trần Tuấn Anh
+Created at: 2026-10-19
+Updated at: 2026-10-19
+Description: Micro-benchmark for the crawler's HTML extraction backends.
+             Runs every installed backend over saved pages and reports
+             per-page latency and throughput.
+
+Usage:
+    python scripts/benchmark_html_parsers.py data/pages --repeat 5
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+from app.ai_service.chatbot.html_extract import available_backends, extract_page  # noqa: E402
+
+
+def load_pages(directory: Path):
+    """Load saved .html/.htm pages from a directory."""
+    pages = []
+    for path in sorted(directory.rglob("*")):
+        if path.suffix.lower() in (".html", ".htm"):
+            pages.append(path.read_text(encoding="utf-8", errors="replace"))
+    return pages
+
+
+def benchmark(backend, pages, repeat):
+    """Time extract_page for every page, repeated `repeat` times."""
+    # Warm up imports and caches
+    extract_page(pages[0], backend)
+
+    durations = []
+    for _ in range(repeat):
+        for html in pages:
+            start = time.perf_counter()
+            extract_page(html, backend)
+            durations.append(time.perf_counter() - start)
+    return durations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HTML extraction backends")
+    parser.add_argument("pages_dir", type=Path, help="Directory containing saved .html pages")
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the page set")
+    parser.add_argument("--backend", action="append", help="Backend to test (default: all installed)")
+    args = parser.parse_args()
+
+    pages = load_pages(args.pages_dir)
+    if not pages:
+        print(f"No .html pages found in {args.pages_dir}")
+        sys.exit(1)
+
+    total_bytes = sum(len(html.encode("utf-8")) for html in pages)
+    print(f"{len(pages)} pages, {total_bytes / 1024:.0f} KiB, {args.repeat} passes\n")
+    print(f"{'backend':<12} {'mean ms':>9} {'p95 ms':>9} {'pages/s':>9} {'MiB/s':>8}")
+
+    for backend in args.backend or available_backends():
+        durations = benchmark(backend, pages, args.repeat)
+        total = sum(durations)
+        p95 = statistics.quantiles(durations, n=20)[-1] if len(durations) > 1 else durations[0]
+        print(
+            f"{backend:<12} {statistics.mean(durations) * 1000:>9.2f} {p95 * 1000:>9.2f} "
+            f"{len(durations) / total:>9.0f} {total_bytes * args.repeat / total / 2**20:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Author: Trần Tuấn Anh
+Created at: 2026-10-19
+Updated at: 2026-10-19
+Description: Micro-benchmark for JSON response serialization.
+             Compares the stdlib JSONResponse path with the orjson
+             MongoJSONResponse for the admin user listing and chat replies.
+
+Usage:
+    python scripts/benchmark_json_responses.py --users 500 --repeat 200
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+sys.path.append(str(Path(__file__).parent.parent))
+from app.utils.db import serialize_doc  # noqa: E402
+from app.utils.responses import MongoJSONResponse  # noqa: E402
+from app.routers.chatbot import ChatResponse  # noqa: E402
+
+
+def make_users(count):
+    """User documents as returned by the admin listing projection."""
+    return [
+        {
+            "_id": ObjectId(),
+            "email": f"user{i}@example.com",
+            "username": f"user{i}",
+            "full_name": f"Nguyễn Văn {i}",
+            "phone": "0901234567",
+            "latitude": 10.77 + i / 1e4,
+            "longitude": 106.70 + i / 1e4,
+            "is_admin": i % 50 == 0,
+            "created_at": datetime.utcnow(),
+        }
+        for i in range(count)
+    ]
+
+
+def make_chat_response():
+    """A chat reply with a typical number of sources and links."""
+    return ChatResponse(
+        response="Để báo cáo sự cố, hãy mở trang Báo cáo và làm theo các bước sau. " * 20,
+        sources=[
+            {"title": f"Hướng dẫn {i}", "url": f"https://urbanreflex.vn/docs/{i}", "score": 0.9 - i / 100}
+            for i in range(5)
+        ],
+        web_links=[{"title": f"Link {i}", "url": f"https://urbanreflex.vn/{i}"} for i in range(5)],
+        context_used=True,
+        query="Làm thế nào để báo cáo đèn đường hỏng?",
+        session_id="session-1",
+        processing_time=1.23,
+        timings={"history": 0.01, "retrieval": 0.2, "generation": 1.0},
+    )
+
+
+def measure(fn, repeat):
+    """Median and p95 of fn() over `repeat` runs, in milliseconds."""
+    fn()
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append((time.perf_counter() - start) * 1000)
+    durations.sort()
+    return statistics.median(durations), durations[int(0.95 * (len(durations) - 1))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSON response serialization")
+    parser.add_argument("--users", type=int, default=500, help="Users in the admin page")
+    parser.add_argument("--repeat", type=int, default=200, help="Runs per case")
+    args = parser.parse_args()
+
+    users = make_users(args.users)
+    page = {"users": users, "next_cursor": None}
+    chat = make_chat_response()
+    adapter = TypeAdapter(ChatResponse)
+
+    cases = [
+        # How FastAPI renders a dict endpoint with the default JSONResponse
+        (f"/admin/users ({args.users}) stdlib", lambda: JSONResponse(
+            jsonable_encoder({"users": [serialize_doc(u) for u in users], "next_cursor": None}))),
+        (f"/admin/users ({args.users}) orjson", lambda: MongoJSONResponse(page)),
+        # Response-model endpoints: Pydantic straight to bytes vs. dict + encoder
+        ("/chat pydantic dump_json", lambda: adapter.dump_json(chat)),
+        ("/chat stdlib", lambda: JSONResponse(adapter.dump_python(chat, mode="json"))),
+        ("/chat orjson", lambda: MongoJSONResponse(adapter.dump_python(chat, mode="json"))),
+    ]
+
+    print(f"{'case':<34} {'median ms':>10} {'p95 ms':>9}")
+    for name, fn in cases:
+        median, p95 = measure(fn, args.repeat)
+        print(f"{name:<34} {median:>10.3f} {p95:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Author: Trần Tuấn Anh
+Created at: 2026-10-19
+Updated at: 2026-10-19
+Description: Benchmark for password verification during login bursts.
+             Compares verifying inline on the event loop with the bounded
+             password thread pool, reporting login throughput and the
+             latency seen by a concurrent lightweight route.
+
+Usage:
+    python scripts/benchmark_password_hashing.py --logins 200 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+from app.utils.auth import pwd_context, verify_password, verify_password_async  # noqa: E402
+from app.config.config import PASSWORD_HASH_ROUNDS, PASSWORD_HASH_WORKERS  # noqa: E402
+
+
+async def login_inline(password, hashed):
+    """Login handler as before: verify on the event loop."""
+    return verify_password(password, hashed)
+
+
+async def login_pooled(password, hashed):
+    """Login handler verifying in the password thread pool."""
+    valid, _ = await verify_password_async(password, hashed)
+    return valid
+
+
+async def ping_route(stop: asyncio.Event, interval: float, latencies):
+    """Stand-in for other routes: how late does a 1 ms tick get served."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        latencies.append(time.perf_counter() - start - interval)
+
+
+async def run(handler, hashed, logins, concurrency):
+    """Run a burst of logins while measuring loop responsiveness."""
+    semaphore = asyncio.Semaphore(concurrency)
+    stop = asyncio.Event()
+    latencies = []
+    ticker = asyncio.create_task(ping_route(stop, 0.001, latencies))
+
+    async def one():
+        async with semaphore:
+            assert await handler("correct horse", hashed)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await ticker
+    return elapsed, latencies
+
+
+def percentile(values, q):
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark password hashing during login bursts")
+    parser.add_argument("--logins", type=int, default=200, help="Logins in the burst")
+    parser.add_argument("--concurrency", type=int, default=50, help="Concurrent login requests")
+    args = parser.parse_args()
+
+    hashed = pwd_context.hash("correct horse")
+    print(f"pbkdf2_sha256 rounds={PASSWORD_HASH_ROUNDS}, pool workers={PASSWORD_HASH_WORKERS}")
+    print(f"{args.logins} logins, {args.concurrency} concurrent\n")
+    print(f"{'mode':<8} {'logins/s':>9} {'other p50 ms':>13} {'other p99 ms':>13} {'other max ms':>13}")
+
+    for name, handler in (("inline", login_inline), ("pooled", login_pooled)):
+        elapsed, latencies = asyncio.run(run(handler, hashed, args.logins, args.concurrency))
+        latencies = latencies or [0.0]
+        print(
+            f"{name:<8} {args.logins / elapsed:>9.1f} "
+            f"{statistics.median(latencies) * 1000:>13.2f} "
+            f"{percentile(latencies, 0.99) * 1000:>13.2f} "
+            f"{max(latencies) * 1000:>13.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
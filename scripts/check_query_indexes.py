@@ -0,0 +1,66 @@
+"""
+Author: Trần Tuấn Anh
+Created at: 2026-10-19
+Updated at: 2026-10-19
+Description: Checks that the backend's hot MongoDB queries use an index.
+             Bootstraps indexes, explains each query and fails if any
+             winning plan contains a collection scan.
+
+Usage:
+    MONGODB_URL=mongodb://localhost:27017 python scripts/check_query_indexes.py
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+from app.config.config import get_database  # noqa: E402
+from app.utils.indexes import ensure_indexes  # noqa: E402
+
+# (name, collection, filter) for every query on a request path
+HOT_QUERIES = [
+    ("register/login lookup", "users", {"$or": [{"email": "a@example.com"}, {"username": "a@example.com"}]}),
+    ("current user", "users", {"username": "alice"}),
+    ("chat history", "chat_sessions", {"session_id": "session-1"}),
+    ("summary check", "chat_sessions", {"session_id": {"$in": ["session-1", "session-2"]}}),
+]
+
+
+def plan_stages(plan):
+    """Yield every stage name in an explain plan tree."""
+    if not isinstance(plan, dict):
+        return
+    if "stage" in plan:
+        yield plan["stage"]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from plan_stages(child)
+
+
+async def check():
+    db = get_database()
+    await ensure_indexes(db)
+
+    failures = 0
+    for name, collection, query in HOT_QUERIES:
+        explain = await db.command({"explain": {"find": collection, "filter": query}, "verbosity": "queryPlanner"})
+        stages = list(plan_stages(explain["queryPlanner"]["winningPlan"]))
+        ok = "COLLSCAN" not in stages
+        failures += not ok
+        print(f"{'ok' if ok else 'FAIL':<5} {name:<24} {collection}: {' <- '.join(stages)}")
+    return failures
+
+
+def main():
+    failures = asyncio.run(check())
+    if failures:
+        print(f"\n{failures} hot queries scan a whole collection")
+        sys.exit(1)
+    print("\nAll hot queries use an index")
+
+
+if __name__ == "__main__":
+    main()
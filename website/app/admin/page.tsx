@@ -322,14 +322,23 @@ export default function AdminPage() {
         throw new Error('No authentication token');
       }
 
-      // Load users
+      // Load users; the endpoint is paginated, so follow next_cursor until the last page
       try {
-        const usersRes = await fetch('http://163.61.183.90:8001/admin/users', {
-          headers: { 'Authorization': `Bearer ${token}` },
-        });
-        if (usersRes.ok) {
+        let usersRes: Response;
+        let usersArray: any[] = [];
+        let cursor: string | null = null;
+        do {
+          const params = new URLSearchParams({ limit: '500' });
+          if (cursor) params.set('cursor', cursor);
+          usersRes = await fetch(`http://163.61.183.90:8001/admin/users?${params}`, {
+            headers: { 'Authorization': `Bearer ${token}` },
+          });
+          if (!usersRes.ok) break;
           const usersData = await usersRes.json();
-          let usersArray = Array.isArray(usersData) ? usersData : usersData.users || [];
+          usersArray = usersArray.concat(Array.isArray(usersData) ? usersData : usersData.users || []);
+          cursor = Array.isArray(usersData) ? null : usersData.next_cursor || null;
+        } while (cursor);
+        if (usersRes.ok) {
           
           // Ensure all users have id field (map from _id, user_id, etc. if needed)
           usersArray = usersArray.map((user: any) => ({